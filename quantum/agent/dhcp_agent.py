@@ -17,6 +17,7 @@
 
 import os
 import socket
+import time
 import uuid
 
 import eventlet
@@ -39,6 +40,7 @@ from quantum.openstack.common import jsonutils
 from quantum.openstack.common import lockutils
 from quantum.openstack.common import log as logging
 from quantum.openstack.common import loopingcall
+from quantum.openstack.common.rpc import common as rpc_common
 from quantum.openstack.common.rpc import proxy
 from quantum.openstack.common import service
 from quantum.openstack.common import uuidutils
@@ -66,6 +68,21 @@ class DhcpAgent(manager.Manager):
                     help=_("Allows for serving metadata requests from a "
                            "dedicate network. Requires "
                            "enable isolated_metadata = True ")),
+        cfg.IntOpt('num_sync_threads', default=4,
+                   help=_("Number of networks configured concurrently when "
+                          "synchronizing the state.")),
+        cfg.IntOpt('sync_networks_chunk_size', default=100,
+                   help=_("Number of networks retrieved in a single call "
+                          "when synchronizing the state.")),
+        cfg.FloatOpt('dhcp_reload_delay', default=0.5,
+                     help=_("Number of seconds during which the port changes "
+                            "of a network are gathered before reloading its "
+                            "DHCP server once. 0 reloads it on each "
+                            "change.")),
+        cfg.IntOpt('dhcp_lease_update_interval', default=0,
+                   help=_("Number of seconds during which the lease updates "
+                          "are gathered before being sent to the server in "
+                          "a single call. 0 sends each update immediately.")),
     ]
 
     def __init__(self, host=None):
@@ -79,6 +96,14 @@ class DhcpAgent(manager.Manager):
         self.plugin_rpc = DhcpPluginApi(topics.PLUGIN, ctx)
         self.device_manager = DeviceManager(self.conf, self.plugin_rpc)
         self.lease_relay = DhcpLeaseRelay(self.update_lease)
+        # (network id, ip address) -> lease expiration time
+        self.pending_leases = {}
+        # Cleared when the server does not know update_lease_expirations
+        self.bulk_lease_updates = True
+        # Cleared when the server does not know get_networks_info
+        self.bulk_networks_info = True
+        # network id -> greenthread reloading its allocations
+        self.pending_reloads = {}
 
         self._populate_networks_cache()
 
@@ -92,7 +117,7 @@ class DhcpAgent(manager.Manager):
             )
 
             for net_id in existing_networks:
-                net = DictModel({"id": net_id, "subnets": [], "ports": []})
+                net = NetModel({"id": net_id, "subnets": [], "ports": []})
                 self.cache.put(net)
         except NotImplementedError:
             # just go ahead with an empty networks cache
@@ -110,6 +135,7 @@ class DhcpAgent(manager.Manager):
         """Activate the DHCP agent."""
         self.sync_state()
         self.periodic_resync()
+        self.periodic_lease_updates()
         self.lease_relay.start()
 
     def _ns_name(self, network):
@@ -134,6 +160,12 @@ class DhcpAgent(manager.Manager):
             LOG.exception(_('Unable to %s dhcp.'), action)
 
     def update_lease(self, network_id, ip_address, time_remaining):
+        if (self.conf.dhcp_lease_update_interval > 0 and
+                self.bulk_lease_updates):
+            # The latest update of a lease replaces the pending one
+            self.pending_leases[(network_id, ip_address)] = (time.time() +
+                                                             time_remaining)
+            return
         try:
             self.plugin_rpc.update_lease_expiration(network_id, ip_address,
                                                     time_remaining)
@@ -141,22 +173,115 @@ class DhcpAgent(manager.Manager):
             self.needs_resync = True
             LOG.exception(_('Unable to update lease'))
 
+    def send_lease_updates(self):
+        """Send the pending lease updates in a single call."""
+        if not self.pending_leases:
+            return
+        pending, self.pending_leases = self.pending_leases, {}
+        now = time.time()
+        leases = {}
+        for (network_id, ip_address), expiration in pending.iteritems():
+            leases.setdefault(network_id, {})[ip_address] = max(
+                int(expiration - now), 0)
+        try:
+            self.plugin_rpc.update_lease_expirations(leases)
+        except rpc_common.RemoteError as e:
+            if e.exc_type not in ('AttributeError', 'UnsupportedRpcVersion'):
+                self.needs_resync = True
+                LOG.exception(_('Unable to update leases'))
+                return
+            LOG.warn(_('The server does not support bulk lease updates, '
+                       'sending each update as it is received.'))
+            self.bulk_lease_updates = False
+            for network_id, ip_leases in leases.iteritems():
+                for ip_address, lease_remaining in ip_leases.iteritems():
+                    self.update_lease(network_id, ip_address,
+                                      lease_remaining)
+        except Exception:
+            self.needs_resync = True
+            LOG.exception(_('Unable to update leases'))
+
+    def periodic_lease_updates(self):
+        """Send the gathered lease updates at the configured interval."""
+        if self.conf.dhcp_lease_update_interval > 0:
+            self.lease_updater = loopingcall.FixedIntervalLoopingCall(
+                self.send_lease_updates)
+            self.lease_updater.start(
+                interval=self.conf.dhcp_lease_update_interval)
+
     def sync_state(self):
         """Sync the local DHCP state with Quantum."""
         LOG.info(_('Synchronizing state'))
         known_networks = set(self.cache.get_network_ids())
+        pool = eventlet.GreenPool(self.conf.num_sync_threads)
 
         try:
             active_networks = set(self.plugin_rpc.get_active_networks())
             for deleted_id in known_networks - active_networks:
-                self.disable_dhcp_helper(deleted_id)
-
-            for network_id in active_networks:
-                self.refresh_dhcp_helper(network_id)
+                pool.spawn_n(self.disable_dhcp_helper, deleted_id)
+
+            # Each chunk is retrieved once the previous one is applied, so
+            # that its info is as recent as possible when applied
+            network_ids = sorted(active_networks)
+            chunk_size = max(self.conf.sync_networks_chunk_size, 1)
+            for i in range(0, len(network_ids), chunk_size):
+                chunk = network_ids[i:i + chunk_size]
+                result = self._get_networks_info(chunk)
+                if result is None:
+                    for network_id in chunk:
+                        pool.spawn_n(self.refresh_dhcp_helper, network_id)
+                    pool.waitall()
+                    continue
+                versions, networks = result
+                if len(networks) < len(chunk):
+                    # Networks deleted in the meantime are handled at the
+                    # next resync
+                    self.needs_resync = True
+                for network in networks:
+                    pool.spawn_n(self._sync_network, network,
+                                 versions[network.id])
+                pool.waitall()
         except Exception:
             self.needs_resync = True
             LOG.exception(_('Unable to sync network state.'))
 
+    def _get_networks_info(self, network_ids):
+        """Retrieve the info of many networks in a single call.
+
+        Returns the cache versions captured before the call along with the
+        networks, or None when the server does not support it.
+        """
+        if not self.bulk_networks_info:
+            return
+        versions = dict((net_id, self.cache.get_version(net_id))
+                        for net_id in network_ids)
+        try:
+            return versions, self.plugin_rpc.get_networks_info(network_ids)
+        except rpc_common.RemoteError as e:
+            if e.exc_type not in ('AttributeError', 'UnsupportedRpcVersion'):
+                raise
+            LOG.warn(_('The server does not support retrieving the info of '
+                       'many networks at once, retrieving them one at a '
+                       'time.'))
+            self.bulk_networks_info = False
+
+    def _sync_network(self, network, version=None):
+        try:
+            if self.cache.get_version(network.id) != version:
+                # An event was applied since the info was retrieved
+                LOG.debug(_('Network %s changed during the sync, retrieving '
+                            'it again.'), network.id)
+                self.refresh_dhcp_helper(network.id)
+                return
+            old_network = self.cache.get_network_by_id(network.id)
+            if old_network:
+                self._refresh_dhcp(old_network, network)
+            else:
+                self._enable_dhcp(network)
+        except Exception:
+            self.needs_resync = True
+            LOG.exception(_('Unable to sync network %s.'), network.id)
+
     def _periodic_resync_helper(self):
         """Resync the dhcp state at the configured interval."""
         while True:
@@ -177,7 +302,9 @@ class DhcpAgent(manager.Manager):
             self.needs_resync = True
             LOG.exception(_('Network %s RPC info call failed.'), network_id)
             return
+        self._enable_dhcp(network)
 
+    def _enable_dhcp(self, network):
         if not network.admin_state_up:
             return
 
@@ -213,7 +340,9 @@ class DhcpAgent(manager.Manager):
             self.needs_resync = True
             LOG.exception(_('Network %s RPC info call failed.'), network_id)
             return
+        self._refresh_dhcp(old_network, network)
 
+    def _refresh_dhcp(self, old_network, network):
         old_cidrs = set(s.cidr for s in old_network.subnets if s.enable_dhcp)
         new_cidrs = set(s.cidr for s in network.subnets if s.enable_dhcp)
 
@@ -266,14 +395,28 @@ class DhcpAgent(manager.Manager):
     @lockutils.synchronized('agent', 'dhcp-')
     def port_update_end(self, context, payload):
         """Handle the port.update.end notification event."""
-        port = DictModel(payload['port'])
+        port = PortModel(payload['port'])
         network = self.cache.get_network_by_id(port.network_id)
         if network:
             self.cache.put_port(port)
-            self.call_driver('reload_allocations', network)
+            self.schedule_reload_allocations(network)
+
+    @lockutils.synchronized('agent', 'dhcp-')
+    def port_create_end(self, context, payload):
+        """Handle the port.create.end notification event.
 
-    # Use the update handler for the port create event.
-    port_create_end = port_update_end
+        Ports created in bulk are notified together for each network and
+        applied with a single reload of the allocations.
+        """
+        if 'ports' in payload:
+            ports = [PortModel(port) for port in payload['ports']]
+        else:
+            ports = [PortModel(payload['port'])]
+        network = self.cache.get_network_by_id(ports[0].network_id)
+        if network:
+            for port in ports:
+                self.cache.put_port(port)
+            self.schedule_reload_allocations(network)
 
     @lockutils.synchronized('agent', 'dhcp-')
     def port_delete_end(self, context, payload):
@@ -282,6 +425,26 @@ class DhcpAgent(manager.Manager):
         if port:
             network = self.cache.get_network_by_id(port.network_id)
             self.cache.remove_port(port)
+            self.schedule_reload_allocations(network)
+
+    def schedule_reload_allocations(self, network):
+        """Reload the allocations of a network after dhcp_reload_delay.
+
+        The changes applied to the cached network in the meantime are
+        reloaded together.
+        """
+        delay = self.conf.dhcp_reload_delay
+        if delay <= 0:
+            self.call_driver('reload_allocations', network)
+        elif network.id not in self.pending_reloads:
+            self.pending_reloads[network.id] = eventlet.spawn_after(
+                delay, self._reload_allocations, network.id)
+
+    @lockutils.synchronized('agent', 'dhcp-')
+    def _reload_allocations(self, network_id):
+        del self.pending_reloads[network_id]
+        network = self.cache.get_network_by_id(network_id)
+        if network:
             self.call_driver('reload_allocations', network)
 
     def enable_isolated_metadata_proxy(self, network):
@@ -341,6 +504,7 @@ class DhcpPluginApi(proxy.RpcProxy):
 
     API version history:
         1.0 - Initial version.
+        1.1 - Added get_networks_info and update_lease_expirations.
 
     """
 
@@ -360,11 +524,20 @@ class DhcpPluginApi(proxy.RpcProxy):
 
     def get_network_info(self, network_id):
         """Make a remote process call to retrieve network info."""
-        return DictModel(self.call(self.context,
-                                   self.make_msg('get_network_info',
-                                                 network_id=network_id,
-                                                 host=self.host),
-                                   topic=self.topic))
+        return NetModel(self.call(self.context,
+                                  self.make_msg('get_network_info',
+                                                network_id=network_id,
+                                                host=self.host),
+                                  topic=self.topic))
+
+    def get_networks_info(self, network_ids):
+        """Make a remote process call to retrieve the info of many networks."""
+        networks = self.call(self.context,
+                             self.make_msg('get_networks_info',
+                                           network_ids=network_ids,
+                                           host=self.host),
+                             topic=self.topic, version='1.1')
+        return [NetModel(network) for network in networks]
 
     def get_dhcp_port(self, network_id, device_id):
         """Make a remote process call to create the dhcp port."""
@@ -404,6 +577,20 @@ class DhcpPluginApi(proxy.RpcProxy):
                                 host=self.host),
                   topic=self.topic)
 
+    def update_lease_expirations(self, leases):
+        """Make a remote process call to update many ip lease expirations.
+
+        This is a call rather than a cast, so that a server which does not
+        support it is detected.
+
+        :param leases: maps network ids to {ip address: lease remaining}
+        """
+        return self.call(self.context,
+                         self.make_msg('update_lease_expirations',
+                                       leases=leases,
+                                       host=self.host),
+                         topic=self.topic, version='1.1')
+
 
 class NetworkCache(object):
     """Agent cache of the current network state."""
@@ -411,6 +598,17 @@ class NetworkCache(object):
         self.cache = {}
         self.subnet_lookup = {}
         self.port_lookup = {}
+        # network id -> number of the last change of the cached network
+        self.versions = {}
+        self.last_version = 0
+
+    def _changed(self, network_id):
+        self.last_version += 1
+        self.versions[network_id] = self.last_version
+
+    def get_version(self, network_id):
+        """Return a number changing whenever the network is changed."""
+        return self.versions.get(network_id)
 
     def get_network_ids(self):
         return self.cache.keys()
@@ -428,16 +626,20 @@ class NetworkCache(object):
         if network.id in self.cache:
             self.remove(self.cache[network.id])
 
+        if not isinstance(network.ports, NetworkPorts):
+            network.ports = NetworkPorts(network.ports)
         self.cache[network.id] = network
+        self._changed(network.id)
 
         for subnet in network.subnets:
             self.subnet_lookup[subnet.id] = network.id
 
-        for port in network.ports:
-            self.port_lookup[port.id] = network.id
+        self.port_lookup.update(dict.fromkeys(network.ports.ids(),
+                                              network.id))
 
     def remove(self, network):
         del self.cache[network.id]
+        self.versions.pop(network.id, None)
 
         for subnet in network.subnets:
             del self.subnet_lookup[subnet.id]
@@ -447,30 +649,21 @@ class NetworkCache(object):
 
     def put_port(self, port):
         network = self.get_network_by_id(port.network_id)
-        for index in range(len(network.ports)):
-            if network.ports[index].id == port.id:
-                network.ports[index] = port
-                break
-        else:
-            network.ports.append(port)
-
+        network.ports.put(port)
         self.port_lookup[port.id] = network.id
+        self._changed(network.id)
 
     def remove_port(self, port):
         network = self.get_network_by_port_id(port.id)
-
-        for index in range(len(network.ports)):
-            if network.ports[index] == port:
-                del network.ports[index]
-                del self.port_lookup[port.id]
-                break
+        if network and network.ports.get(port.id) == port:
+            network.ports.remove(port.id)
+            del self.port_lookup[port.id]
+            self._changed(network.id)
 
     def get_port_by_id(self, port_id):
         network = self.get_network_by_port_id(port_id)
         if network:
-            for port in network.ports:
-                if port.id == port_id:
-                    return port
+            return network.ports.get(port_id)
 
     def get_state(self):
         net_ids = self.get_network_ids()
@@ -533,52 +726,54 @@ class DeviceManager(object):
         else:
             namespace = None
 
-        if ip_lib.device_exists(interface_name,
-                                self.root_helper,
-                                namespace):
-            if not reuse_existing:
-                raise exceptions.PreexistingDeviceFailure(
-                    dev_name=interface_name)
-
-            LOG.debug(_('Reusing existing device: %s.'), interface_name)
-        else:
-            self.driver.plug(network.id,
-                             port.id,
-                             interface_name,
-                             port.mac_address,
-                             namespace=namespace)
-        ip_cidrs = []
-        for fixed_ip in port.fixed_ips:
-            subnet = fixed_ip.subnet
-            net = netaddr.IPNetwork(subnet.cidr)
-            ip_cidr = '%s/%s' % (fixed_ip.ip_address, net.prefixlen)
-            ip_cidrs.append(ip_cidr)
-
-        if (self.conf.enable_isolated_metadata and
-            self.conf.use_namespaces):
-            ip_cidrs.append(METADATA_DEFAULT_IP)
-
-        self.driver.init_l3(interface_name, ip_cidrs,
-                            namespace=namespace)
-
-        # ensure that the dhcp interface is first in the list
-        if namespace is None:
-            device = ip_lib.IPDevice(interface_name,
-                                     self.root_helper)
-            device.route.pullup_route(interface_name)
-
-        if self.conf.enable_metadata_network:
-            meta_cidr = netaddr.IPNetwork(METADATA_DEFAULT_IP)
-            metadata_subnets = [s for s in network.subnets if
-                                netaddr.IPNetwork(s.cidr) in meta_cidr]
-            if metadata_subnets:
-                # Add a gateway so that packets can be routed back to VMs
+        # The ip commands run in the namespace are sent in batches
+        with ip_lib.batch(self.root_helper, namespace):
+            if ip_lib.device_exists(interface_name,
+                                    self.root_helper,
+                                    namespace):
+                if not reuse_existing:
+                    raise exceptions.PreexistingDeviceFailure(
+                        dev_name=interface_name)
+
+                LOG.debug(_('Reusing existing device: %s.'), interface_name)
+            else:
+                self.driver.plug(network.id,
+                                 port.id,
+                                 interface_name,
+                                 port.mac_address,
+                                 namespace=namespace)
+            ip_cidrs = []
+            for fixed_ip in port.fixed_ips:
+                subnet = fixed_ip.subnet
+                net = netaddr.IPNetwork(subnet.cidr)
+                ip_cidr = '%s/%s' % (fixed_ip.ip_address, net.prefixlen)
+                ip_cidrs.append(ip_cidr)
+
+            if (self.conf.enable_isolated_metadata and
+                self.conf.use_namespaces):
+                ip_cidrs.append(METADATA_DEFAULT_IP)
+
+            self.driver.init_l3(interface_name, ip_cidrs,
+                                namespace=namespace)
+
+            # ensure that the dhcp interface is first in the list
+            if namespace is None:
                 device = ip_lib.IPDevice(interface_name,
-                                         self.root_helper,
-                                         namespace)
-                # Only 1 subnet on metadata access network
-                gateway_ip = metadata_subnets[0].gateway_ip
-                device.route.add_gateway(gateway_ip)
+                                         self.root_helper)
+                device.route.pullup_route(interface_name)
+
+            if self.conf.enable_metadata_network:
+                meta_cidr = netaddr.IPNetwork(METADATA_DEFAULT_IP)
+                metadata_subnets = [s for s in network.subnets if
+                                    netaddr.IPNetwork(s.cidr) in meta_cidr]
+                if metadata_subnets:
+                    # Add a gateway so that packets can be routed back to VMs
+                    device = ip_lib.IPDevice(interface_name,
+                                             self.root_helper,
+                                             namespace)
+                    # Only 1 subnet on metadata access network
+                    gateway_ip = metadata_subnets[0].gateway_ip
+                    device.route.add_gateway(gateway_ip)
 
         return interface_name
 
@@ -589,12 +784,48 @@ class DeviceManager(object):
         else:
             namespace = None
 
-        self.driver.unplug(device_name, namespace=namespace)
+        with ip_lib.batch(self.root_helper, namespace):
+            self.driver.unplug(device_name, namespace=namespace)
 
         self.plugin.release_dhcp_port(network.id,
                                       self.get_device_id(network))
 
 
+class NetworkPorts(object):
+    """Ports of a cached network, indexed by id.
+
+    Iterates over the ports like the list it replaces, in id order so that
+    the configuration generated from them is stable.
+    """
+
+    __slots__ = ('_ports',)
+
+    def __init__(self, ports=()):
+        self._ports = dict((port.id, port) for port in ports)
+
+    def __iter__(self):
+        ports = self._ports
+        return iter([ports[port_id] for port_id in sorted(ports)])
+
+    def __len__(self):
+        return len(self._ports)
+
+    def __contains__(self, port):
+        return self._ports.get(getattr(port, 'id', None)) == port
+
+    def ids(self):
+        return self._ports.keys()
+
+    def get(self, port_id):
+        return self._ports.get(port_id)
+
+    def put(self, port):
+        self._ports[port.id] = port
+
+    def remove(self, port_id):
+        del self._ports[port_id]
+
+
 class DictModel(object):
     """Convert dict into an object that provides attribute access to values."""
     def __init__(self, d):
@@ -608,6 +839,60 @@ class DictModel(object):
             setattr(self, key, value)
 
 
+class SlotsModel(object):
+    """Compact DictModel for the records cached in large numbers.
+
+    Only the attributes named in __slots__ are kept, missing ones are None.
+    The dicts listed by the attributes named in ITEM_MODELS are converted to
+    the given model.
+    """
+
+    __slots__ = ()
+    ITEM_MODELS = {}
+
+    def __init__(self, d):
+        for key in self.__slots__:
+            value = d.get(key)
+            if value is not None and key in self.ITEM_MODELS:
+                value = [self.ITEM_MODELS[key](item)
+                         if isinstance(item, dict) else item
+                         for item in value]
+            setattr(self, key, value)
+
+
+class FixedIpModel(SlotsModel):
+    __slots__ = ('subnet_id', 'ip_address')
+
+
+class PortModel(SlotsModel):
+    __slots__ = ('id', 'name', 'tenant_id', 'network_id', 'admin_state_up',
+                 'status', 'mac_address', 'fixed_ips', 'device_id',
+                 'device_owner')
+    ITEM_MODELS = {'fixed_ips': FixedIpModel}
+
+
+class HostRouteModel(SlotsModel):
+    __slots__ = ('destination', 'nexthop')
+
+
+class SubnetModel(SlotsModel):
+    __slots__ = ('id', 'name', 'tenant_id', 'network_id', 'ip_version',
+                 'cidr', 'gateway_ip', 'enable_dhcp', 'dns_nameservers',
+                 'host_routes')
+    ITEM_MODELS = {'host_routes': HostRouteModel}
+
+
+class NetModel(DictModel):
+    """DictModel of a network with compact subnet and port records."""
+    def __init__(self, d):
+        d = dict(d)
+        subnets = d.pop('subnets', [])
+        ports = d.pop('ports', [])
+        super(NetModel, self).__init__(d)
+        self.subnets = [SubnetModel(subnet) for subnet in subnets]
+        self.ports = [PortModel(port) for port in ports]
+
+
 class DhcpLeaseRelay(object):
     """UNIX domain socket server for processing lease updates.
 
@@ -680,7 +965,8 @@ class DhcpAgentWithStateReport(DhcpAgent):
             'configurations': {
                 'dhcp_driver': cfg.CONF.dhcp_driver,
                 'use_namespaces': cfg.CONF.use_namespaces,
-                'dhcp_lease_time': cfg.CONF.dhcp_lease_time},
+                'dhcp_lease_time': cfg.CONF.dhcp_lease_time,
+                constants.DHCP_BULK_PORTS: True},
             'start_flag': True,
             'agent_type': constants.AGENT_TYPE_DHCP}
         report_interval = cfg.CONF.AGENT.report_interval
@@ -84,6 +84,15 @@ class FirewallDriver(object):
         """Stop filtering port."""
         raise NotImplementedError()
 
+    def update_security_group_members(self, sg_id, sg_members):
+        """Update the member ips of a remote security group.
+
+        sg_members maps each ethertype to the list of member ips. Only
+        drivers matching remote groups by membership, rather than with the
+        ip prefixes expanded by the server, need to implement this.
+        """
+        pass
+
     def filter_defer_apply_on(self):
         """Defer application of filtering rule."""
         pass
@@ -92,8 +92,10 @@ class RouterInfo(object):
     def __init__(self, router_id, root_helper, use_namespaces, router):
         self.router_id = router_id
         self.ex_gw_port = None
-        self.internal_ports = []
-        self.floating_ips = []
+        # port id -> internal port
+        self.internal_ports = {}
+        # floating IP id -> floating IP
+        self.floating_ips = {}
         self.root_helper = root_helper
         self.use_namespaces = use_namespaces
         self.router = router
@@ -103,6 +105,8 @@ class RouterInfo(object):
             namespace=self.ns_name())
 
         self.routes = []
+        # revision of the router data last processed, if sent by the server
+        self.revision = None
 
     def ns_name(self):
         if self.use_namespaces:
@@ -139,6 +143,10 @@ class L3NATAgent(manager.Manager):
         cfg.StrOpt('gateway_external_network_id', default='',
                    help=_("UUID of external network for routers implemented "
                           "by the agents.")),
+        cfg.IntOpt('router_processing_workers', default=8,
+                   help=_("Number of routers configured concurrently. Each "
+                          "router is still configured by one green thread "
+                          "at a time.")),
     ]
 
     def __init__(self, host, conf=None):
@@ -163,6 +171,13 @@ class L3NATAgent(manager.Manager):
         self.plugin_rpc = L3PluginApi(topics.PLUGIN, host)
         self.fullsync = True
         self.sync_sem = semaphore.Semaphore(1)
+        # router id -> semaphore serializing the processing of the router
+        self.router_locks = {}
+        # router id -> sequence number of the last notification about it
+        self.router_update_seq = {}
+        # sequence numbers of the notifications and syncs being processed
+        self.seqs_in_progress = set()
+        self.last_seq = 0
         if self.conf.use_namespaces:
             self._destroy_router_namespaces(self.conf.router_id)
         super(L3NATAgent, self).__init__(host=self.conf.host)
@@ -287,86 +302,95 @@ class L3NATAgent(manager.Manager):
         port['ip_cidr'] = "%s/%s" % (ips[0]['ip_address'], prefixlen)
 
     def process_router(self, ri):
-
-        ex_gw_port = self._get_ex_gw_port(ri)
-        internal_ports = ri.router.get(l3_constants.INTERFACE_KEY, [])
-        existing_port_ids = set([p['id'] for p in ri.internal_ports])
-        current_port_ids = set([p['id'] for p in internal_ports
-                                if p['admin_state_up']])
-        new_ports = [p for p in internal_ports if
-                     p['id'] in current_port_ids and
-                     p['id'] not in existing_port_ids]
-        old_ports = [p for p in ri.internal_ports if
-                     p['id'] not in current_port_ids]
-
-        for p in new_ports:
-            self._set_subnet_info(p)
-            ri.internal_ports.append(p)
-            self.internal_network_added(ri, ex_gw_port,
-                                        p['network_id'], p['id'],
-                                        p['ip_cidr'], p['mac_address'])
-
-        for p in old_ports:
-            ri.internal_ports.remove(p)
-            self.internal_network_removed(ri, ex_gw_port, p['id'],
-                                          p['ip_cidr'])
-
-        internal_cidrs = [p['ip_cidr'] for p in ri.internal_ports]
-
-        if ex_gw_port and not ri.ex_gw_port:
-            self._set_subnet_info(ex_gw_port)
-            self.external_gateway_added(ri, ex_gw_port, internal_cidrs)
-        elif not ex_gw_port and ri.ex_gw_port:
-            self.external_gateway_removed(ri, ri.ex_gw_port,
-                                          internal_cidrs)
-
-        if ri.ex_gw_port or ex_gw_port:
-            self.process_router_floating_ips(ri, ex_gw_port)
-
-        ri.ex_gw_port = ex_gw_port
-
-        self.routes_updated(ri)
+        # The ip commands run in the router namespace are sent in batches
+        with ip_lib.batch(self.root_helper, ri.ns_name()):
+            ex_gw_port = self._get_ex_gw_port(ri)
+            internal_ports = ri.router.get(l3_constants.INTERFACE_KEY, [])
+            current_port_ids = set(p['id'] for p in internal_ports
+                                   if p['admin_state_up'])
+            new_ports = [p for p in internal_ports if
+                         p['id'] in current_port_ids and
+                         p['id'] not in ri.internal_ports]
+            old_port_ids = set(ri.internal_ports) - current_port_ids
+
+            for p in new_ports:
+                self._set_subnet_info(p)
+                ri.internal_ports[p['id']] = p
+                self.internal_network_added(ri, ex_gw_port,
+                                            p['network_id'], p['id'],
+                                            p['ip_cidr'], p['mac_address'])
+
+            for port_id in old_port_ids:
+                p = ri.internal_ports.pop(port_id)
+                self.internal_network_removed(ri, ex_gw_port, p['id'],
+                                              p['ip_cidr'])
+
+            internal_cidrs = [p['ip_cidr'] for p in ri.internal_ports.values()]
+
+            if ex_gw_port and not ri.ex_gw_port:
+                self._set_subnet_info(ex_gw_port)
+                self.external_gateway_added(ri, ex_gw_port, internal_cidrs)
+            elif not ex_gw_port and ri.ex_gw_port:
+                self.external_gateway_removed(ri, ri.ex_gw_port,
+                                              internal_cidrs)
+
+            if ri.ex_gw_port or ex_gw_port:
+                self.process_router_floating_ips(ri, ex_gw_port)
+
+            ri.ex_gw_port = ex_gw_port
+
+            self.routes_updated(ri)
 
     def process_router_floating_ips(self, ri, ex_gw_port):
-        floating_ips = ri.router.get(l3_constants.FLOATINGIP_KEY, [])
-        existing_floating_ip_ids = set([fip['id'] for fip in ri.floating_ips])
-        cur_floating_ip_ids = set([fip['id'] for fip in floating_ips])
-
-        id_to_fip_map = {}
-
-        for fip in floating_ips:
-            if fip['port_id']:
-                if fip['id'] not in existing_floating_ip_ids:
-                    ri.floating_ips.append(fip)
-                    self.floating_ip_added(ri, ex_gw_port,
-                                           fip['floating_ip_address'],
-                                           fip['fixed_ip_address'])
-
-                # store to see if floatingip was remapped
-                id_to_fip_map[fip['id']] = fip
-
-        floating_ip_ids_to_remove = (existing_floating_ip_ids -
-                                     cur_floating_ip_ids)
-        for fip in ri.floating_ips:
-            if fip['id'] in floating_ip_ids_to_remove:
-                ri.floating_ips.remove(fip)
+        delta = ri.router.get(l3_constants.FLOATINGIP_DELTA_KEY)
+        if (delta is not None and ex_gw_port and ri.ex_gw_port and
+                ex_gw_port['id'] == ri.ex_gw_port['id']):
+            # Only the floating IPs changed since the last revision
+            updated = delta['updated']
+            removed_ids = delta['removed']
+        else:
+            updated = ri.router.get(l3_constants.FLOATINGIP_KEY, [])
+            current_ids = set(fip['id'] for fip in updated
+                              if fip['port_id'])
+            removed_ids = set(ri.floating_ips) - current_ids
+
+        removed = [ri.floating_ips.pop(fip_id) for fip_id in removed_ids
+                   if fip_id in ri.floating_ips]
+        added = []
+        remapped = []
+        for new_fip in updated:
+            if not new_fip['port_id']:
+                continue
+            fip = ri.floating_ips.get(new_fip['id'])
+            if not fip:
+                added.append(new_fip)
+            elif (new_fip['fixed_ip_address'] and fip['fixed_ip_address'] and
+                  new_fip['fixed_ip_address'] != fip['fixed_ip_address']):
+                remapped.append((fip, new_fip))
+            ri.floating_ips[new_fip['id']] = new_fip
+        if not (removed or added or remapped):
+            return
+
+        # The rules of all the changed floating IPs are applied at once
+        ri.iptables_manager.defer_apply_on()
+        try:
+            for fip in removed:
                 self.floating_ip_removed(ri, ri.ex_gw_port,
                                          fip['floating_ip_address'],
                                          fip['fixed_ip_address'])
-            else:
-                # handle remapping of a floating IP
-                new_fip = id_to_fip_map[fip['id']]
-                new_fixed_ip = new_fip['fixed_ip_address']
-                existing_fixed_ip = fip['fixed_ip_address']
-                if (new_fixed_ip and existing_fixed_ip and
-                        new_fixed_ip != existing_fixed_ip):
-                    floating_ip = fip['floating_ip_address']
-                    self.floating_ip_removed(ri, ri.ex_gw_port,
-                                             floating_ip, existing_fixed_ip)
-                    self.floating_ip_added(ri, ri.ex_gw_port,
-                                           floating_ip, new_fixed_ip)
-                    ri.floating_ips.remove(fip)
-                    ri.floating_ips.append(new_fip)
+            for fip, new_fip in remapped:
+                floating_ip = fip['floating_ip_address']
+                self.floating_ip_removed(ri, ri.ex_gw_port, floating_ip,
+                                         fip['fixed_ip_address'])
+                self.floating_ip_added(ri, ri.ex_gw_port, floating_ip,
+                                       new_fip['fixed_ip_address'])
+            if added:
+                self._floating_ips_added(
+                    ri, ex_gw_port,
+                    [(fip['floating_ip_address'], fip['fixed_ip_address'])
+                     for fip in added])
+        finally:
+            ri.iptables_manager.defer_apply_off()
 
     def _get_ex_gw_port(self, ri):
         return ri.router.get('gw_port')
@@ -513,20 +537,34 @@ class L3NATAgent(manager.Manager):
         return rules
 
     def floating_ip_added(self, ri, ex_gw_port, floating_ip, fixed_ip):
-        ip_cidr = str(floating_ip) + '/32'
+        self._floating_ips_added(ri, ex_gw_port, [(floating_ip, fixed_ip)])
+        ri.iptables_manager.apply()
+
+    def _floating_ips_added(self, ri, ex_gw_port, floating_ips):
+        """Configure a list of (floating IP, fixed IP) on the gateway."""
         interface_name = self.get_external_device_name(ex_gw_port['id'])
         device = ip_lib.IPDevice(interface_name, self.root_helper,
                                  namespace=ri.ns_name())
 
-        if ip_cidr not in [addr['cidr'] for addr in device.addr.list()]:
-            net = netaddr.IPNetwork(ip_cidr)
-            device.addr.add(net.version, ip_cidr, str(net.broadcast))
+        ip_cidrs = set(addr['cidr'] for addr in device.addr.list())
+        added_ips = []
+        for floating_ip, fixed_ip in floating_ips:
+            ip_cidr = str(floating_ip) + '/32'
+            if ip_cidr not in ip_cidrs:
+                net = netaddr.IPNetwork(ip_cidr)
+                device.addr.add(net.version, ip_cidr, str(net.broadcast))
+                ip_cidrs.add(ip_cidr)
+                added_ips.append(floating_ip)
+
+            for chain, rule in self.floating_forward_rules(floating_ip,
+                                                           fixed_ip):
+                ri.iptables_manager.ipv4['nat'].add_rule(chain, rule)
+
+        # The addresses must be configured before they are announced
+        ip_lib.flush_batch(ri.ns_name())
+        for floating_ip in added_ips:
             self._send_gratuitous_arp_packet(ri, interface_name, floating_ip)
 
-        for chain, rule in self.floating_forward_rules(floating_ip, fixed_ip):
-            ri.iptables_manager.ipv4['nat'].add_rule(chain, rule)
-        ri.iptables_manager.apply()
-
     def floating_ip_removed(self, ri, ex_gw_port, floating_ip, fixed_ip):
         ip_cidr = str(floating_ip) + '/32'
         net = netaddr.IPNetwork(ip_cidr)
@@ -548,10 +586,44 @@ class L3NATAgent(manager.Manager):
                 ('float-snat', '-s %s -j SNAT --to %s' %
                  (fixed_ip, floating_ip))]
 
+    def _next_seq(self):
+        self.last_seq += 1
+        return self.last_seq
+
+    def _router_lock(self, router_id):
+        return self.router_locks.setdefault(router_id,
+                                            semaphore.Semaphore(1))
+
+    def _updated_since(self, router_id, seq):
+        """Whether a notification about the router came after seq."""
+        return (seq is not None and
+                self.router_update_seq.get(router_id, 0) > seq)
+
+    def _forget_removed_routers(self):
+        """Drop the locks and sequence numbers of the removed routers.
+
+        The sequence number of a removed router is kept while older work is
+        in progress, so that this work does not configure the router again.
+        """
+        oldest = self.seqs_in_progress and min(self.seqs_in_progress)
+        for router_id, seq in self.router_update_seq.items():
+            if router_id not in self.router_info and not (oldest and
+                                                          oldest < seq):
+                del self.router_update_seq[router_id]
+        for router_id, lock in self.router_locks.items():
+            # The lock is neither held nor waited for
+            if router_id not in self.router_info and lock.balance == 1:
+                del self.router_locks[router_id]
+
     def router_deleted(self, context, router_id):
         """Deal with router deletion RPC message."""
-        with self.sync_sem:
-            if router_id in self.router_info:
+        seq = self._next_seq()
+        self.router_update_seq[router_id] = seq
+        with self._router_lock(router_id):
+            # Unless a newer notification about the router was processed
+            # while waiting for the lock
+            if (router_id in self.router_info and
+                    not self._updated_since(router_id, seq)):
                 try:
                     self._router_removed(router_id)
                 except Exception:
@@ -559,18 +631,28 @@ class L3NATAgent(manager.Manager):
                             "'%s' deletion RPC message")
                     LOG.debug(msg, router_id)
                     self.fullsync = True
+        self._forget_removed_routers()
 
     def routers_updated(self, context, routers):
         """Deal with routers modification and creation RPC message."""
         if not routers:
             return
-        with self.sync_sem:
-            try:
-                self._process_routers(routers)
-            except Exception:
-                msg = _("Failed dealing with routers update RPC message")
-                LOG.debug(msg)
-                self.fullsync = True
+        # Notified routers are processed at once, not after a full sync in
+        # progress, which then skips them as its data is older. Likewise an
+        # older notification is skipped once a newer one is received.
+        seq = self._next_seq()
+        for router in routers:
+            self.router_update_seq[router['id']] = seq
+        self.seqs_in_progress.add(seq)
+        try:
+            self._process_routers(routers, seq=seq)
+        except Exception:
+            msg = _("Failed dealing with routers update RPC message")
+            LOG.debug(msg)
+            self.fullsync = True
+        finally:
+            self.seqs_in_progress.discard(seq)
+            self._forget_removed_routers()
 
     def router_removed_from_agent(self, context, payload):
         self.router_deleted(context, payload['router_id'])
@@ -578,7 +660,7 @@ class L3NATAgent(manager.Manager):
     def router_added_to_agent(self, context, payload):
         self.routers_updated(context, payload)
 
-    def _process_routers(self, routers, all_routers=False):
+    def _process_routers(self, routers, all_routers=False, seq=None):
         if (self.conf.external_network_bridge and
             not ip_lib.device_exists(self.conf.external_network_bridge)):
             LOG.error(_("The external network bridge '%s' does not exist"),
@@ -597,6 +679,8 @@ class L3NATAgent(manager.Manager):
             prev_router_ids = set(self.router_info) & set(
                 [router['id'] for router in routers])
         cur_router_ids = set()
+        pool = eventlet.GreenPool(self.conf.router_processing_workers)
+        threads = []
         for r in routers:
             if not r['admin_state_up']:
                 continue
@@ -614,20 +698,90 @@ class L3NATAgent(manager.Manager):
             if ex_net_id and ex_net_id != target_ex_net_id:
                 continue
             cur_router_ids.add(r['id'])
-            if r['id'] not in self.router_info:
-                self._router_added(r['id'], r)
-            ri = self.router_info[r['id']]
-            ri.router = r
-            self.process_router(ri)
+            threads.append((r['id'], pool.spawn(self._process_router_update,
+                                                r, seq)))
+        failed = 0
+        for router_id, thread in threads:
+            try:
+                thread.wait()
+            except Exception:
+                LOG.exception(_("Failed processing router %s"), router_id)
+                failed += 1
+        if failed:
+            raise Exception(_("Failed processing %d router(s)") % failed)
         # identify and remove routers that no longer exist
         for router_id in prev_router_ids - cur_router_ids:
-            self._router_removed(router_id)
+            with self._router_lock(router_id):
+                if (router_id in self.router_info and
+                    not self._updated_since(router_id, seq)):
+                    self._router_removed(router_id)
+
+    def _process_router_update(self, router, seq=None):
+        with self._router_lock(router['id']):
+            if self._updated_since(router['id'], seq):
+                LOG.debug(_("Router %s was notified again in the meantime"),
+                          router['id'])
+                return
+            router = self._check_router_revision(router)
+            if not router:
+                return
+            if router['id'] not in self.router_info:
+                self._router_added(router['id'], router)
+            ri = self.router_info[router['id']]
+            ri.router = router
+            try:
+                self.process_router(ri)
+            finally:
+                router.pop(l3_constants.FLOATINGIP_DELTA_KEY, None)
+            ri.revision = router.get(l3_constants.REVISION_KEY)
+
+    def _check_router_revision(self, router):
+        """Return the router data to process, None if it is outdated.
+
+        A router sent with only its changed floating IPs is completed with
+        the floating IPs of the previous revision, or fetched again when the
+        agent did not process that revision.
+        """
+        revision = router.get(l3_constants.REVISION_KEY)
+        ri = self.router_info.get(router['id'])
+        known = ri and ri.revision
+        same_epoch = (revision and known and
+                      revision['epoch'] == known['epoch'])
+        if same_epoch and revision['revision'] < known['revision']:
+            LOG.debug(_("Ignoring revision %(revision)s of router "
+                        "%(router_id)s, revision %(known)s is processed"),
+                      {'revision': revision['revision'],
+                       'router_id': router['id'],
+                       'known': known['revision']})
+            return
+        delta = router.get(l3_constants.FLOATINGIP_DELTA_KEY)
+        if delta is None:
+            return router
+        if not (same_epoch and
+                delta['base_revision'] == known['revision']):
+            LOG.debug(_("Fetching router %s, a revision was missed"),
+                      router['id'])
+            routers = self.plugin_rpc.get_routers(self.context,
+                                                  router_id=router['id'])
+            return routers[0] if routers else None
+        floating_ips = dict(
+            (fip['id'], fip)
+            for fip in ri.router.get(l3_constants.FLOATINGIP_KEY, []))
+        for fip_id in delta['removed']:
+            floating_ips.pop(fip_id, None)
+        for fip in delta['updated']:
+            floating_ips[fip['id']] = fip
+        router[l3_constants.FLOATINGIP_KEY] = floating_ips.values()
+        return router
 
     @periodic_task.periodic_task
     def _sync_routers_task(self, context):
-        # we need to sync with router deletion RPC message
+        # only one full sync at a time, notifications are processed while it
+        # is running and take precedence over its older data
         with self.sync_sem:
             if self.fullsync:
+                sync_seq = self._next_seq()
+                self.seqs_in_progress.add(sync_seq)
                 try:
                     if not self.conf.use_namespaces:
                         router_id = self.conf.router_id
@@ -635,11 +789,15 @@ class L3NATAgent(manager.Manager):
                         router_id = None
                     routers = self.plugin_rpc.get_routers(
                         context, router_id)
-                    self._process_routers(routers, all_routers=True)
+                    self._process_routers(routers, all_routers=True,
+                                          seq=sync_seq)
                     self.fullsync = False
                 except Exception:
                     LOG.exception(_("Failed synchronizing routers"))
                     self.fullsync = True
+                finally:
+                    self.seqs_in_progress.discard(sync_seq)
+                    self._forget_removed_routers()
 
     def after_start(self):
         LOG.info(_("L3 agent started"))
@@ -299,8 +299,16 @@ class Dnsmasq(DhcpLocalProcess):
                         'turned off DHCP: %s'), self.network.id)
             return
 
-        self._output_hosts_file()
-        self._output_opts_file()
+        # dnsmasq re-reads the files entirely on SIGHUP, spare it when the
+        # notified changes do not affect them
+        hosts_changed = self._update_conf_file('host',
+                                               self._hosts_file_data())
+        opts_changed = self._update_conf_file('opts', self._opts_file_data())
+        if not (hosts_changed or opts_changed):
+            LOG.debug(_('Allocations unchanged for network: %s'),
+                      self.network.id)
+            return
+
         if self.active:
             cmd = ['kill', '-HUP', self.pid]
             utils.execute(cmd, self.root_helper)
@@ -308,8 +316,28 @@ class Dnsmasq(DhcpLocalProcess):
             LOG.debug(_('Pid %d is stale, relaunching dnsmasq'), self.pid)
         LOG.debug(_('Reloading allocations for network: %s'), self.network.id)
 
+    def _update_conf_file(self, kind, data):
+        """Write data to a config file unless it already holds it.
+
+        :returns: True if the file was written.
+        """
+        name = self.get_conf_file_name(kind)
+        try:
+            with open(name, 'r') as f:
+                if f.read() == data:
+                    return False
+        except IOError:
+            pass
+        utils.replace_file(name, data)
+        return True
+
     def _output_hosts_file(self):
         """Writes a dnsmasq compatible hosts file."""
+        name = self.get_conf_file_name('host')
+        utils.replace_file(name, self._hosts_file_data())
+        return name
+
+    def _hosts_file_data(self):
         r = re.compile('[:.]')
         buf = StringIO.StringIO()
 
@@ -319,14 +347,15 @@ class Dnsmasq(DhcpLocalProcess):
                                   self.conf.dhcp_domain)
                 buf.write('%s,%s,%s\n' %
                           (port.mac_address, name, alloc.ip_address))
-
-        name = self.get_conf_file_name('host')
-        utils.replace_file(name, buf.getvalue())
-        return name
+        return buf.getvalue()
 
     def _output_opts_file(self):
         """Write a dnsmasq compatible options file."""
+        name = self.get_conf_file_name('opts')
+        utils.replace_file(name, self._opts_file_data())
+        return name
 
+    def _opts_file_data(self):
         if self.conf.enable_isolated_metadata:
             subnet_to_interface_ip = self._make_subnet_interface_ip_map()
 
@@ -366,9 +395,7 @@ class Dnsmasq(DhcpLocalProcess):
                 else:
                     options.append(self._format_option(i, 'router'))
 
-        name = self.get_conf_file_name('opts')
-        utils.replace_file(name, '\n'.join(options))
-        return name
+        return '\n'.join(options)
 
     def _make_subnet_interface_ip_map(self):
         ip_dev = ip_lib.IPDevice(
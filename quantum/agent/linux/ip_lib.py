@@ -14,14 +14,33 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+import itertools
+import re
+
+from eventlet import greenthread
 import netaddr
 
 from quantum.agent.linux import utils
 from quantum.common import exceptions
+from quantum.openstack.common import log as logging
+
 
+LOG = logging.getLogger(__name__)
 
 LOOPBACK_DEVNAME = 'lo'
 
+# Actions of the commands which can be deferred to an 'ip -batch' call
+DEFERRABLE_ACTIONS = ('add', 'append', 'del', 'delete', 'flush', 'replace',
+                      'set')
+
+# (namespace, greenthread) -> IpBatch of the commands deferred in it by the
+# greenthread, see batch()
+_BATCHES = {}
+
+# Error printed by 'ip -batch' for the line it stopped at
+BATCH_FAILURE_RE = re.compile(r'Command failed -:(\d+)')
+
 
 class SubProcessBase(object):
     def __init__(self, root_helper=None, namespace=None):
@@ -40,6 +59,11 @@ class SubProcessBase(object):
 
         namespace = self.namespace if not use_root_namespace else None
 
+        ip_batch = _get_batch(namespace) if namespace else None
+        if ip_batch and _is_deferrable(args):
+            ip_batch.add(options, command, args)
+            return ''
+
         return self._execute(options,
                              command,
                              args,
@@ -48,14 +72,115 @@ class SubProcessBase(object):
 
     @classmethod
     def _execute(cls, options, command, args, root_helper=None,
-                 namespace=None):
+                 namespace=None, process_input=None):
         opt_list = ['-%s' % o for o in options]
         if namespace:
+            flush_batch(namespace)
             ip_cmd = ['ip', 'netns', 'exec', namespace, 'ip']
         else:
             ip_cmd = ['ip']
+        kwargs = {'root_helper': root_helper}
+        if process_input is not None:
+            kwargs['process_input'] = process_input
         return utils.execute(ip_cmd + opt_list + [command] + list(args),
-                             root_helper=root_helper)
+                             **kwargs)
+
+
+def _is_deferrable(args):
+    # Moving a device to another namespace must not be delayed behind the
+    # commands run directly in that namespace
+    return bool(args) and args[0] in DEFERRABLE_ACTIONS and 'netns' not in args
+
+
+def _get_batch(namespace):
+    return _BATCHES.get((namespace, greenthread.getcurrent()))
+
+
+def flush_batch(namespace):
+    """Run the ip commands deferred in namespace by this greenthread now."""
+    ip_batch = _get_batch(namespace)
+    if ip_batch:
+        ip_batch.flush()
+
+
+class IpBatch(object):
+    """ip commands run as root in a namespace, deferred to 'ip -batch'.
+
+    Consecutive commands with the same options are read by a single
+    'ip -batch -' call from stdin, in the order they were added.
+    """
+
+    def __init__(self, root_helper, namespace):
+        self.root_helper = root_helper
+        self.namespace = namespace
+        # (options, command line)
+        self.commands = []
+
+    def add(self, options, command, args):
+        line = ' '.join(str(arg) for arg in [command] + list(args))
+        self.commands.append((tuple(options), line))
+
+    def discard(self):
+        self.commands = []
+
+    def flush(self):
+        """Run the deferred commands.
+
+        'ip -batch' stops at the first command which fails, the error
+        raised names it and tells how many commands were not run.
+        """
+        commands, self.commands = self.commands, []
+        done = 0
+        for options, group in itertools.groupby(commands, lambda cmd: cmd[0]):
+            lines = [cmd[1] for cmd in group]
+            LOG.debug(_("Running %(count)d deferred ip command(s) in "
+                        "namespace %(namespace)s"),
+                      {'count': len(lines), 'namespace': self.namespace})
+            try:
+                SubProcessBase._execute(options, '-batch', ['-'],
+                                        self.root_helper, self.namespace,
+                                        process_input='\n'.join(lines + ['']))
+            except RuntimeError as e:
+                match = BATCH_FAILURE_RE.search(str(e))
+                failed = match and int(match.group(1)) - 1 or 0
+                if not 0 <= failed < len(lines):
+                    failed = 0
+                command = ['ip'] + ['-%s' % o for o in options]
+                msg = _("Deferred command '%(command)s' failed in namespace "
+                        "%(namespace)s, %(skipped)d deferred command(s) "
+                        "were not run: %(error)s") % {
+                            'command': ' '.join(command + [lines[failed]]),
+                            'namespace': self.namespace,
+                            'skipped': len(commands) - done - failed - 1,
+                            'error': e}
+                raise RuntimeError(msg)
+            done += len(lines)
+
+
+@contextlib.contextmanager
+def batch(root_helper, namespace):
+    """Defer the ip commands changing namespace to 'ip -batch' calls.
+
+    Reading the state of the namespace or running another program in it
+    runs the deferred commands first, the remaining ones are run on exit
+    unless the body raised. Nothing is deferred without a namespace, or in
+    an enclosing batch. Only the commands of the calling greenthread are
+    deferred, the other greenthreads run theirs directly.
+    """
+    key = (namespace, greenthread.getcurrent())
+    if not namespace or key in _BATCHES:
+        yield
+        return
+    ip_batch = _BATCHES[key] = IpBatch(root_helper, namespace)
+    try:
+        yield
+    except Exception:
+        # The commands of a failed body are not run
+        ip_batch.discard()
+        raise
+    finally:
+        del _BATCHES[key]
+    ip_batch.flush()
 
 
 class IPWrapper(SubProcessBase):
@@ -398,6 +523,7 @@ class IpNetnsCommand(IpCommandBase):
         return IPWrapper(self._parent.root_helper, name)
 
     def delete(self, name):
+        flush_batch(name)
         self._as_root('delete', name, use_root_namespace=True)
 
     def execute(self, cmds, addl_env={}, check_exit_code=True):
@@ -406,6 +532,7 @@ class IpNetnsCommand(IpCommandBase):
         elif not self._parent.namespace:
             raise Exception(_('No namespace defined for parent'))
         else:
+            flush_batch(self._parent.namespace)
             return utils.execute(
                 ['%s=%s' % pair for pair in addl_env.items()] +
                 ['ip', 'netns', 'exec', self._parent.namespace] + list(cmds),
@@ -0,0 +1,89 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Manage the ipsets holding the member IPs of remote security groups."""
+
+from quantum.agent.linux import utils
+from quantum.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+# Maximum length of an ipset name, including the ethertype prefix
+MAX_SET_NAME_LENGTH = 31
+
+SET_FAMILY = {'IPv4': 'inet',
+              'IPv6': 'inet6'}
+
+
+def get_set_name(security_group_id, ethertype):
+    """Return the name of the ipset of a security group and ethertype."""
+    return ('%s%s' % (ethertype, security_group_id))[:MAX_SET_NAME_LENGTH]
+
+
+class IpsetManager(object):
+    """Keep one hash:ip set per remote security group and ethertype.
+
+    The members last written to each set are remembered, so that a member
+    update only adds and deletes the IPs which changed, in a single
+    'ipset restore' call.
+    """
+
+    def __init__(self, execute=None, root_helper=None, namespace=None):
+        self.execute = execute or utils.execute
+        self.root_helper = root_helper
+        self.namespace = namespace
+        # set name -> set of member IPs
+        self.ipsets = {}
+
+    def set_exists(self, set_name):
+        return set_name in self.ipsets
+
+    def set_members(self, set_name, ethertype, member_ips):
+        """Create the set if needed and make member_ips its content."""
+        member_ips = set(member_ips)
+        lines = []
+        if set_name not in self.ipsets:
+            # The set may be left over by a previous run of the agent
+            lines.append('create %s hash:ip family %s' %
+                         (set_name, SET_FAMILY[ethertype]))
+            lines.append('flush %s' % set_name)
+            current = set()
+        else:
+            current = self.ipsets[set_name]
+        lines.extend('add %s %s' % (set_name, ip)
+                     for ip in sorted(member_ips - current))
+        lines.extend('del %s %s' % (set_name, ip)
+                     for ip in sorted(current - member_ips))
+        if lines:
+            LOG.debug(_("Updating ipset %(set_name)s: %(changes)d "
+                        "change(s)"),
+                      {'set_name': set_name, 'changes': len(lines)})
+            self._apply(['ipset', 'restore', '-exist'],
+                        process_input='\n'.join(lines + ['']))
+        self.ipsets[set_name] = member_ips
+
+    def destroy_set(self, set_name):
+        """Destroy a set no longer referenced by any iptables rule."""
+        self._apply(['ipset', 'destroy', set_name])
+        self.ipsets.pop(set_name, None)
+
+    def _apply(self, args, process_input=None):
+        if self.namespace:
+            args = ['ip', 'netns', 'exec', self.namespace] + args
+        return self.execute(args, process_input=process_input,
+                            root_helper=self.root_helper)
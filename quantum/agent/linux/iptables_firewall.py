@@ -19,6 +19,7 @@ import netaddr
 from oslo.config import cfg
 
 from quantum.agent import firewall
+from quantum.agent.linux import ipset_manager
 from quantum.agent.linux import iptables_manager
 from quantum.common import constants
 from quantum.openstack.common import log as logging
@@ -31,6 +32,11 @@ EGRESS_DIRECTION = 'egress'
 CHAIN_NAME_PREFIX = {INGRESS_DIRECTION: 'i',
                      EGRESS_DIRECTION: 'o'}
 LINUX_DEV_LEN = 14
+IPSET_DIRECTION = {INGRESS_DIRECTION: 'src',
+                   EGRESS_DIRECTION: 'dst'}
+
+cfg.CONF.import_opt('enable_ipset', 'quantum.agent.securitygroups_rpc',
+                    group='SECURITYGROUP')
 
 
 class IptablesFirewallDriver(firewall.FirewallDriver):
@@ -42,21 +48,39 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         self.iptables = iptables_manager.IptablesManager(
             root_helper=cfg.CONF.AGENT.root_helper,
             use_ipv6=True)
+        self.ipset = None
+        if cfg.CONF.SECURITYGROUP.enable_ipset:
+            self.ipset = ipset_manager.IpsetManager(
+                root_helper=cfg.CONF.AGENT.root_helper)
         # list of port which has security group
         self.filtered_ports = {}
+        # security group id -> {ethertype: member ips}
+        self.sg_members = {}
+        # ipsets referenced by the current rules
+        self.ipsets_in_use = set()
         self._add_fallback_chain_v4v6()
 
     @property
     def ports(self):
         return self.filtered_ports
 
+    def update_security_group_members(self, sg_id, sg_members):
+        LOG.debug(_("Updating security group (%s) members"), sg_id)
+        self.sg_members[sg_id] = sg_members
+        if not self.ipset:
+            return
+        for ethertype, member_ips in sg_members.iteritems():
+            set_name = ipset_manager.get_set_name(sg_id, ethertype)
+            if self.ipset.set_exists(set_name):
+                self.ipset.set_members(set_name, ethertype, member_ips)
+
     def prepare_port_filter(self, port):
         LOG.debug(_("Preparing device (%s) filter"), port['device'])
         self._remove_chains()
         self.filtered_ports[port['device']] = port
         # each security group has it own chains
         self._setup_chains()
-        self.iptables.apply()
+        self._apply()
 
     def update_port_filter(self, port):
         LOG.debug(_("Updating device (%s) filter"), port['device'])
@@ -67,7 +91,7 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         self._remove_chains()
         self.filtered_ports[port['device']] = port
         self._setup_chains()
-        self.iptables.apply()
+        self._apply()
 
     def remove_port_filter(self, port):
         LOG.debug(_("Removing device (%s) filter"), port['device'])
@@ -78,10 +102,23 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         self._remove_chains()
         self.filtered_ports.pop(port['device'], None)
         self._setup_chains()
+        self._apply()
+
+    def _apply(self):
         self.iptables.apply()
+        if not self.iptables.iptables_apply_deferred:
+            self._remove_unused_ipsets()
+
+    def _remove_unused_ipsets(self):
+        """Destroy the ipsets no rule references after an apply."""
+        if not self.ipset:
+            return
+        for set_name in set(self.ipset.ipsets) - self.ipsets_in_use:
+            self.ipset.destroy_set(set_name)
 
     def _setup_chains(self):
         """Setup ingress and egress chain for a port."""
+        self.ipsets_in_use = set()
         self._add_chain_by_name_v4v6(SG_CHAIN)
         for port in self.filtered_ports.values():
             self._setup_chain(port, INGRESS_DIRECTION)
@@ -234,6 +271,7 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
                                         rule.get('source_ip_prefix'))
             args += self._ip_prefix_arg('d',
                                         rule.get('dest_ip_prefix'))
+            args += self._remote_group_arg(rule)
             iptables_rules += [' '.join(args)]
 
         iptables_rules += ['-j $sg-fallback']
@@ -273,6 +311,26 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
             return ['-%s' % direction, ip_prefix]
         return []
 
+    def _remote_group_arg(self, rule):
+        """Match the members of the remote group with its ipset.
+
+        Only rules whose remote_group_id was not expanded into ip prefixes
+        by the server reference an ipset.
+        """
+        remote_group_id = rule.get('remote_group_id')
+        if (not self.ipset or not remote_group_id or
+            rule.get('source_ip_prefix') or rule.get('dest_ip_prefix')):
+            return []
+        ethertype = rule['ethertype']
+        set_name = ipset_manager.get_set_name(remote_group_id, ethertype)
+        if not self.ipset.set_exists(set_name):
+            member_ips = self.sg_members.get(remote_group_id, {}).get(
+                ethertype, [])
+            self.ipset.set_members(set_name, ethertype, member_ips)
+        self.ipsets_in_use.add(set_name)
+        return ['-m set', '--match-set', set_name,
+                IPSET_DIRECTION[rule['direction']]]
+
     def _port_chain_name(self, port, direction):
         return iptables_manager.get_chain_name(
             '%s%s' % (CHAIN_NAME_PREFIX[direction], port['device'][3:]))
@@ -282,6 +340,7 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
 
     def filter_defer_apply_off(self):
         self.iptables.defer_apply_off()
+        self._remove_unused_ipsets()
 
 
 class OVSHybridIptablesFirewallDriver(IptablesFirewallDriver):
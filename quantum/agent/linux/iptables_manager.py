@@ -23,6 +23,9 @@
 
 import inspect
 import os
+import time
+
+from oslo.config import cfg
 
 from quantum.agent.linux import utils
 from quantum.openstack.common import lockutils
@@ -39,6 +42,14 @@ binary_name = os.path.basename(inspect.stack()[-1][1])[:16]
 MAX_CHAIN_LEN_WRAP = 11
 MAX_CHAIN_LEN_NOWRAP = 28
 
+iptables_opts = [
+    cfg.BoolOpt('iptables_incremental_apply', default=False,
+                help=_("Only send the chains changed since the last apply to "
+                       "iptables-restore --noflush, instead of saving and "
+                       "restoring the whole tables on every apply")),
+]
+cfg.CONF.register_opts(iptables_opts, 'AGENT')
+
 
 def get_chain_name(chain_name, wrap=True):
     if wrap:
@@ -85,6 +96,8 @@ class IptablesTable(object):
         self.rules = []
         self.chains = set()
         self.unwrapped_chains = set()
+        # (name, wrap) of the chains modified since the last apply
+        self.dirty_chains = set()
 
     def add_chain(self, name, wrap=True):
         """Adds a named chain to the table.
@@ -103,6 +116,7 @@ class IptablesTable(object):
             self.chains.add(name)
         else:
             self.unwrapped_chains.add(name)
+        self.dirty_chains.add((name, wrap))
 
     def _select_chain_set(self, wrap):
         if wrap:
@@ -141,12 +155,16 @@ class IptablesTable(object):
             return
 
         chain_set.remove(name)
+        self.dirty_chains.add((name, wrap))
         self.rules = filter(lambda r: r.chain != name, self.rules)
         if wrap:
             jump_snippet = '-j %s-%s' % (binary_name, name)
         else:
             jump_snippet = '-j %s' % (name,)
 
+        for rule in self.rules:
+            if jump_snippet in rule.rule:
+                self.dirty_chains.add((rule.chain, rule.wrap))
         self.rules = filter(lambda r: jump_snippet not in r.rule, self.rules)
 
     def add_rule(self, chain, rule, wrap=True, top=False):
@@ -168,6 +186,7 @@ class IptablesTable(object):
             rule = ' '.join(map(self._wrap_target_chain, rule.split(' ')))
 
         self.rules.append(IptablesRule(chain, rule, wrap, top))
+        self.dirty_chains.add((chain, wrap))
 
     def _wrap_target_chain(self, s):
         if s.startswith('$'):
@@ -185,6 +204,7 @@ class IptablesTable(object):
         chain = get_chain_name(chain, wrap)
         try:
             self.rules.remove(IptablesRule(chain, rule, wrap, top))
+            self.dirty_chains.add((chain, wrap))
         except ValueError:
             LOG.warn(_('Tried to remove rule that was not there:'
                        ' %(chain)r %(rule)r %(wrap)r %(top)r'),
@@ -198,6 +218,8 @@ class IptablesTable(object):
                          if rule.chain == chain and rule.wrap == wrap]
         for rule in chained_rules:
             self.rules.remove(rule)
+        if chained_rules:
+            self.dirty_chains.add((chain, wrap))
 
 
 class IptablesManager(object):
@@ -224,7 +246,8 @@ class IptablesManager(object):
     """
 
     def __init__(self, _execute=None, state_less=False,
-                 root_helper=None, use_ipv6=False, namespace=None):
+                 root_helper=None, use_ipv6=False, namespace=None,
+                 incremental=None):
         if _execute:
             self.execute = _execute
         else:
@@ -234,6 +257,13 @@ class IptablesManager(object):
         self.root_helper = root_helper
         self.namespace = namespace
         self.iptables_apply_deferred = False
+        if incremental is None:
+            incremental = cfg.CONF.AGENT.iptables_incremental_apply
+        self.incremental = incremental
+        # (command, table name) -> {wrapped chain: rules} as last applied
+        self._applied = {}
+        # Seconds spent saving, diffing and restoring in the last apply
+        self.apply_stats = {}
 
         self.ipv4 = {'filter': IptablesTable()}
         self.ipv6 = {'filter': IptablesTable()}
@@ -315,28 +345,118 @@ class IptablesManager(object):
         same component of Nova, and replace them with our current set of
         rules. This happens atomically, thanks to iptables-restore.
 
+        In incremental mode, only the wrapped chains changed since the
+        previous apply are sent to iptables-restore --noflush. Tables whose
+        unwrapped chains changed are still saved and restored entirely.
+
         """
         s = [('iptables', self.ipv4)]
         if self.use_ipv6:
             s += [('ip6tables', self.ipv6)]
 
+        stats = {'save': 0.0, 'diff': 0.0, 'restore': 0.0}
         for cmd, tables in s:
             for table in tables:
-                args = ['%s-save' % cmd, '-t', table]
-                if self.namespace:
-                    args = ['ip', 'netns', 'exec', self.namespace] + args
-                current_table = (self.execute(args,
-                                 root_helper=self.root_helper))
-                current_lines = current_table.split('\n')
-                new_filter = self._modify_rules(current_lines,
-                                                tables[table])
-                args = ['%s-restore' % (cmd)]
-                if self.namespace:
-                    args = ['ip', 'netns', 'exec', self.namespace] + args
-                self.execute(args,
-                             process_input='\n'.join(new_filter),
-                             root_helper=self.root_helper)
-        LOG.debug(_("IPTablesManager.apply completed with success"))
+                if not (self.incremental and
+                        self._apply_incremental(cmd, table, tables[table],
+                                                stats)):
+                    self._apply_full(cmd, table, tables[table], stats)
+        self.apply_stats = stats
+        LOG.debug(_("IPTablesManager.apply completed with success "
+                    "(save %(save).3fs, diff %(diff).3fs, "
+                    "restore %(restore).3fs)"), stats)
+
+    def _execute_timed(self, stats, step, args, process_input=None):
+        if self.namespace:
+            args = ['ip', 'netns', 'exec', self.namespace] + args
+        kwargs = {'root_helper': self.root_helper}
+        if process_input is not None:
+            kwargs['process_input'] = process_input
+        start = time.time()
+        try:
+            return self.execute(args, **kwargs)
+        finally:
+            stats[step] += time.time() - start
+
+    def _apply_full(self, cmd, table_name, table, stats):
+        current_table = self._execute_timed(
+            stats, 'save', ['%s-save' % cmd, '-t', table_name])
+        start = time.time()
+        current_lines = current_table.split('\n')
+        new_filter = self._modify_rules(current_lines, table)
+        stats['diff'] += time.time() - start
+        self._execute_timed(stats, 'restore', ['%s-restore' % cmd],
+                            process_input='\n'.join(new_filter))
+        self._applied[(cmd, table_name)] = self._wrapped_chain_rules(table)
+        table.dirty_chains.clear()
+
+    def _apply_incremental(self, cmd, table_name, table, stats):
+        """Restore only the changed wrapped chains of the table.
+
+        Returns False when the table has to be applied entirely.
+        """
+        applied = self._applied.get((cmd, table_name))
+        if applied is None:
+            return False
+        if any(not wrap for name, wrap in table.dirty_chains):
+            return False
+        start = time.time()
+        current = self._wrapped_chain_rules(table)
+        chains = []
+        lines = []
+        removed = []
+        for name in sorted(name for name, wrap in table.dirty_chains):
+            rules = current.get(name)
+            if rules == applied.get(name):
+                continue
+            chain = '%s-%s' % (binary_name, name)
+            # Declaring a chain creates it or flushes its rules
+            chains.append(':%s - [0:0]' % chain)
+            if rules is None:
+                removed.append('-X %s' % chain)
+            else:
+                lines.extend(rules)
+        stats['diff'] += time.time() - start
+        if chains:
+            # Every chain is declared before the rules, which may jump to
+            # any of them, and removed once no rule jumps to it anymore
+            restore_input = (['*%s' % table_name] + chains + lines +
+                             removed + ['COMMIT', ''])
+            try:
+                self._execute_timed(stats, 'restore',
+                                    ['%s-restore' % cmd, '--noflush'],
+                                    process_input='\n'.join(restore_input))
+            except RuntimeError:
+                LOG.exception(_("Incremental apply of table %s failed, "
+                                "applying it entirely"), table_name)
+                del self._applied[(cmd, table_name)]
+                return False
+        self._applied[(cmd, table_name)] = current
+        table.dirty_chains.clear()
+        return True
+
+    @staticmethod
+    def _wrapped_chain_rules(table):
+        """Return the rules of every wrapped chain of the table.
+
+        Duplicate rules are dropped, the last occurrence taking precedence
+        as in _modify_rules.
+        """
+        chain_rules = dict((name, []) for name in table.chains)
+        for rule in table.rules:
+            if rule.wrap and rule.chain in chain_rules:
+                chain_rules[rule.chain].append(str(rule))
+        for name, rules in chain_rules.iteritems():
+            if len(set(rules)) != len(rules):
+                seen = set()
+                unique = []
+                for rule in reversed(rules):
+                    if rule not in seen:
+                        seen.add(rule)
+                        unique.append(rule)
+                unique.reverse()
+                chain_rules[name] = unique
+        return chain_rules
 
     def _modify_rules(self, current_lines, table, binary=None):
         unwrapped_chains = table.unwrapped_chains
@@ -344,8 +464,8 @@ class IptablesManager(object):
         rules = table.rules
 
         # Remove any trace of our rules
-        new_filter = filter(lambda line: binary_name
-                            not in line, current_lines)
+        new_filter = [line for line in current_lines
+                      if binary_name not in line]
 
         seen_chains = False
         rules_index = 0
@@ -358,37 +478,32 @@ class IptablesManager(object):
                     break
 
         our_rules = []
+        top_rules = set()
         for rule in rules:
             rule_str = str(rule)
             if rule.top:
                 # rule.top == True means we want this rule to be at the top.
                 # Further down, we weed out duplicates from the bottom of the
                 # list, so here we remove the dupes ahead of time.
-                new_filter = filter(lambda s: s.strip() != rule_str.strip(),
-                                    new_filter)
-            our_rules += [rule_str]
-
-        new_filter[rules_index:rules_index] = our_rules
-
-        new_filter[rules_index:rules_index] = [':%s - [0:0]' % (name)
-                                               for name in unwrapped_chains]
-        new_filter[rules_index:rules_index] = [':%s-%s - [0:0]' %
-                                               (binary_name, name)
-                                               for name in chains]
-
-        seen_lines = set()
+                top_rules.add(rule_str.strip())
+            our_rules.append(rule_str)
+        if top_rules:
+            new_filter = [line for line in new_filter
+                          if line.strip() not in top_rules]
 
-        def _weed_out_duplicates(line):
-            line = line.strip()
-            if line in seen_lines:
-                return False
-            else:
-                seen_lines.add(line)
-                return True
+        new_filter[rules_index:rules_index] = (
+            [':%s-%s - [0:0]' % (binary_name, name) for name in chains] +
+            [':%s - [0:0]' % (name) for name in unwrapped_chains] +
+            our_rules)
 
         # We filter duplicates, letting the *last* occurrence take
         # precedence.
-        new_filter.reverse()
-        new_filter = filter(_weed_out_duplicates, new_filter)
-        new_filter.reverse()
-        return new_filter
+        seen_lines = set()
+        result = []
+        for line in reversed(new_filter):
+            stripped = line.strip()
+            if stripped not in seen_lines:
+                seen_lines.add(stripped)
+                result.append(line)
+        result.reverse()
+        return result
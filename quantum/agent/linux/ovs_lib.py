@@ -18,9 +18,15 @@
 # @author: Dan Wendlandt, Nicira Networks, Inc.
 # @author: Dave Lapsley, Nicira Networks, Inc.
 
+import contextlib
+import itertools
 import re
 
+from eventlet import greenthread
+from eventlet import semaphore
+
 from quantum.agent.linux import utils
+from quantum.openstack.common import jsonutils
 from quantum.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
@@ -46,6 +52,12 @@ class OVSBridge:
         self.br_name = br_name
         self.root_helper = root_helper
         self.re_id = self.re_compile_id()
+        # (ovs-ofctl command, flow) in the order they were requested, per
+        # greenthread which deferred them
+        self.deferred_flows = {}
+        # Held while flows are programmed, so that the flows of a greenthread
+        # are not interleaved with a batch which is being flushed
+        self.flows_lock = semaphore.Semaphore()
 
     def re_compile_id(self):
         external = 'external_ids\s*'
@@ -89,20 +101,86 @@ class OVSBridge:
         args = ["clear", table_name, record, column]
         self.run_vsctl(args)
 
-    def run_ofctl(self, cmd, args):
+    def run_ofctl(self, cmd, args, process_input=None):
         full_args = ["ovs-ofctl", cmd, self.br_name] + args
+        kwargs = {'root_helper': self.root_helper}
+        if process_input is not None:
+            kwargs['process_input'] = process_input
         try:
-            return utils.execute(full_args, root_helper=self.root_helper)
+            return utils.execute(full_args, **kwargs)
         except Exception as e:
             LOG.error(_("Unable to execute %(cmd)s. Exception: %(exception)s"),
                       {'cmd': full_args, 'exception': e})
 
+    def defer_apply_on(self):
+        """Buffer the flows of this greenthread until defer_apply_off().
+
+        The flows programmed meanwhile by other greenthreads, e.g. the RPC
+        handlers, are not buffered.
+        """
+        self.deferred_flows.setdefault(greenthread.getcurrent(), [])
+
+    def defer_apply_off(self):
+        """Stop buffering flows and program the buffered ones."""
+        self.apply_flows(self.deferred_flows.pop(greenthread.getcurrent(),
+                                                 []))
+
+    @contextlib.contextmanager
+    def deferred(self):
+        self.defer_apply_on()
+        try:
+            yield
+        finally:
+            self.defer_apply_off()
+
+    def apply_flows(self, flows):
+        """Program the flows with one ovs-ofctl call per run.
+
+        Consecutive flows of the same command are read by ovs-ofctl from
+        stdin ('-'), so the order between additions and deletions is kept.
+        When a run fails, its flows are programmed one at a time so that a
+        bad flow does not prevent the others from being programmed.
+        """
+        with self.flows_lock:
+            for cmd, group in itertools.groupby(flows, lambda flow: flow[0]):
+                flow_strs = [flow[1] for flow in group]
+                LOG.debug(_("Applying %(count)d deferred %(cmd)s on bridge "
+                            "%(br_name)s"),
+                          {'count': len(flow_strs), 'cmd': cmd,
+                           'br_name': self.br_name})
+                try:
+                    utils.execute(["ovs-ofctl", cmd, self.br_name, "-"],
+                                  root_helper=self.root_helper,
+                                  process_input='\n'.join(flow_strs + ['']))
+                except Exception as e:
+                    LOG.warning(_("Unable to apply %(count)d deferred "
+                                  "%(cmd)s on bridge %(br_name)s, applying "
+                                  "them one at a time. Exception: "
+                                  "%(exception)s"),
+                                {'count': len(flow_strs), 'cmd': cmd,
+                                 'br_name': self.br_name, 'exception': e})
+                    for flow_str in flow_strs:
+                        self.run_ofctl(cmd, [flow_str])
+
+    def _program_flow(self, cmd, flow_str):
+        flows = self.deferred_flows.get(greenthread.getcurrent())
+        if flows is not None:
+            flows.append((cmd, flow_str))
+        else:
+            with self.flows_lock:
+                self.run_ofctl(cmd, [flow_str])
+
     def count_flows(self):
         flow_list = self.run_ofctl("dump-flows", []).split("\n")[1:]
         return len(flow_list) - 1
 
     def remove_all_flows(self):
-        self.run_ofctl("del-flows", [])
+        # The flows buffered by this greenthread would be removed as well
+        flows = self.deferred_flows.get(greenthread.getcurrent())
+        if flows:
+            del flows[:]
+        with self.flows_lock:
+            self.run_ofctl("del-flows", [])
 
     def get_port_ofport(self, port_name):
         return self.db_get_val("Interface", port_name, "ofport")
@@ -152,7 +230,7 @@ class OVSBridge:
         flow_expr_arr = self._build_flow_expr_arr(**kwargs)
         flow_expr_arr.append("actions=%s" % (kwargs["actions"]))
         flow_str = ",".join(flow_expr_arr)
-        self.run_ofctl("add-flow", [flow_str])
+        self._program_flow("add-flow", flow_str)
 
     def delete_flows(self, **kwargs):
         kwargs['delete'] = True
@@ -160,7 +238,7 @@ class OVSBridge:
         if "actions" in kwargs:
             flow_expr_arr.append("actions=%s" % (kwargs["actions"]))
         flow_str = ",".join(flow_expr_arr)
-        self.run_ofctl("del-flows", [flow_str])
+        self._program_flow("del-flows", flow_str)
 
     def add_tunnel_port(self, port_name, remote_ip):
         self.run_vsctl(["add-port", self.br_name, port_name])
@@ -219,60 +297,75 @@ class OVSBridge:
             LOG.error(_("Unable to execute %(cmd)s. Exception: %(exception)s"),
                       {'cmd': args, 'exception': e})
 
+    def get_interfaces(self, columns=('name', 'ofport', 'external_ids')):
+        """Return the given columns of every interface of the bridge.
+
+        The interfaces are read with a single 'ovs-vsctl list Interface'
+        call, rather than one 'ovs-vsctl get' per interface and column.
+        Each interface is a dict of its columns; map columns are dicts and
+        an unassigned ofport is -1.
+        """
+        port_names = set(self.get_port_name_list())
+        if not port_names:
+            return []
+        if 'name' not in columns:
+            columns = ['name'] + list(columns)
+        return [iface for iface in self._list_interfaces(columns)
+                if iface['name'] in port_names]
+
+    def _list_interfaces(self, columns, conditions=None):
+        args = ['--format=json', '--', '--columns=%s' % ','.join(columns)]
+        if conditions:
+            args += ['find', 'Interface'] + conditions
+        else:
+            args += ['list', 'Interface']
+        output = self.run_vsctl(args)
+        if not output:
+            return []
+        try:
+            table = jsonutils.loads(output)
+        except ValueError:
+            LOG.error(_("Unable to parse ovs-vsctl output %r"), output)
+            return []
+        return [dict((column, _ovsdb_value(column, value))
+                     for column, value in zip(table['headings'], row))
+                for row in table['data']]
+
+    def _vif_port(self, iface):
+        external_ids = iface['external_ids']
+        if "attached-mac" not in external_ids:
+            return
+        if "iface-id" in external_ids:
+            iface_id = external_ids["iface-id"]
+        elif "xs-vif-uuid" in external_ids:
+            # if this is a xenserver and iface-id is not automatically
+            # synced to OVS from XAPI, we grab it from XAPI directly
+            iface_id = self.get_xapi_iface_id(external_ids["xs-vif-uuid"])
+        else:
+            return
+        return VifPort(iface['name'], iface['ofport'], iface_id,
+                       external_ids["attached-mac"], self)
+
     # returns a VIF object for each VIF port
     def get_vif_ports(self):
         edge_ports = []
-        port_names = self.get_port_name_list()
-        for name in port_names:
-            external_ids = self.db_get_map("Interface", name, "external_ids")
-            ofport = self.db_get_val("Interface", name, "ofport")
-            if "iface-id" in external_ids and "attached-mac" in external_ids:
-                p = VifPort(name, ofport, external_ids["iface-id"],
-                            external_ids["attached-mac"], self)
-                edge_ports.append(p)
-            elif ("xs-vif-uuid" in external_ids and
-                  "attached-mac" in external_ids):
-                # if this is a xenserver and iface-id is not automatically
-                # synced to OVS from XAPI, we grab it from XAPI directly
-                iface_id = self.get_xapi_iface_id(external_ids["xs-vif-uuid"])
-                p = VifPort(name, ofport, iface_id,
-                            external_ids["attached-mac"], self)
-                edge_ports.append(p)
-
+        for iface in self.get_interfaces():
+            port = self._vif_port(iface)
+            if port:
+                edge_ports.append(port)
         return edge_ports
 
     def get_vif_port_set(self):
-        edge_ports = set()
-        port_names = self.get_port_name_list()
-        for name in port_names:
-            external_ids = self.db_get_map("Interface", name, "external_ids")
-            if "iface-id" in external_ids and "attached-mac" in external_ids:
-                edge_ports.add(external_ids['iface-id'])
-            elif ("xs-vif-uuid" in external_ids and
-                  "attached-mac" in external_ids):
-                # if this is a xenserver and iface-id is not automatically
-                # synced to OVS from XAPI, we grab it from XAPI directly
-                iface_id = self.get_xapi_iface_id(external_ids["xs-vif-uuid"])
-                edge_ports.add(iface_id)
-        return edge_ports
+        return set(port.vif_id for port in self.get_vif_ports())
 
     def get_vif_port_by_id(self, port_id):
-        args = ['--', '--columns=external_ids,name,ofport',
-                'find', 'Interface',
-                'external_ids:iface-id="%s"' % port_id]
-        result = self.run_vsctl(args)
-        if not result:
-            return
-        match = self.re_id.search(result)
-        try:
-            vif_mac = match.group('vif_mac')
-            vif_id = match.group('vif_id')
-            port_name = match.group('port_name')
-            ofport = int(match.group('ofport'))
-            return VifPort(port_name, ofport, vif_id, vif_mac, self)
-        except Exception as e:
-            LOG.info(_("Unable to parse regex results. Exception: %s"), e)
-            return
+        ifaces = self._list_interfaces(
+            ('name', 'ofport', 'external_ids'),
+            ['external_ids:iface-id="%s"' % port_id])
+        for iface in ifaces:
+            port = self._vif_port(iface)
+            if port:
+                return port
 
     def delete_ports(self, all_ports=False):
         if all_ports:
@@ -284,6 +377,18 @@ class OVSBridge:
             self.delete_port(port_name)
 
 
+def _ovsdb_value(column, value):
+    # Maps, sets and uuids are encoded as [type, data] in the JSON output
+    if isinstance(value, list):
+        kind, data = value
+        if kind == 'map':
+            return dict(data)
+        if kind == 'set':
+            return -1 if column == 'ofport' and not data else data
+        return data
+    return value
+
+
 def get_bridge_for_iface(root_helper, iface):
     args = ["ovs-vsctl", "--timeout=2", "iface-to-br", iface]
     try:
@@ -0,0 +1,191 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Stream the changes of the Interface table from ovsdb-client monitor."""
+
+import shlex
+
+import eventlet
+from eventlet import event
+
+from quantum.agent.linux import utils as agent_utils
+from quantum.common import utils
+from quantum.openstack.common import jsonutils
+from quantum.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+MONITOR_CMD = ['ovsdb-client', 'monitor', 'Interface', 'name,external_ids',
+               '--format=json']
+
+
+def _ovsdb_map(value):
+    # Maps are encoded as ["map", [[key, value], ...]]
+    if isinstance(value, list) and len(value) == 2 and value[0] == 'map':
+        return dict(value[1])
+    return {}
+
+
+class InterfaceMonitor(object):
+    """Track the VIF interfaces added and removed since the last check.
+
+    A long lived 'ovsdb-client monitor' process prints a JSON table for
+    every change of the Interface table, which is read by a greenthread.
+    Changes which can not be mapped to a VIF id (e.g. XenServer VIFs whose
+    iface-id must be read from XAPI) request a full resync instead.
+    """
+
+    def __init__(self, root_helper=None):
+        self.root_helper = root_helper
+        self._process = None
+        self._reader = None
+        # row uuid -> (interface name, vif id)
+        self._rows = {}
+        self._reset()
+
+    def _reset(self):
+        # interface name -> vif id
+        self.added = {}
+        self.removed = set()
+        self.resync_needed = False
+        self._changed = event.Event()
+
+    def start(self):
+        cmd = list(MONITOR_CMD)
+        if self.root_helper:
+            cmd = shlex.split(self.root_helper) + cmd
+        LOG.debug(_("Starting %s"), cmd)
+        self._rows = {}
+        self._reset()
+        # The initial rows are reported as added, the caller only keeps the
+        # ones it does not know about yet
+        self._process = utils.subprocess_popen(cmd,
+                                               stdout=utils.subprocess.PIPE)
+        self._reader = eventlet.spawn(self._read_output, self._process)
+
+    def stop(self):
+        if self._process:
+            try:
+                self._kill_process()
+            except Exception:
+                LOG.exception(_("Unable to kill ovsdb-client monitor"))
+            self._process = None
+        if self._reader:
+            self._reader.kill()
+            self._reader = None
+
+    def _kill_process(self):
+        if not self.root_helper:
+            self._process.kill()
+        else:
+            # The process started is the root helper, which can not be
+            # killed by the agent, nor be relied upon to kill its child
+            agent_utils.execute(['kill', '-9', self._get_monitor_pid()],
+                                root_helper=self.root_helper)
+        self._process.wait()
+
+    def _get_monitor_pid(self):
+        """Return the pid of ovsdb-client, the last child of the process."""
+        pid = str(self._process.pid)
+        while True:
+            child_pids = agent_utils.execute(['ps', '--ppid', pid,
+                                              '-o', 'pid='],
+                                             check_exit_code=False).split()
+            if not child_pids:
+                return pid
+            pid = child_pids[0]
+
+    def is_active(self):
+        return self._process is not None and self._process.poll() is None
+
+    def _read_output(self, process):
+        for line in iter(process.stdout.readline, ''):
+            try:
+                self.process_update(line)
+            except Exception:
+                LOG.exception(_("Unable to parse ovsdb-client output %r"),
+                              line)
+                self.resync_needed = True
+                self._notify()
+        LOG.warn(_("ovsdb-client monitor exited"))
+
+    def process_update(self, line):
+        """Record the VIF changes of one update printed by the monitor."""
+        line = line.strip()
+        if not line:
+            return
+        update = jsonutils.loads(line)
+        headings = update['headings']
+        for values in update['data']:
+            row = dict(zip(headings, values))
+            self._process_row(row)
+        if self.added or self.removed or self.resync_needed:
+            self._notify()
+
+    def _notify(self):
+        if not self._changed.ready():
+            self._changed.send()
+
+    def _process_row(self, row):
+        uuid = row['row']
+        action = row['action']
+        if action == 'old':
+            # Previous values of the columns changed by a 'new' row
+            return
+        previous = self._rows.pop(uuid, None)
+        if previous:
+            self._vif_removed(*previous)
+        if action == 'delete':
+            return
+        external_ids = _ovsdb_map(row.get('external_ids'))
+        if 'attached-mac' not in external_ids:
+            return
+        if 'iface-id' in external_ids:
+            name = row.get('name', previous and previous[0])
+            self._rows[uuid] = (name, external_ids['iface-id'])
+            self._vif_added(name, external_ids['iface-id'])
+        elif 'xs-vif-uuid' in external_ids:
+            self.resync_needed = True
+
+    def _vif_added(self, name, vif_id):
+        self.added[name] = vif_id
+        self.removed.discard(vif_id)
+
+    def _vif_removed(self, name, vif_id):
+        if self.added.get(name) == vif_id:
+            del self.added[name]
+        self.removed.add(vif_id)
+
+    def get_events(self):
+        """Return and forget the changes seen since the last call.
+
+        :returns: (added, removed, resync_needed) where added maps interface
+                  names to VIF ids and removed is a set of VIF ids.
+        """
+        events = (self.added, self.removed, self.resync_needed)
+        self._reset()
+        return events
+
+    def wait(self, timeout):
+        """Wait until a change is seen, at most timeout seconds."""
+        if self._changed.ready():
+            return True
+        with eventlet.Timeout(timeout, False):
+            self._changed.wait()
+            return True
+        return False
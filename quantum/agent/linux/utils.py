@@ -25,39 +25,61 @@ import struct
 import tempfile
 
 from eventlet.green import subprocess
+from oslo.config import cfg
 
 from quantum.common import utils
 from quantum.openstack.common import log as logging
+from quantum.rootwrap import daemon
 
 
 LOG = logging.getLogger(__name__)
 
+OPTS = [
+    cfg.StrOpt('rootwrap_daemon_socket',
+               help=_("UNIX socket of the quantum-rootwrap-daemon running "
+                      "the commands which need root_helper. Each command "
+                      "runs root_helper when not set")),
+]
+cfg.CONF.register_opts(OPTS, 'AGENT')
+
 
 def execute(cmd, root_helper=None, process_input=None, addl_env=None,
             check_exit_code=True, return_stderr=False):
-    if root_helper:
-        cmd = shlex.split(root_helper) + cmd
-    cmd = map(str, cmd)
-
-    LOG.debug(_("Running command: %s"), cmd)
-    env = os.environ.copy()
-    if addl_env:
-        env.update(addl_env)
-    obj = utils.subprocess_popen(cmd, shell=False,
-                                 stdin=subprocess.PIPE,
-                                 stdout=subprocess.PIPE,
-                                 stderr=subprocess.PIPE,
-                                 env=env)
-
-    _stdout, _stderr = (process_input and
-                        obj.communicate(process_input) or
-                        obj.communicate())
-    obj.stdin.close()
+    # The daemon runs the commands in its own environment, the ones which
+    # need additional variables still go through root_helper
+    daemon_socket = (root_helper and not addl_env and
+                     cfg.CONF.AGENT.rootwrap_daemon_socket)
+    if daemon_socket:
+        # The daemon enforces the rootwrap filters itself
+        cmd = map(str, cmd)
+        LOG.debug(_("Running command with the rootwrap daemon: %s"), cmd)
+        returncode, _stdout, _stderr = daemon.execute(daemon_socket, cmd,
+                                                      process_input)
+    else:
+        if root_helper:
+            cmd = shlex.split(root_helper) + cmd
+        cmd = map(str, cmd)
+
+        LOG.debug(_("Running command: %s"), cmd)
+        env = os.environ.copy()
+        if addl_env:
+            env.update(addl_env)
+        obj = utils.subprocess_popen(cmd, shell=False,
+                                     stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE,
+                                     env=env)
+
+        _stdout, _stderr = (process_input and
+                            obj.communicate(process_input) or
+                            obj.communicate())
+        obj.stdin.close()
+        returncode = obj.returncode
     m = _("\nCommand: %(cmd)s\nExit code: %(code)s\nStdout: %(stdout)r\n"
-          "Stderr: %(stderr)r") % {'cmd': cmd, 'code': obj.returncode,
+          "Stderr: %(stderr)r") % {'cmd': cmd, 'code': returncode,
                                    'stdout': _stdout, 'stderr': _stderr}
     LOG.debug(m)
-    if obj.returncode and check_exit_code:
+    if returncode and check_exit_code:
         raise RuntimeError(m)
 
     return return_stderr and (_stdout, _stderr) or _stdout
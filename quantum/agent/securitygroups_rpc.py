@@ -21,14 +21,25 @@ from oslo.config import cfg
 from quantum.common import topics
 from quantum.openstack.common import importutils
 from quantum.openstack.common import log as logging
+from quantum.openstack.common.rpc import common as rpc_common
 
 LOG = logging.getLogger(__name__)
-SG_RPC_VERSION = "1.1"
+# history
+#   1.1 Support Security Group RPC
+#   1.2 security_group_info_for_devices and security_group_members
+SG_RPC_VERSION = "1.2"
+# Version of the calls and notifications which 1.1 endpoints understand
+SG_RPC_BASE_VERSION = "1.1"
 
 security_group_opts = [
     cfg.StrOpt(
         'firewall_driver',
-        default='quantum.agent.firewall.NoopFirewallDriver')
+        default='quantum.agent.firewall.NoopFirewallDriver'),
+    cfg.BoolOpt(
+        'enable_ipset', default=False,
+        help=_("Match the members of remote security groups with one "
+               "ipset per group instead of one iptables rule per member. "
+               "Requires the ipset command on the agent host"))
 ]
 cfg.CONF.register_opts(security_group_opts, 'SECURITYGROUP')
 
@@ -53,6 +64,24 @@ class SecurityGroupServerRpcApiMixin(object):
         return self.call(context,
                          self.make_msg('security_group_rules_for_devices',
                                        devices=devices),
+                         version=SG_RPC_BASE_VERSION,
+                         topic=self.topic)
+
+    def security_group_info_for_devices(self, context, devices):
+        LOG.debug(_("Get security group information "
+                    "for devices via rpc %r"), devices)
+        return self.call(context,
+                         self.make_msg('security_group_info_for_devices',
+                                       devices=devices),
+                         version=SG_RPC_VERSION,
+                         topic=self.topic)
+
+    def security_group_members(self, context, security_groups):
+        LOG.debug(_("Get members of security groups "
+                    "via rpc %r"), security_groups)
+        return self.call(context,
+                         self.make_msg('security_group_members',
+                                       security_groups=security_groups),
                          version=SG_RPC_VERSION,
                          topic=self.topic)
 
@@ -104,8 +133,7 @@ class SecurityGroupAgentRpcMixin(object):
         if not device_ids:
             return
         LOG.info(_("Preparing filters for devices %s"), device_ids)
-        devices = self.plugin_rpc.security_group_rules_for_devices(
-            self.context, list(device_ids))
+        devices = self._security_group_rules_for_devices(list(device_ids))
         with self.firewall.defer_apply():
             for device in devices.values():
                 self.firewall.prepare_port_filter(device)
@@ -117,13 +145,48 @@ class SecurityGroupAgentRpcMixin(object):
             security_groups,
             'security_groups')
 
+    def _security_group_rules_for_devices(self, device_ids):
+        if not cfg.CONF.SECURITYGROUP.enable_ipset:
+            return self.plugin_rpc.security_group_rules_for_devices(
+                self.context, device_ids)
+        # Remote group rules are left unexpanded, and matched against the
+        # ipsets of the members sent along
+        try:
+            info = self.plugin_rpc.security_group_info_for_devices(
+                self.context, device_ids)
+        except rpc_common.RemoteError as e:
+            if e.exc_type == 'UnsupportedRpcVersion':
+                LOG.error(_("The server does not support the security group "
+                            "RPC version %s needed by enable_ipset"),
+                          SG_RPC_VERSION)
+            raise
+        for sg_id, sg_members in info['sg_member_ips'].iteritems():
+            self.firewall.update_security_group_members(sg_id, sg_members)
+        return info['devices']
+
     def security_groups_member_updated(self, security_groups):
         LOG.info(_("Security group "
                    "member updated %r"), security_groups)
+        if cfg.CONF.SECURITYGROUP.enable_ipset:
+            self._update_security_group_members(security_groups)
+            return
         self._security_group_updated(
             security_groups,
             'security_group_source_groups')
 
+    def _update_security_group_members(self, security_groups):
+        """Only update the ipsets of the remote groups in use."""
+        in_use = set()
+        for device in self.firewall.ports.values():
+            in_use.update(device.get('security_group_source_groups', []))
+        security_groups = in_use.intersection(security_groups)
+        if not security_groups:
+            return
+        sg_member_ips = self.plugin_rpc.security_group_members(
+            self.context, list(security_groups))
+        for sg_id, sg_members in sg_member_ips.iteritems():
+            self.firewall.update_security_group_members(sg_id, sg_members)
+
     def _security_group_updated(self, security_groups, attribute):
         #check need update or not
         for device in self.firewall.ports.values():
@@ -153,8 +216,7 @@ class SecurityGroupAgentRpcMixin(object):
         device_ids = self.firewall.ports.keys()
         if not device_ids:
             return
-        devices = self.plugin_rpc.security_group_rules_for_devices(
-            self.context, device_ids)
+        devices = self._security_group_rules_for_devices(device_ids)
         with self.firewall.defer_apply():
             for device in devices.values():
                 LOG.debug(_("Update port filter for %s"), device)
@@ -175,7 +237,7 @@ class SecurityGroupAgentRpcApiMixin(object):
         self.fanout_cast(context,
                          self.make_msg('security_groups_rule_updated',
                                        security_groups=security_groups),
-                         version=SG_RPC_VERSION,
+                         version=SG_RPC_BASE_VERSION,
                          topic=self._get_security_group_topic())
 
     def security_groups_member_updated(self, context, security_groups):
@@ -185,12 +247,12 @@ class SecurityGroupAgentRpcApiMixin(object):
         self.fanout_cast(context,
                          self.make_msg('security_groups_member_updated',
                                        security_groups=security_groups),
-                         version=SG_RPC_VERSION,
+                         version=SG_RPC_BASE_VERSION,
                          topic=self._get_security_group_topic())
 
     def security_groups_provider_updated(self, context):
         """Notify provider updated security groups."""
         self.fanout_cast(context,
                          self.make_msg('security_groups_provider_updated'),
-                         version=SG_RPC_VERSION,
+                         version=SG_RPC_BASE_VERSION,
                          topic=self._get_security_group_topic())
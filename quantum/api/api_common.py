@@ -15,6 +15,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import heapq
 import urllib
 
 from oslo.config import cfg
@@ -172,6 +173,30 @@ def get_pagination_links(request, items, limit,
     return links
 
 
+class _PageKey(object):
+    """Order items by a comparison function, keeping ties in list order."""
+
+    __slots__ = ('item', 'index', 'compare')
+
+    def __init__(self, item, index, compare):
+        self.item = item
+        self.index = index
+        self.compare = compare
+
+    def _cmp(self, other):
+        return (self.compare(self.item, other.item) or
+                cmp(self.index, other.index))
+
+    def __lt__(self, other):
+        return self._cmp(other) < 0
+
+    def __le__(self, other):
+        return self._cmp(other) <= 0
+
+    def __gt__(self, other):
+        return self._cmp(other) > 0
+
+
 class PaginationHelper(object):
 
     def __init__(self, request, primary_key='id'):
@@ -184,7 +209,9 @@ class PaginationHelper(object):
     def update_args(self, args):
         pass
 
-    def paginate(self, items):
+    def paginate(self, items, sorting_helper=None):
+        if sorting_helper:
+            return sorting_helper.sort(items)
         return items
 
     def get_links(self, items):
@@ -205,18 +232,34 @@ class PaginationEmulatedHelper(PaginationHelper):
             original_fields.append(self.primary_key)
             fields_to_add.append(self.primary_key)
 
-    def paginate(self, items):
+    def paginate(self, items, sorting_helper=None):
+        """Return the page of items next to the marker.
+
+        The page is selected with a heap of limit items, instead of sorting
+        all the items and slicing them.
+        """
         if not self.limit:
-            return items
-        i = -1
+            return super(PaginationEmulatedHelper, self).paginate(
+                items, sorting_helper)
+        sorting_helper = sorting_helper or NoSortingHelper(self.request, None)
+        keys = [_PageKey(item, i, sorting_helper.compare)
+                for i, item in enumerate(items)]
         if self.marker:
-            for item in items:
-                i = i + 1
-                if item[self.primary_key] == self.marker:
+            for marker in keys:
+                if marker.item[self.primary_key] == self.marker:
                     break
+            else:
+                return []
+            if self.page_reverse:
+                keys = [key for key in keys if key < marker]
+            else:
+                keys = [key for key in keys if key > marker]
         if self.page_reverse:
-            return items[i - self.limit:i]
-        return items[i + 1:i + self.limit + 1]
+            page = heapq.nlargest(self.limit, keys)
+            page.reverse()
+        else:
+            page = heapq.nsmallest(self.limit, keys)
+        return [key.item for key in page]
 
     def get_links(self, items):
         return get_pagination_links(
@@ -232,7 +275,7 @@ class PaginationNativeHelper(PaginationEmulatedHelper):
         args.update({'limit': self.limit, 'marker': self.marker,
                      'page_reverse': self.page_reverse})
 
-    def paginate(self, items):
+    def paginate(self, items, sorting_helper=None):
         return items
 
 
@@ -251,6 +294,10 @@ class SortingHelper(object):
     def update_fields(self, original_fields, fields_to_add):
         pass
 
+    def compare(self, obj1, obj2):
+        # The items are already in order
+        return 0
+
     def sort(self, items):
         return items
 
@@ -269,14 +316,15 @@ class SortingEmulatedHelper(SortingHelper):
                 original_fields.append(key)
                 fields_to_add.append(key)
 
+    def compare(self, obj1, obj2):
+        for key, direction in self.sort_dict:
+            ret = cmp(obj1[key], obj2[key])
+            if ret:
+                return ret * (1 if direction else -1)
+        return 0
+
     def sort(self, items):
-        def cmp_func(obj1, obj2):
-            for key, direction in self.sort_dict:
-                ret = cmp(obj1[key], obj2[key])
-                if ret:
-                    return ret * (1 if direction else -1)
-            return 0
-        return sorted(items, cmp=cmp_func)
+        return sorted(items, cmp=self.compare)
 
 
 class SortingNativeHelper(SortingHelper):
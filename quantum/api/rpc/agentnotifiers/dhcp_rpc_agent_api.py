@@ -27,7 +27,6 @@ LOG = logging.getLogger(__name__)
 class DhcpAgentNotifyAPI(proxy.RpcProxy):
     """API for plugin to notify DHCP agent."""
     BASE_RPC_API_VERSION = '1.0'
-    # It seems dhcp agent does not support bulk operation
     VALID_RESOURCES = ['network', 'subnet', 'port']
     VALID_METHOD_NAMES = ['network.create.end',
                           'network.update.end',
@@ -47,8 +46,17 @@ class DhcpAgentNotifyAPI(proxy.RpcProxy):
         plugin = manager.QuantumManager.get_plugin()
         dhcp_agents = plugin.get_dhcp_agents_hosting_networks(
             context, [network_id], active=True)
-        return [(dhcp_agent.host, dhcp_agent.topic) for
-                dhcp_agent in dhcp_agents]
+        return [(dhcp_agent.host, dhcp_agent.topic,
+                 plugin.get_configuration_dict(dhcp_agent).get(
+                     constants.DHCP_BULK_PORTS, False))
+                for dhcp_agent in dhcp_agents]
+
+    @staticmethod
+    def _split_ports(payload):
+        """Return the payloads understood by agents without bulk support."""
+        if 'ports' not in payload:
+            return [payload]
+        return [{'port': port} for port in payload['ports']]
 
     def _notification_host(self, context, method, payload, host):
         """Notify the agent on host."""
@@ -75,16 +83,21 @@ class DhcpAgentNotifyAPI(proxy.RpcProxy):
                         context, 'network_create_end',
                         {'network': {'id': network_id}},
                         chosen_agent['host'])
-            for (host, topic) in self._get_dhcp_agents(context, network_id):
-                self.cast(
-                    context, self.make_msg(method,
-                                           payload=payload),
-                    topic='%s.%s' % (topic, host))
+            for (host, topic, bulk_ports) in self._get_dhcp_agents(
+                    context, network_id):
+                payloads = (bulk_ports and [payload] or
+                            self._split_ports(payload))
+                for agent_payload in payloads:
+                    self.cast(
+                        context, self.make_msg(method,
+                                               payload=agent_payload),
+                        topic='%s.%s' % (topic, host))
         else:
             # besides the non-agentscheduler plugin,
             # There is no way to query who is hosting the network
             # when the network is deleted, so we need to fanout
-            self._notification_fanout(context, method, payload)
+            for agent_payload in self._split_ports(payload):
+                self._notification_fanout(context, method, agent_payload)
 
     def _notification_fanout(self, context, method, payload):
         """Fanout the payload to all dhcp agents."""
@@ -106,11 +119,38 @@ class DhcpAgentNotifyAPI(proxy.RpcProxy):
                                 {'admin_state_up': admin_state_up},
                                 host)
 
+    def _notify_ports_bulk(self, context, ports, methodname):
+        """Send a single notification per network for the ports.
+
+        Agents which do not report DHCP_BULK_PORTS are still notified one
+        port at a time.
+        """
+        if methodname != 'port.create.end':
+            for port in ports:
+                self.notify(context, {'port': port}, methodname)
+            return
+        ports_by_network = {}
+        for port in ports:
+            if 'network_id' in port:
+                ports_by_network.setdefault(port['network_id'],
+                                            []).append(port)
+        for network_id, network_ports in ports_by_network.iteritems():
+            self._notification(context, 'port_create_end',
+                               {'ports': network_ports}, network_id)
+
     def notify(self, context, data, methodname):
         # data is {'key' : 'value'} with only one key
         if methodname not in self.VALID_METHOD_NAMES:
             return
         obj_type = data.keys()[0]
+        if obj_type == 'ports':
+            self._notify_ports_bulk(context, data[obj_type], methodname)
+            return
+        if obj_type[:-1] in self.VALID_RESOURCES:
+            # Other bulk operations are notified one object at a time
+            for obj_value in data[obj_type]:
+                self.notify(context, {obj_type[:-1]: obj_value}, methodname)
+            return
         if obj_type not in self.VALID_RESOURCES:
             return
         obj_value = data[obj_type]
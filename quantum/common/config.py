@@ -54,6 +54,13 @@ core_opts = [
                help=_("The base MAC address Quantum will use for VIFs")),
     cfg.IntOpt('mac_generation_retries', default=16,
                help=_("How many times Quantum will retry MAC generation")),
+    cfg.IntOpt('mac_generation_cache_size', default=0,
+               help=_("Number of MAC addresses generated by this process "
+                      "to remember per base_mac and skip when generating "
+                      "new ones. 0 disables the cache")),
+    cfg.StrOpt('ipam_driver',
+               default='quantum.db.ipam.AvailabilityRangeAllocator',
+               help=_("The IP address allocation engine Quantum will use")),
     cfg.BoolOpt('allow_bulk', default=True,
                 help=_("Allow the usage of the bulk API")),
     cfg.BoolOpt('allow_pagination', default=False,
@@ -30,6 +30,8 @@ DEVICE_OWNER_DHCP = "network:dhcp"
 
 FLOATINGIP_KEY = '_floatingips'
 INTERFACE_KEY = '_interfaces'
+REVISION_KEY = '_revision'
+FLOATINGIP_DELTA_KEY = '_floatingips_delta'
 
 IPv4 = 'IPv4'
 IPv6 = 'IPv6'
@@ -63,6 +65,10 @@ AGENT_TYPE_NEC = 'NEC plugin agent'
 AGENT_TYPE_L3 = 'L3 agent'
 L2_AGENT_TOPIC = 'N/A'
 
+# Configuration reported by the DHCP agents accepting the ports of a network
+# in a single port_create_end notification
+DHCP_BULK_PORTS = 'bulk_port_notifications'
+
 PAGINATION_INFINITE = 'infinite'
 
 SORT_DIRECTION_ASC = 'asc'
@@ -16,10 +16,10 @@
 #    under the License.
 
 import datetime
-import random
 
 import netaddr
 from oslo.config import cfg
+import sqlalchemy as sa
 from sqlalchemy import orm
 from sqlalchemy.orm import exc
 
@@ -27,7 +27,10 @@ from quantum.api.v2 import attributes
 from quantum.common import constants
 from quantum.common import exceptions as q_exc
 from quantum.db import api as db
+from quantum.db import ipam
+from quantum.db import mac_allocator
 from quantum.db import models_v2
+from quantum.db import quota_db
 from quantum.db import sqlalchemyutils
 from quantum.openstack.common import log as logging
 from quantum.openstack.common import timeutils
@@ -74,6 +77,15 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
     # api resources. Mixins can use this dict for adding their own methods
     # TODO(salvatore-orlando): Avoid using class-level variables
     _dict_extend_functions = {}
+    # Relationships read when building the dicts of the resources of a
+    # model, which are eager loaded by the collection getters instead of
+    # being lazy loaded row by row. Mixins reading more relationships in
+    # their dict extend functions register them with register_eager_loads
+    _model_eager_loads = {
+        models_v2.Network: ['subnets'],
+        models_v2.Subnet: ['allocation_pools', 'dns_nameservers', 'routes'],
+        models_v2.Port: ['fixed_ips'],
+    }
 
     def __init__(self):
         # NOTE(jkoelker) This is an incomlete implementation. Subclasses
@@ -127,6 +139,18 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
         cur_funcs.extend(funcs)
         cls._dict_extend_functions[resource] = cur_funcs
 
+    @classmethod
+    def register_eager_loads(cls, model, relationships):
+        cur_relationships = cls._model_eager_loads.get(model, [])
+        cur_relationships.extend(relationships)
+        cls._model_eager_loads[model] = cur_relationships
+
+    def _eager_load(self, query, model):
+        # One query per relationship, whatever the number of rows
+        for relationship in self._model_eager_loads.get(model, []):
+            query = query.options(orm.subqueryload(relationship))
+        return query
+
     @classmethod
     def register_model_query_hook(cls, model, name, query_hook, filter_hook,
                                   result_filters=None):
@@ -252,6 +276,7 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
                                            limit=limit,
                                            marker_obj=marker_obj,
                                            page_reverse=page_reverse)
+        query = self._eager_load(query, model)
         items = [dict_func(c, fields) for c in query]
         if limit and page_reverse:
             items.reverse()
@@ -262,30 +287,12 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
 
     @staticmethod
     def _generate_mac(context, network_id):
-        base_mac = cfg.CONF.base_mac.split(':')
-        max_retries = cfg.CONF.mac_generation_retries
-        for i in range(max_retries):
-            mac = [int(base_mac[0], 16), int(base_mac[1], 16),
-                   int(base_mac[2], 16), random.randint(0x00, 0xff),
-                   random.randint(0x00, 0xff), random.randint(0x00, 0xff)]
-            if base_mac[3] != '00':
-                mac[3] = int(base_mac[3], 16)
-            mac_address = ':'.join(map(lambda x: "%02x" % x, mac))
-            if QuantumDbPluginV2._check_unique_mac(context, network_id,
-                                                   mac_address):
-                LOG.debug(_("Generated mac for network %(network_id)s "
-                            "is %(mac_address)s"),
-                          {'network_id': network_id,
-                           'mac_address': mac_address})
-                return mac_address
-            else:
-                LOG.debug(_("Generated mac %(mac_address)s exists. Remaining "
-                            "attempts %(max_retries)s."),
-                          {'mac_address': mac_address,
-                           'max_retries': max_retries - (i + 1)})
-        LOG.error(_("Unable to generate mac address after %s attempts"),
-                  max_retries)
-        raise q_exc.MacAddressGenerationFailure(net_id=network_id)
+        return QuantumDbPluginV2._generate_macs(context, network_id, 1)[0]
+
+    @staticmethod
+    def _generate_macs(context, network_id, count, exclude=()):
+        return mac_allocator.generate_macs(context, network_id, count,
+                                           exclude=exclude)
 
     @staticmethod
     def _check_unique_mac(context, network_id, mac_address):
@@ -350,81 +357,8 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
         """Return an IP address to the pool of free IP's on the network
         subnet.
         """
-        # Grab all allocation pools for the subnet
-        pool_qry = context.session.query(
-            models_v2.IPAllocationPool).with_lockmode('update')
-        allocation_pools = pool_qry.filter_by(subnet_id=subnet_id)
-        # Find the allocation pool for the IP to recycle
-        pool_id = None
-        for allocation_pool in allocation_pools:
-            allocation_pool_range = netaddr.IPRange(
-                allocation_pool['first_ip'],
-                allocation_pool['last_ip'])
-            if netaddr.IPAddress(ip_address) in allocation_pool_range:
-                pool_id = allocation_pool['id']
-                break
-        if not pool_id:
-            error_message = _("No allocation pool found for "
-                              "ip address:%s") % ip_address
-            raise q_exc.InvalidInput(error_message=error_message)
-        # Two requests will be done on the database. The first will be to
-        # search if an entry starts with ip_address + 1 (r1). The second
-        # will be to see if an entry ends with ip_address -1 (r2).
-        # If 1 of the above holds true then the specific entry will be
-        # modified. If both hold true then the two ranges will be merged.
-        # If there are no entries then a single entry will be added.
-        range_qry = context.session.query(
-            models_v2.IPAvailabilityRange).with_lockmode('update')
-        ip_first = str(netaddr.IPAddress(ip_address) + 1)
-        ip_last = str(netaddr.IPAddress(ip_address) - 1)
-        LOG.debug(_("Recycle %s"), ip_address)
-        try:
-            r1 = range_qry.filter_by(allocation_pool_id=pool_id,
-                                     first_ip=ip_first).one()
-            LOG.debug(_("Recycle: first match for %(first_ip)s-%(last_ip)s"),
-                      {'first_ip': r1['first_ip'], 'last_ip': r1['last_ip']})
-        except exc.NoResultFound:
-            r1 = []
-        try:
-            r2 = range_qry.filter_by(allocation_pool_id=pool_id,
-                                     last_ip=ip_last).one()
-            LOG.debug(_("Recycle: last match for %(first_ip)s-%(last_ip)s"),
-                      {'first_ip': r2['first_ip'], 'last_ip': r2['last_ip']})
-        except exc.NoResultFound:
-            r2 = []
-
-        if r1 and r2:
-            # Merge the two ranges
-            ip_range = models_v2.IPAvailabilityRange(
-                allocation_pool_id=pool_id,
-                first_ip=r2['first_ip'],
-                last_ip=r1['last_ip'])
-            context.session.add(ip_range)
-            LOG.debug(_("Recycle: merged %(first_ip1)s-%(last_ip1)s and "
-                        "%(first_ip2)s-%(last_ip2)s"),
-                      {'first_ip1': r2['first_ip'], 'last_ip1': r2['last_ip'],
-                       'first_ip2': r1['first_ip'], 'last_ip2': r1['last_ip']})
-            context.session.delete(r1)
-            context.session.delete(r2)
-        elif r1:
-            # Update the range with matched first IP
-            r1['first_ip'] = ip_address
-            LOG.debug(_("Recycle: updated first %(first_ip)s-%(last_ip)s"),
-                      {'first_ip': r1['first_ip'], 'last_ip': r1['last_ip']})
-        elif r2:
-            # Update the range with matched last IP
-            r2['last_ip'] = ip_address
-            LOG.debug(_("Recycle: updated last %(first_ip)s-%(last_ip)s"),
-                      {'first_ip': r2['first_ip'], 'last_ip': r2['last_ip']})
-        else:
-            # Create a new range
-            ip_range = models_v2.IPAvailabilityRange(
-                allocation_pool_id=pool_id,
-                first_ip=ip_address,
-                last_ip=ip_address)
-            context.session.add(ip_range)
-            LOG.debug(_("Recycle: created new %(first_ip)s-%(last_ip)s"),
-                      {'first_ip': ip_address, 'last_ip': ip_address})
+        ipam.get_allocator().recycle_ip(context, network_id, subnet_id,
+                                        ip_address)
         QuantumDbPluginV2._delete_ip_allocation(context, network_id, subnet_id,
                                                 ip_address)
 
@@ -452,6 +386,38 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
                       {'network_id': network_id,
                        'ip_address': ip_address})
 
+    def update_fixed_ip_lease_expirations(self, context, network_id, leases):
+        """Update the expiration of many fixed IPs of a network at once.
+
+        :param leases: maps ip addresses to the lease remaining in seconds
+        """
+        if not leases:
+            return
+        now = timeutils.utcnow()
+        expirations = sorted(
+            (ip_address, now + datetime.timedelta(seconds=lease_remaining))
+            for ip_address, lease_remaining in leases.iteritems())
+
+        ip_address = models_v2.IPAllocation.ip_address
+        query = context.session.query(models_v2.IPAllocation)
+        query = query.filter(
+            models_v2.IPAllocation.network_id == network_id,
+            ip_address.in_([ip for ip, expiration in expirations]))
+
+        # One UPDATE ... SET expiration = CASE ip_address WHEN ... END
+        with context.session.begin(subtransactions=True):
+            count = query.update(
+                {models_v2.IPAllocation.expiration:
+                 sa.case(expirations, value=ip_address)},
+                synchronize_session=False)
+        if count < len(leases):
+            LOG.debug(_("Only %(count)d of %(total)d fixed IPs found on the "
+                        "network %(network_id)s to update their lease "
+                        "expiration."),
+                      {'count': count,
+                       'total': len(leases),
+                       'network_id': network_id})
+
     @staticmethod
     def _delete_ip_allocation(context, network_id, subnet_id, ip_address):
 
@@ -474,66 +440,22 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
         The IP address will be generated from one of the subnets defined on
         the network.
         """
-        range_qry = context.session.query(
-            models_v2.IPAvailabilityRange).join(
-                models_v2.IPAllocationPool).with_lockmode('update')
-        for subnet in subnets:
-            range = range_qry.filter_by(subnet_id=subnet['id']).first()
-            if not range:
-                LOG.debug(_("All IP's from subnet %(subnet_id)s (%(cidr)s) "
-                            "allocated"),
-                          {'subnet_id': subnet['id'], 'cidr': subnet['cidr']})
-                continue
-            ip_address = range['first_ip']
-            LOG.debug(_("Allocated IP - %(ip_address)s from %(first_ip)s "
-                        "to %(last_ip)s"),
-                      {'ip_address': ip_address,
-                       'first_ip': range['first_ip'],
-                       'last_ip': range['last_ip']})
-            if range['first_ip'] == range['last_ip']:
-                # No more free indices on subnet => delete
-                LOG.debug(_("No more free IP's in slice. Deleting allocation "
-                            "pool."))
-                context.session.delete(range)
-            else:
-                # increment the first free
-                range['first_ip'] = str(netaddr.IPAddress(ip_address) + 1)
-            return {'ip_address': ip_address, 'subnet_id': subnet['id']}
-        raise q_exc.IpAddressGenerationFailure(net_id=subnets[0]['network_id'])
+        return QuantumDbPluginV2._generate_ips(context, subnets, 1)[0]
+
+    @staticmethod
+    def _generate_ips(context, subnets, count):
+        """Generate count IP addresses in a single allocator call.
+
+        The IP addresses will be generated from the subnets defined on the
+        network, in order.
+        """
+        return ipam.get_allocator().generate_ips(context, subnets, count)
 
     @staticmethod
     def _allocate_specific_ip(context, subnet_id, ip_address):
         """Allocate a specific IP address on the subnet."""
-        ip = int(netaddr.IPAddress(ip_address))
-        range_qry = context.session.query(
-            models_v2.IPAvailabilityRange,
-            models_v2.IPAllocationPool).join(
-                models_v2.IPAllocationPool).with_lockmode('update')
-        results = range_qry.filter_by(subnet_id=subnet_id)
-        for (range, pool) in results:
-            first = int(netaddr.IPAddress(range['first_ip']))
-            last = int(netaddr.IPAddress(range['last_ip']))
-            if first <= ip <= last:
-                if first == last:
-                    context.session.delete(range)
-                    return
-                elif first == ip:
-                    range['first_ip'] = str(netaddr.IPAddress(ip_address) + 1)
-                    return
-                elif last == ip:
-                    range['last_ip'] = str(netaddr.IPAddress(ip_address) - 1)
-                    return
-                else:
-                    # Split into two ranges
-                    new_first = str(netaddr.IPAddress(ip_address) + 1)
-                    new_last = range['last_ip']
-                    range['last_ip'] = str(netaddr.IPAddress(ip_address) - 1)
-                    ip_range = models_v2.IPAvailabilityRange(
-                        allocation_pool_id=pool['id'],
-                        first_ip=new_first,
-                        last_ip=new_last)
-                    context.session.add(ip_range)
-                    return
+        ipam.get_allocator().allocate_specific_ip(context, subnet_id,
+                                                  ip_address)
 
     @staticmethod
     def _check_unique_ip(context, network_id, subnet_id, ip_address):
@@ -1026,8 +948,14 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
 
             # clean up subnets
             subnets_qry = context.session.query(models_v2.Subnet)
-            subnets_qry.filter_by(network_id=id).delete()
+            subnets_qry = subnets_qry.filter_by(network_id=id)
+            subnet_ids = [subnet_id for subnet_id, in
+                          subnets_qry.with_entities(models_v2.Subnet.id)]
+            subnets_qry.delete()
             context.session.delete(network)
+        allocator = ipam.get_allocator()
+        for subnet_id in subnet_ids:
+            allocator.forget_subnet(subnet_id)
 
     def get_network(self, context, id, fields=None):
         network = self._get_network(context, id)
@@ -1266,6 +1194,7 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
             allocated.delete()
 
             context.session.delete(subnet)
+        ipam.get_allocator().forget_subnet(id)
 
     def get_subnet(self, context, id, fields=None):
         subnet = self._get_subnet(context, id)
@@ -1288,7 +1217,131 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
                                           filters=filters)
 
     def create_port_bulk(self, context, ports):
-        return self._create_bulk('port', context, ports)
+        # Plugins overriding create_port process their own attributes there,
+        # so they keep creating one port at a time unless they also override
+        # create_port_bulk around _create_port_bulk_db
+        create_port = getattr(self.create_port, 'im_func', None)
+        if create_port is not QuantumDbPluginV2.create_port.im_func:
+            return self._create_bulk('port', context, ports)
+        return self._create_port_bulk_db(context, ports)
+
+    def _create_port_bulk_db(self, context, ports):
+        """Create the ports with batched allocations and inserts.
+
+        Only the attributes handled by create_port of this class are
+        processed, the returned port dicts are not extended.
+        """
+        items = [item['port'] for item in ports['ports']]
+        tenant_ids = [self._get_tenant_id_for_create(context, p)
+                      for p in items]
+        indexes_by_network = {}
+        for index, p in enumerate(items):
+            indexes_by_network.setdefault(p['network_id'], []).append(index)
+        macs = [None] * len(items)
+        ips = [[] for p in items]
+
+        with context.session.begin(subtransactions=True):
+            for network_id, indexes in indexes_by_network.iteritems():
+                self._recycle_expired_ip_allocations(context, network_id)
+                network = self._get_network(context, network_id)
+                self._allocate_macs_for_ports(context, network_id,
+                                              items, indexes, macs)
+                self._allocate_ips_for_ports(context, network,
+                                             items, indexes, ips)
+
+            port_rows = []
+            ip_rows = []
+            expiration = self._default_allocation_expiration()
+            for index, p in enumerate(items):
+                port_id = p.get('id') or uuidutils.generate_uuid()
+                port_rows.append({'tenant_id': tenant_ids[index],
+                                  'name': p['name'],
+                                  'id': port_id,
+                                  'network_id': p['network_id'],
+                                  'mac_address': macs[index],
+                                  'admin_state_up': p['admin_state_up'],
+                                  'status': p.get(
+                                      'status', constants.PORT_STATUS_ACTIVE),
+                                  'device_id': p['device_id'],
+                                  'device_owner': p['device_owner']})
+                for ip in ips[index]:
+                    ip_rows.append({'network_id': p['network_id'],
+                                    'port_id': port_id,
+                                    'ip_address': ip['ip_address'],
+                                    'subnet_id': ip['subnet_id'],
+                                    'expiration': expiration})
+            context.session.execute(models_v2.Port.__table__.insert(),
+                                    port_rows)
+            # The ORM events counting the ports are not fired by the insert
+            quota_db.track_inserted(context.session, 'port', tenant_ids)
+            if ip_rows:
+                context.session.execute(
+                    models_v2.IPAllocation.__table__.insert(), ip_rows)
+
+        return [self._make_port_dict(dict(row, fixed_ips=ips[index]),
+                                     process_extensions=False)
+                for index, row in enumerate(port_rows)]
+
+    def _allocate_macs_for_ports(self, context, network_id, items, indexes,
+                                 macs):
+        """Set macs[i] for the ports at indexes with a batched check."""
+        requested = set()
+        for index in indexes:
+            mac_address = items[index]['mac_address']
+            if mac_address is attributes.ATTR_NOT_SPECIFIED:
+                continue
+            if mac_address in requested:
+                raise q_exc.MacAddressInUse(net_id=network_id,
+                                            mac=mac_address)
+            requested.add(mac_address)
+            macs[index] = mac_address
+        for mac_address in mac_allocator.get_macs_in_use(context, network_id,
+                                                         requested):
+            raise q_exc.MacAddressInUse(net_id=network_id, mac=mac_address)
+        missing = [index for index in indexes if macs[index] is None]
+        if missing:
+            generated = self._generate_macs(context, network_id, len(missing),
+                                            exclude=requested)
+            for index, mac_address in zip(missing, generated):
+                macs[index] = mac_address
+
+    def _allocate_ips_for_ports(self, context, network, items, indexes, ips):
+        """Set ips[i] for the ports at indexes on the network.
+
+        Requested fixed IPs are allocated first, so that the addresses
+        generated for the remaining ports in one batch cannot collide.
+        """
+        requested = set()
+        auto = []
+        for index in indexes:
+            fixed_ips = items[index]['fixed_ips']
+            if fixed_ips is attributes.ATTR_NOT_SPECIFIED:
+                auto.append(index)
+                continue
+            configured_ips = self._test_fixed_ips_for_port(context,
+                                                           network['id'],
+                                                           fixed_ips)
+            for fixed in configured_ips:
+                key = (fixed['subnet_id'], fixed.get('ip_address'))
+                if key[1] and key in requested:
+                    raise q_exc.IpAddressInUse(net_id=network['id'],
+                                               ip_address=key[1])
+                requested.add(key)
+            ips[index] = self._allocate_fixed_ips(context, network,
+                                                  configured_ips)
+        if not auto:
+            return
+        subnets = self._get_subnets_by_network(context, network['id'])
+        for ip_version in (4, 6):
+            version_subnets = [subnet for subnet in subnets
+                               if subnet['ip_version'] == ip_version]
+            if not version_subnets:
+                continue
+            generated = self._generate_ips(context, version_subnets,
+                                           len(auto))
+            for index, ip in zip(auto, generated):
+                ips[index].append({'ip_address': ip['ip_address'],
+                                   'subnet_id': ip['subnet_id']})
 
     def create_port(self, context, port):
         p = port['port']
@@ -1379,6 +1432,8 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
                         ip_address=ip['ip_address'], subnet_id=ip['subnet_id'],
                         expiration=self._default_allocation_expiration())
                     context.session.add(allocated)
+                # The allocations were changed behind the relationship
+                context.session.expire(port, ['fixed_ips'])
         # Remove all attributes in p which are not in the port DB model
         # and then update the port
         port.update(self._filter_non_model_columns(p, models_v2.Port))
@@ -1460,6 +1515,7 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
                                       sorts=sorts, limit=limit,
                                       marker_obj=marker_obj,
                                       page_reverse=page_reverse)
+        query = self._eager_load(query, models_v2.Port)
         items = [self._make_port_dict(c, fields) for c in query]
         if limit and page_reverse:
             items.reverse()
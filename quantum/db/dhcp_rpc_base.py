@@ -60,6 +60,35 @@ class DhcpRpcCallbackMixin(object):
         network['ports'] = plugin.get_ports(context, filters=filters)
         return network
 
+    def get_networks_info(self, context, **kwargs):
+        """Retrieve and return the extended information of many networks.
+
+        The subnets and ports of all the networks are retrieved with a
+        single query each. Networks which do not exist are left out.
+        """
+        network_ids = kwargs.get('network_ids', [])
+        host = kwargs.get('host')
+        LOG.debug(_('%(count)d networks requested from %(host)s'),
+                  {'count': len(network_ids), 'host': host})
+        if not network_ids:
+            return []
+        plugin = manager.QuantumManager.get_plugin()
+        networks = plugin.get_networks(context, filters=dict(id=network_ids))
+        networks_by_id = {}
+        for network in networks:
+            network['subnets'] = []
+            network['ports'] = []
+            networks_by_id[network['id']] = network
+
+        filters = dict(network_id=network_ids)
+        for subnet in plugin.get_subnets(context, filters=filters):
+            if subnet['network_id'] in networks_by_id:
+                networks_by_id[subnet['network_id']]['subnets'].append(subnet)
+        for port in plugin.get_ports(context, filters=filters):
+            if port['network_id'] in networks_by_id:
+                networks_by_id[port['network_id']]['ports'].append(port)
+        return networks
+
     def get_dhcp_port(self, context, **kwargs):
         """Allocate a DHCP port for the host and return port information.
 
@@ -191,3 +220,21 @@ class DhcpRpcCallbackMixin(object):
 
         plugin.update_fixed_ip_lease_expiration(context, network_id,
                                                 ip_address, lease_remaining)
+
+    def update_lease_expirations(self, context, **kwargs):
+        """Update the lease expirations gathered by a DHCP agent.
+
+        The leases map network ids to {ip address: lease remaining}.
+        """
+        host = kwargs.get('host')
+        leases = kwargs.get('leases', {})
+
+        plugin = manager.QuantumManager.get_plugin()
+        for network_id, ip_leases in leases.iteritems():
+            LOG.debug(_('Updating %(count)d lease expirations on network '
+                        '%(network_id)s from %(host)s.'),
+                      {'count': len(ip_leases),
+                       'network_id': network_id,
+                       'host': host})
+            plugin.update_fixed_ip_lease_expirations(context, network_id,
+                                                     ip_leases)
@@ -0,0 +1,503 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Pluggable IP address allocation engines for QuantumDbPluginV2.
+
+The engine is selected with the 'ipam_driver' configuration option.  All
+engines operate on the IPAllocationPool/IPAvailabilityRange tables so that
+a deployment can switch between them without a schema migration.
+"""
+
+import bisect
+import random
+import weakref
+
+import netaddr
+from oslo.config import cfg
+from sqlalchemy import event
+from sqlalchemy import orm
+from sqlalchemy.orm import exc
+
+from quantum.common import exceptions as q_exc
+from quantum.db import models_v2
+from quantum.openstack.common import importutils
+from quantum.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+_ALLOCATORS = {}
+
+# (allocator, subnet id) whose cache was changed by each session, evicted
+# when its transaction is rolled back
+_session_changes = weakref.WeakKeyDictionary()
+_change_tracking = False
+
+
+def _forget_changes(session):
+    _session_changes.pop(session, None)
+
+
+def _evict_changes(session):
+    for allocator, subnet_id in _session_changes.pop(session, ()):
+        allocator.forget_subnet(subnet_id)
+
+
+def _track_changes():
+    global _change_tracking
+    if _change_tracking:
+        return
+    event.listen(orm.Session, 'after_commit', _forget_changes)
+    event.listen(orm.Session, 'after_rollback', _evict_changes)
+    _change_tracking = True
+
+
+def get_allocator():
+    """Return the IP allocator configured with 'ipam_driver'."""
+    driver = cfg.CONF.ipam_driver
+    allocator = _ALLOCATORS.get(driver)
+    if allocator is None:
+        allocator = importutils.import_object(driver)
+        _ALLOCATORS[driver] = allocator
+    return allocator
+
+
+class IpAllocator(object):
+    """Base class for IP allocation engines.
+
+    Allocators are invoked within the caller's database transaction.
+    """
+
+    def generate_ips(self, context, subnets, count=1):
+        """Generate count IP addresses from the given subnets.
+
+        Subnets are tried in order.  Returns a list of dicts with the
+        'ip_address' and 'subnet_id' keys.
+
+        :raises: IpAddressGenerationFailure
+        """
+        raise NotImplementedError()
+
+    def allocate_specific_ip(self, context, subnet_id, ip_address):
+        """Remove a specific IP address from the free addresses."""
+        raise NotImplementedError()
+
+    def recycle_ip(self, context, network_id, subnet_id, ip_address):
+        """Return an IP address to the free addresses of the subnet."""
+        raise NotImplementedError()
+
+    def forget_subnet(self, subnet_id):
+        """Drop what is cached about a subnet, e.g. once it is deleted."""
+        pass
+
+    @staticmethod
+    def _get_allocation_pool_id(pools, ip_address):
+        ip = netaddr.IPAddress(ip_address)
+        for pool in pools:
+            if ip in netaddr.IPRange(pool['first_ip'], pool['last_ip']):
+                return pool['id']
+        error_message = _("No allocation pool found for "
+                          "ip address:%s") % ip_address
+        raise q_exc.InvalidInput(error_message=error_message)
+
+
+class AvailabilityRangeAllocator(IpAllocator):
+    """Allocate addresses from the first row of IPAvailabilityRange.
+
+    Every allocation locks the availability range it consumes, which
+    serializes concurrent allocations on a subnet.
+    """
+
+    def generate_ips(self, context, subnets, count=1):
+        range_qry = context.session.query(
+            models_v2.IPAvailabilityRange).join(
+                models_v2.IPAllocationPool).with_lockmode('update')
+        ips = []
+        for subnet in subnets:
+            while len(ips) < count:
+                range = range_qry.filter_by(subnet_id=subnet['id']).first()
+                if not range:
+                    LOG.debug(_("All IP's from subnet %(subnet_id)s "
+                                "(%(cidr)s) allocated"),
+                              {'subnet_id': subnet['id'],
+                               'cidr': subnet['cidr']})
+                    break
+                ip_address = range['first_ip']
+                LOG.debug(_("Allocated IP - %(ip_address)s from %(first_ip)s "
+                            "to %(last_ip)s"),
+                          {'ip_address': ip_address,
+                           'first_ip': range['first_ip'],
+                           'last_ip': range['last_ip']})
+                if range['first_ip'] == range['last_ip']:
+                    # No more free indices on subnet => delete
+                    LOG.debug(_("No more free IP's in slice. Deleting "
+                                "allocation pool."))
+                    context.session.delete(range)
+                else:
+                    # increment the first free
+                    range['first_ip'] = str(netaddr.IPAddress(ip_address) + 1)
+                ips.append({'ip_address': ip_address,
+                            'subnet_id': subnet['id']})
+            if len(ips) == count:
+                return ips
+        raise q_exc.IpAddressGenerationFailure(net_id=subnets[0]['network_id'])
+
+    def allocate_specific_ip(self, context, subnet_id, ip_address):
+        ip = int(netaddr.IPAddress(ip_address))
+        range_qry = context.session.query(
+            models_v2.IPAvailabilityRange,
+            models_v2.IPAllocationPool).join(
+                models_v2.IPAllocationPool).with_lockmode('update')
+        results = range_qry.filter_by(subnet_id=subnet_id)
+        for (range, pool) in results:
+            first = int(netaddr.IPAddress(range['first_ip']))
+            last = int(netaddr.IPAddress(range['last_ip']))
+            if first <= ip <= last:
+                if first == last:
+                    context.session.delete(range)
+                    return
+                elif first == ip:
+                    range['first_ip'] = str(netaddr.IPAddress(ip_address) + 1)
+                    return
+                elif last == ip:
+                    range['last_ip'] = str(netaddr.IPAddress(ip_address) - 1)
+                    return
+                else:
+                    # Split into two ranges
+                    new_first = str(netaddr.IPAddress(ip_address) + 1)
+                    new_last = range['last_ip']
+                    range['last_ip'] = str(netaddr.IPAddress(ip_address) - 1)
+                    ip_range = models_v2.IPAvailabilityRange(
+                        allocation_pool_id=pool['id'],
+                        first_ip=new_first,
+                        last_ip=new_last)
+                    context.session.add(ip_range)
+                    return
+
+    def recycle_ip(self, context, network_id, subnet_id, ip_address):
+        # Grab all allocation pools for the subnet
+        pool_qry = context.session.query(
+            models_v2.IPAllocationPool).with_lockmode('update')
+        allocation_pools = pool_qry.filter_by(subnet_id=subnet_id)
+        # Find the allocation pool for the IP to recycle
+        pool_id = self._get_allocation_pool_id(allocation_pools,
+                                               ip_address)
+        # Two requests will be done on the database. The first will be to
+        # search if an entry starts with ip_address + 1 (r1). The second
+        # will be to see if an entry ends with ip_address -1 (r2).
+        # If 1 of the above holds true then the specific entry will be
+        # modified. If both hold true then the two ranges will be merged.
+        # If there are no entries then a single entry will be added.
+        range_qry = context.session.query(
+            models_v2.IPAvailabilityRange).with_lockmode('update')
+        ip_first = str(netaddr.IPAddress(ip_address) + 1)
+        ip_last = str(netaddr.IPAddress(ip_address) - 1)
+        LOG.debug(_("Recycle %s"), ip_address)
+        try:
+            r1 = range_qry.filter_by(allocation_pool_id=pool_id,
+                                     first_ip=ip_first).one()
+            LOG.debug(_("Recycle: first match for %(first_ip)s-%(last_ip)s"),
+                      {'first_ip': r1['first_ip'], 'last_ip': r1['last_ip']})
+        except exc.NoResultFound:
+            r1 = []
+        try:
+            r2 = range_qry.filter_by(allocation_pool_id=pool_id,
+                                     last_ip=ip_last).one()
+            LOG.debug(_("Recycle: last match for %(first_ip)s-%(last_ip)s"),
+                      {'first_ip': r2['first_ip'], 'last_ip': r2['last_ip']})
+        except exc.NoResultFound:
+            r2 = []
+
+        if r1 and r2:
+            # Merge the two ranges
+            ip_range = models_v2.IPAvailabilityRange(
+                allocation_pool_id=pool_id,
+                first_ip=r2['first_ip'],
+                last_ip=r1['last_ip'])
+            context.session.add(ip_range)
+            LOG.debug(_("Recycle: merged %(first_ip1)s-%(last_ip1)s and "
+                        "%(first_ip2)s-%(last_ip2)s"),
+                      {'first_ip1': r2['first_ip'], 'last_ip1': r2['last_ip'],
+                       'first_ip2': r1['first_ip'], 'last_ip2': r1['last_ip']})
+            context.session.delete(r1)
+            context.session.delete(r2)
+        elif r1:
+            # Update the range with matched first IP
+            r1['first_ip'] = ip_address
+            LOG.debug(_("Recycle: updated first %(first_ip)s-%(last_ip)s"),
+                      {'first_ip': r1['first_ip'], 'last_ip': r1['last_ip']})
+        elif r2:
+            # Update the range with matched last IP
+            r2['last_ip'] = ip_address
+            LOG.debug(_("Recycle: updated last %(first_ip)s-%(last_ip)s"),
+                      {'first_ip': r2['first_ip'], 'last_ip': r2['last_ip']})
+        else:
+            # Create a new range
+            ip_range = models_v2.IPAvailabilityRange(
+                allocation_pool_id=pool_id,
+                first_ip=ip_address,
+                last_ip=ip_address)
+            context.session.add(ip_range)
+            LOG.debug(_("Recycle: created new %(first_ip)s-%(last_ip)s"),
+                      {'first_ip': ip_address, 'last_ip': ip_address})
+
+
+class IPIntervalSet(object):
+    """Sorted set of disjoint free address intervals.
+
+    Each interval mirrors one IPAvailabilityRange row and is stored as
+    (first, last, allocation_pool_id, first_ip, last_ip), where first and
+    last are integers and first_ip/last_ip are the strings stored in the
+    database.  find() bisects on the first address in O(log n); add() and
+    remove() shift a sorted list and pick() scans it, so both are O(n) in
+    the number of free intervals of the subnet.
+    """
+
+    def __init__(self, version=4):
+        self.version = version
+        self.size = 0
+        self._firsts = []
+        self._intervals = {}
+
+    def __len__(self):
+        return len(self._firsts)
+
+    def _str(self, ip):
+        return str(netaddr.IPAddress(ip, self.version))
+
+    def add(self, first, last, pool_id, first_ip=None, last_ip=None):
+        interval = (first, last, pool_id,
+                    first_ip or self._str(first),
+                    last_ip or self._str(last))
+        bisect.insort(self._firsts, first)
+        self._intervals[first] = interval
+        self.size += last - first + 1
+        return interval
+
+    def remove(self, interval):
+        first, last = interval[:2]
+        del self._firsts[bisect.bisect_left(self._firsts, first)]
+        del self._intervals[first]
+        self.size -= last - first + 1
+
+    def find(self, ip):
+        """Return the interval containing ip, or None."""
+        index = bisect.bisect_right(self._firsts, ip) - 1
+        if index < 0:
+            return None
+        interval = self._intervals[self._firsts[index]]
+        if interval[1] < ip:
+            return None
+        return interval
+
+    def starting_at(self, ip):
+        return self._intervals.get(ip)
+
+    def ending_at(self, ip):
+        interval = self.find(ip)
+        if interval and interval[1] == ip:
+            return interval
+
+    def pick(self):
+        """Return a random interval, weighted by its number of addresses."""
+        if not self.size:
+            return None
+        offset = random.randint(0, self.size - 1)
+        for first in self._firsts:
+            interval = self._intervals[first]
+            offset -= interval[1] - first + 1
+            if offset < 0:
+                return interval
+
+
+class IntervalAllocator(IpAllocator):
+    """Allocate addresses from an in-process interval set.
+
+    The free addresses of each subnet are cached in an IPIntervalSet built
+    from the IPAvailabilityRange rows.  Addresses are taken from a random
+    stripe of a random interval, so once a subnet has been split in several
+    ranges concurrent allocations mostly touch different rows instead of all
+    waiting on the lowest free range.  Rows are consumed with a
+    compare-and-delete on their full primary key instead of SELECT ... FOR
+    UPDATE.  The delete still locks the row: a concurrent allocation from
+    the same range, e.g. the single range of a new subnet, waits for the
+    transaction holding it.  When another server consumed the row first the
+    statement matches nothing, the cached set is reloaded and the allocation
+    is retried.
+
+    The cache is changed before the transaction commits; the subnets it
+    changed are evicted when the transaction is rolled back.
+    """
+
+    # Size of the blocks in which large intervals are split.  Bounds the
+    # number of availability ranges created on a busy subnet.
+    STRIPE_SIZE = 64
+    # Attempts after a lost race before giving up on a subnet.
+    MAX_RETRIES = 16
+
+    def __init__(self):
+        self._free = {}
+        self._pools = {}
+        _track_changes()
+
+    def forget_subnet(self, subnet_id):
+        self._free.pop(subnet_id, None)
+        self._pools.pop(subnet_id, None)
+
+    def _changed(self, context, subnet_id):
+        _session_changes.setdefault(context.session, set()).add(
+            (self, subnet_id))
+
+    def _get_pools(self, context, subnet_id):
+        pools = self._pools.get(subnet_id)
+        if pools is None:
+            self._changed(context, subnet_id)
+            Pool = models_v2.IPAllocationPool
+            pool_qry = context.session.query(Pool.id, Pool.first_ip,
+                                             Pool.last_ip)
+            pools = [{'id': id, 'first_ip': first_ip, 'last_ip': last_ip}
+                     for id, first_ip, last_ip in
+                     pool_qry.filter_by(subnet_id=subnet_id)]
+            self._pools[subnet_id] = pools
+        return pools
+
+    def _get_free(self, context, subnet_id, reload=False):
+        # The cache is changed by the callers, or loaded from what may not
+        # be committed yet
+        self._changed(context, subnet_id)
+        free = self._free.get(subnet_id)
+        if free is not None and not reload:
+            return free
+        IPRange = models_v2.IPAvailabilityRange
+        range_qry = context.session.query(
+            IPRange.allocation_pool_id, IPRange.first_ip, IPRange.last_ip)
+        range_qry = range_qry.join(models_v2.IPAllocationPool)
+        free = None
+        for pool_id, first_ip, last_ip in range_qry.filter(
+                models_v2.IPAllocationPool.subnet_id == subnet_id):
+            first = netaddr.IPAddress(first_ip)
+            if free is None:
+                free = IPIntervalSet(first.version)
+            free.add(int(first), int(netaddr.IPAddress(last_ip)), pool_id,
+                     first_ip, last_ip)
+        free = free or IPIntervalSet()
+        self._free[subnet_id] = free
+        return free
+
+    def _take(self, context, free, interval, start, end):
+        """Remove [start, end] from interval, in the database and cache.
+
+        Returns False when the interval was consumed by someone else.
+        """
+        first, last, pool_id, first_ip, last_ip = interval
+        range_qry = context.session.query(models_v2.IPAvailabilityRange)
+        deleted = range_qry.filter_by(allocation_pool_id=pool_id,
+                                      first_ip=first_ip,
+                                      last_ip=last_ip).delete(
+                                          synchronize_session=False)
+        if not deleted:
+            return False
+        free.remove(interval)
+        pieces = []
+        if first < start:
+            pieces.append(free.add(first, start - 1, pool_id, first_ip))
+        if end < last:
+            pieces.append(free.add(end + 1, last, pool_id, None, last_ip))
+        if pieces:
+            context.session.execute(
+                models_v2.IPAvailabilityRange.__table__.insert(),
+                [{'allocation_pool_id': pool_id,
+                  'first_ip': piece[3],
+                  'last_ip': piece[4]} for piece in pieces])
+        return True
+
+    def _pick_start(self, first, last):
+        blocks = (last - first) // self.STRIPE_SIZE
+        return first + self.STRIPE_SIZE * random.randint(0, blocks)
+
+    def _generate_from_subnet(self, context, subnet_id, count):
+        ips = []
+        retries = self.MAX_RETRIES
+        reload = False
+        while len(ips) < count:
+            free = self._get_free(context, subnet_id, reload)
+            interval = free.pick()
+            if interval is None:
+                if reload:
+                    break
+                reload = True
+                continue
+            start = self._pick_start(interval[0], interval[1])
+            end = min(interval[1], start + count - len(ips) - 1)
+            if not self._take(context, free, interval, start, end):
+                retries -= 1
+                if retries < 0:
+                    break
+                reload = True
+                continue
+            reload = False
+            ips.extend(free._str(ip) for ip in xrange(start, end + 1))
+        return ips
+
+    def generate_ips(self, context, subnets, count=1):
+        ips = []
+        for subnet in subnets:
+            for ip_address in self._generate_from_subnet(
+                    context, subnet['id'], count - len(ips)):
+                LOG.debug(_("Allocated IP - %(ip_address)s from subnet "
+                            "%(subnet_id)s"),
+                          {'ip_address': ip_address,
+                           'subnet_id': subnet['id']})
+                ips.append({'ip_address': ip_address,
+                            'subnet_id': subnet['id']})
+            if len(ips) == count:
+                return ips
+        raise q_exc.IpAddressGenerationFailure(net_id=subnets[0]['network_id'])
+
+    def allocate_specific_ip(self, context, subnet_id, ip_address):
+        ip = int(netaddr.IPAddress(ip_address))
+        for reload in (False, True):
+            free = self._get_free(context, subnet_id, reload)
+            interval = free.find(ip)
+            if interval and self._take(context, free, interval, ip, ip):
+                return
+
+    def recycle_ip(self, context, network_id, subnet_id, ip_address):
+        pools = self._get_pools(context, subnet_id)
+        pool_id = self._get_allocation_pool_id(pools, ip_address)
+        LOG.debug(_("Recycle %s"), ip_address)
+        free = self._get_free(context, subnet_id)
+        ip = int(netaddr.IPAddress(ip_address))
+        first, first_ip = ip, ip_address
+        last, last_ip = ip, ip_address
+        # Merge with the adjacent intervals of the same pool when they are
+        # still available; a neighbour consumed concurrently is left alone
+        # and the recycled address simply becomes its own interval.
+        before = free.ending_at(ip - 1)
+        if (before and before[2] == pool_id and
+                self._take(context, free, before, before[0], before[1])):
+            first, first_ip = before[0], before[3]
+        after = free.starting_at(ip + 1)
+        if (after and after[2] == pool_id and
+                self._take(context, free, after, after[0], after[1])):
+            last, last_ip = after[1], after[4]
+        free.add(first, last, pool_id, first_ip, last_ip)
+        context.session.execute(
+            models_v2.IPAvailabilityRange.__table__.insert(),
+            {'allocation_pool_id': pool_id,
+             'first_ip': first_ip,
+             'last_ip': last_ip})
@@ -18,6 +18,7 @@
 #
 
 import netaddr
+from oslo.config import cfg
 import sqlalchemy as sa
 from sqlalchemy import orm
 from sqlalchemy.orm import exc
@@ -43,12 +44,55 @@ DEVICE_OWNER_ROUTER_INTF = l3_constants.DEVICE_OWNER_ROUTER_INTF
 DEVICE_OWNER_ROUTER_GW = l3_constants.DEVICE_OWNER_ROUTER_GW
 DEVICE_OWNER_FLOATINGIP = l3_constants.DEVICE_OWNER_FLOATINGIP
 
+l3_opts = [
+    cfg.BoolOpt('router_floatingip_deltas', default=False,
+                help=_("Notify the L3 agents of the floating IPs changed on "
+                       "a router rather than of all its floating IPs. All "
+                       "the L3 agents must support it")),
+]
+cfg.CONF.register_opts(l3_opts)
+
 # Maps API field to DB column
 # API parameter name and Database column names may differ.
 # Useful to keep the filtering between API and Database.
 API_TO_DB_COLUMN_MAP = {'port_id': 'fixed_port_id'}
 
 
+class RouterRevisions(object):
+    """Revision of the data of each router sent to the L3 agents.
+
+    Every notification bumps the revision of its routers, which lets an
+    agent apply the floating IP changes of a notification on top of the
+    previous revision, or detect that it missed one. The revisions live in
+    the memory of the server; the epoch changes with every process, so that
+    an agent never mixes the revisions of two servers.
+    """
+
+    def __init__(self):
+        self.epoch = uuidutils.generate_uuid()
+        self.revisions = {}
+
+    def get_revisions(self, router_ids=None):
+        if router_ids is None:
+            return dict(self.revisions)
+        return dict((router_id, self.revisions.get(router_id, 0))
+                    for router_id in router_ids)
+
+    def bump(self, router_id):
+        revision = self.revisions.get(router_id, 0) + 1
+        self.revisions[router_id] = revision
+        return revision
+
+    def forget(self, router_id):
+        self.revisions.pop(router_id, None)
+
+    def make_revision(self, revision):
+        return {'epoch': self.epoch, 'revision': revision}
+
+
+ROUTER_REVISIONS = RouterRevisions()
+
+
 class Router(model_base.BASEV2, models_v2.HasId, models_v2.HasTenant):
     """Represents a v2 quantum router."""
 
@@ -117,6 +161,10 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
         _network_filter_hook,
         _network_result_filter_hook)
 
+    # The gateway port is read by _make_router_dict
+    db_base_plugin_v2.QuantumDbPluginV2.register_eager_loads(
+        Router, ['gw_port'])
+
     def _get_router(self, context, id):
         try:
             router = self._get_by_id(context, Router, id)
@@ -175,8 +223,7 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
             # Ensure we actually have something to update
             if r.keys():
                 router_db.update(r)
-        routers = self.get_sync_data(context.elevated(),
-                                     [router_db['id']])
+        routers = self._get_notify_sync_data(context, [router_db['id']])
         l3_rpc_agent_api.L3AgentNotify.routers_updated(context, routers)
         return self._make_router_dict(router_db)
 
@@ -266,6 +313,7 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
                 self._delete_port(context.elevated(), ports[0]['id'])
 
             context.session.delete(router)
+        ROUTER_REVISIONS.forget(id)
         l3_rpc_agent_api.L3AgentNotify.router_deleted(context, id)
 
     def get_router(self, context, id, fields=None):
@@ -371,7 +419,7 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
                  'device_owner': DEVICE_OWNER_ROUTER_INTF,
                  'name': ''}})
 
-        routers = self.get_sync_data(context.elevated(), [router_id])
+        routers = self._get_notify_sync_data(context, [router_id])
         l3_rpc_agent_api.L3AgentNotify.routers_updated(
             context, routers, 'add_router_interface',
             {'network_id': port['network_id'],
@@ -448,7 +496,7 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
             if not found:
                 raise l3.RouterInterfaceNotFoundForSubnet(router_id=router_id,
                                                           subnet_id=subnet_id)
-        routers = self.get_sync_data(context.elevated(), [router_id])
+        routers = self._get_notify_sync_data(context, [router_id])
         l3_rpc_agent_api.L3AgentNotify.routers_updated(
             context, routers, 'remove_router_interface',
             {'network_id': _network_id,
@@ -667,12 +715,13 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
         except Exception:
             LOG.exception(_("Floating IP association failed"))
             raise
+        floatingip_dict = self._make_floatingip_dict(floatingip_db)
         router_id = floatingip_db['router_id']
         if router_id:
-            routers = self.get_sync_data(context.elevated(), [router_id])
-            l3_rpc_agent_api.L3AgentNotify.routers_updated(context, routers,
-                                                           'create_floatingip')
-        return self._make_floatingip_dict(floatingip_db)
+            self._notify_floatingips_changed(
+                context, {router_id: ([floatingip_dict], [])},
+                'create_floatingip')
+        return floatingip_dict
 
     def update_floatingip(self, context, id, floatingip):
         fip = floatingip['floatingip']
@@ -685,17 +734,17 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
             self._update_fip_assoc(context, fip, floatingip_db,
                                    self.get_port(context.elevated(),
                                                  fip_port_id))
-        router_ids = []
+        floatingip_dict = self._make_floatingip_dict(floatingip_db)
+        changes = {}
         if before_router_id:
-            router_ids.append(before_router_id)
+            changes[before_router_id] = ([], [id])
         router_id = floatingip_db['router_id']
-        if router_id and router_id != before_router_id:
-            router_ids.append(router_id)
-        if router_ids:
-            routers = self.get_sync_data(context.elevated(), router_ids)
-            l3_rpc_agent_api.L3AgentNotify.routers_updated(context, routers,
-                                                           'update_floatingip')
-        return self._make_floatingip_dict(floatingip_db)
+        if router_id:
+            changes[router_id] = ([floatingip_dict], [])
+        if changes:
+            self._notify_floatingips_changed(context, changes,
+                                             'update_floatingip')
+        return floatingip_dict
 
     def delete_floatingip(self, context, id):
         floatingip = self._get_floatingip(context, id)
@@ -706,9 +755,8 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
                              floatingip['floating_port_id'],
                              l3_port_check=False)
         if router_id:
-            routers = self.get_sync_data(context.elevated(), [router_id])
-            l3_rpc_agent_api.L3AgentNotify.routers_updated(context, routers,
-                                                           'delete_floatingip')
+            self._notify_floatingips_changed(context, {router_id: ([], [id])},
+                                             'delete_floatingip')
 
     def get_floatingip(self, context, id, fields=None):
         floatingip = self._get_floatingip(context, id)
@@ -751,7 +799,7 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
                                        DEVICE_OWNER_FLOATINGIP]:
             # Raise port in use only if the port has IP addresses
             # Otherwise it's a stale port that can be removed
-            fixed_ips = port_db['fixed_ips'].all()
+            fixed_ips = port_db['fixed_ips']
             if fixed_ips:
                 raise l3.L3PortInUse(port_id=port_id,
                                      device_owner=port_db['device_owner'])
@@ -777,8 +825,8 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
                 raise Exception(_('Multiple floating IPs found for port %s')
                                 % port_id)
         if router_id:
-            routers = self.get_sync_data(context.elevated(), [router_id])
-            l3_rpc_agent_api.L3AgentNotify.routers_updated(context, routers)
+            self._notify_floatingips_changed(
+                context, {router_id: ([], [floating_ip['id']])})
 
     def _check_l3_view_auth(self, context, network):
         return policy.check(context,
@@ -967,8 +1015,16 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
                 router[l3_constants.INTERFACE_KEY] = router_interfaces
         return routers_dict.values()
 
+    def _set_sync_revisions(self, routers, revisions):
+        for router in routers:
+            router[l3_constants.REVISION_KEY] = (
+                ROUTER_REVISIONS.make_revision(
+                    revisions.get(router['id'], 0)))
+
     def get_sync_data(self, context, router_ids=None, active=None):
         """Query routers and their related floating_ips, interfaces."""
+        # read before the data, which is then at least that recent
+        revisions = ROUTER_REVISIONS.get_revisions(router_ids)
         with context.session.begin(subtransactions=True):
             routers = self._get_sync_routers(context,
                                              router_ids=router_ids,
@@ -976,7 +1032,48 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
             router_ids = [router['id'] for router in routers]
             floating_ips = self._get_sync_floating_ips(context, router_ids)
             interfaces = self.get_sync_interfaces(context, router_ids)
-        return self._process_sync_data(routers, interfaces, floating_ips)
+        routers = self._process_sync_data(routers, interfaces, floating_ips)
+        self._set_sync_revisions(routers, revisions)
+        return routers
+
+    def _get_notify_sync_data(self, context, router_ids):
+        """Query the routers of a notification at a new revision."""
+        for router_id in router_ids:
+            ROUTER_REVISIONS.bump(router_id)
+        return self.get_sync_data(context.elevated(), router_ids)
+
+    def _notify_floatingips_changed(self, context, changes, operation=None):
+        """Notify the L3 agents of floating IP changes.
+
+        :param changes: maps router ids to (floating IP dicts associated with
+                        the router, ids of the floating IPs removed from it)
+
+        With router_floatingip_deltas, only the changed floating IPs are
+        sent along with the router and its interfaces.
+        """
+        if not cfg.CONF.router_floatingip_deltas:
+            routers = self._get_notify_sync_data(context, changes.keys())
+            l3_rpc_agent_api.L3AgentNotify.routers_updated(context, routers,
+                                                           operation)
+            return
+        revisions = dict((router_id, ROUTER_REVISIONS.bump(router_id))
+                         for router_id in changes)
+        admin_context = context.elevated()
+        with admin_context.session.begin(subtransactions=True):
+            routers = self._get_sync_routers(admin_context,
+                                             router_ids=changes.keys())
+            router_ids = [router['id'] for router in routers]
+            interfaces = self.get_sync_interfaces(admin_context, router_ids)
+        routers = self._process_sync_data(routers, interfaces, [])
+        self._set_sync_revisions(routers, revisions)
+        for router in routers:
+            updated, removed = changes[router['id']]
+            router[l3_constants.FLOATINGIP_DELTA_KEY] = {
+                'base_revision': revisions[router['id']] - 1,
+                'updated': updated,
+                'removed': removed}
+        l3_rpc_agent_api.L3AgentNotify.routers_updated(context, routers,
+                                                       operation)
 
     def get_external_network_id(self, context):
         nets = self.get_networks(context, {'router:external': [True]})
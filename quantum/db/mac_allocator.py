@@ -0,0 +1,109 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Batched MAC address generation.
+
+Candidate MAC addresses for a whole batch of ports are checked against the
+network with a single query; only the colliding ones are generated again.
+"""
+
+import collections
+import random
+
+from oslo.config import cfg
+
+from quantum.common import exceptions as q_exc
+from quantum.db import models_v2
+from quantum.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+# base_mac -> (set, deque) of the MAC addresses recently generated by this
+# process, see the 'mac_generation_cache_size' option.
+_RESERVED = {}
+
+
+def _random_mac(base_mac):
+    mac = [int(base_mac[0], 16), int(base_mac[1], 16),
+           int(base_mac[2], 16), random.randint(0x00, 0xff),
+           random.randint(0x00, 0xff), random.randint(0x00, 0xff)]
+    if base_mac[3] != '00':
+        mac[3] = int(base_mac[3], 16)
+    return ':'.join(map(lambda x: "%02x" % x, mac))
+
+
+def _reserve(base_mac, macs):
+    cache_size = cfg.CONF.mac_generation_cache_size
+    if cache_size <= 0:
+        return
+    if base_mac not in _RESERVED:
+        _RESERVED[base_mac] = (set(), collections.deque())
+    reserved, order = _RESERVED[base_mac]
+    for mac in macs:
+        if mac not in reserved:
+            reserved.add(mac)
+            order.append(mac)
+    while len(order) > cache_size:
+        reserved.discard(order.popleft())
+
+
+def get_macs_in_use(context, network_id, mac_addresses):
+    """Return the subset of mac_addresses used by ports on the network."""
+    if not mac_addresses:
+        return set()
+    Port = models_v2.Port
+    mac_qry = context.session.query(Port.mac_address)
+    mac_qry = mac_qry.filter(Port.network_id == network_id)
+    mac_qry = mac_qry.filter(Port.mac_address.in_(mac_addresses))
+    return set(mac for mac, in mac_qry)
+
+
+def generate_macs(context, network_id, count, exclude=()):
+    """Generate count MAC addresses unique on the network.
+
+    Each attempt checks all the outstanding candidates with a single query.
+    MAC addresses in exclude are never returned.
+
+    :raises: MacAddressGenerationFailure
+    """
+    base_mac = cfg.CONF.base_mac
+    base = base_mac.split(':')
+    max_retries = cfg.CONF.mac_generation_retries
+    reserved = _RESERVED.get(base_mac, (set(),))[0]
+    macs = set()
+    for i in range(max_retries):
+        needed = count - len(macs)
+        candidates = set(_random_mac(base) for j in range(needed))
+        candidates = set(mac for mac in candidates
+                         if (mac not in macs and mac not in reserved and
+                             mac not in exclude))
+        in_use = get_macs_in_use(context, network_id, candidates)
+        macs |= candidates - in_use
+        if len(macs) == count:
+            LOG.debug(_("Generated %(count)d mac(s) for network "
+                        "%(network_id)s"),
+                      {'count': count, 'network_id': network_id})
+            _reserve(base_mac, macs)
+            return list(macs)
+        LOG.debug(_("%(missing)d generated mac(s) not unique. Remaining "
+                    "attempts %(max_retries)s."),
+                  {'missing': count - len(macs),
+                   'max_retries': max_retries - (i + 1)})
+    LOG.error(_("Unable to generate mac address after %s attempts"),
+              max_retries)
+    raise q_exc.MacAddressGenerationFailure(net_id=network_id)
@@ -15,11 +15,21 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import datetime
+import weakref
+
+from oslo.config import cfg
 import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy import exc as sa_exc
+from sqlalchemy import orm
 
 from quantum.common import exceptions
+from quantum.db import api as db_api
 from quantum.db import model_base
 from quantum.db import models_v2
+from quantum.openstack.common import timeutils
+from quantum.openstack.common import uuidutils
 
 
 class Quota(model_base.BASEV2, models_v2.HasId):
@@ -33,6 +43,112 @@ class Quota(model_base.BASEV2, models_v2.HasId):
     limit = sa.Column(sa.Integer)
 
 
+class QuotaUsage(model_base.BASEV2):
+    """Represent the number of resources of a kind owned by a tenant.
+
+    in_use follows the resources created and deleted through the ORM, a
+    dirty usage is recounted the next time it is needed.
+    """
+    tenant_id = sa.Column(sa.String(255), primary_key=True)
+    resource = sa.Column(sa.String(255), primary_key=True)
+    in_use = sa.Column(sa.Integer, nullable=False, default=0)
+    dirty = sa.Column(sa.Boolean, nullable=False, default=False)
+
+
+class Reservation(model_base.BASEV2, models_v2.HasId):
+    """Represent resources reserved by a request which is creating them."""
+    tenant_id = sa.Column(sa.String(255), index=True)
+    resource = sa.Column(sa.String(255))
+    delta = sa.Column(sa.Integer, nullable=False)
+    expiration = sa.Column(sa.DateTime, nullable=False)
+
+
+# Resources whose usage is kept in QuotaUsage, with the model storing them
+TRACKED_MODELS = {'network': models_v2.Network,
+                  'subnet': models_v2.Subnet,
+                  'port': models_v2.Port}
+
+_usage_tracking = False
+
+# The reservations made with a session, by (tenant_id, resource), which the
+# resources created in the session are taken from
+_session_reservations = weakref.WeakKeyDictionary()
+
+
+def _take_reservation(connection, session, tenant_id, resource, count):
+    reserved = _session_reservations.get(session, {})
+    reservation_id = reserved.get((tenant_id, resource))
+    if not reservation_id:
+        return
+    reservations = Reservation.__table__
+    connection.execute(
+        reservations.update().
+        where(sa.and_(reservations.c.id == reservation_id,
+                      reservations.c.delta > 0)).
+        values(delta=sa.case([(reservations.c.delta > count,
+                               reservations.c.delta - count)],
+                             else_=0)))
+
+
+def _update_usage(connection, session, tenant_id, resource, delta):
+    usages = QuotaUsage.__table__
+    connection.execute(
+        usages.update().
+        where(sa.and_(usages.c.tenant_id == tenant_id,
+                      usages.c.resource == resource)).
+        values(in_use=usages.c.in_use + delta))
+    if delta > 0:
+        # The resources are now counted by their usage, not their reservation
+        _take_reservation(connection, session, tenant_id, resource, delta)
+
+
+def _usage_updater(resource, delta):
+    def update_usage(mapper, connection, target):
+        _update_usage(connection, orm.object_session(target),
+                      target.tenant_id, resource, delta)
+    return update_usage
+
+
+def track_inserted(session, resource, tenant_ids):
+    """Account for resources inserted without the ORM, e.g. in bulk.
+
+    Must be called in the transaction inserting them, with the tenant id of
+    each resource inserted.
+    """
+    if not _usage_tracking:
+        return
+    counts = {}
+    for tenant_id in tenant_ids:
+        counts[tenant_id] = counts.get(tenant_id, 0) + 1
+    connection = session.connection()
+    for tenant_id, count in counts.iteritems():
+        _update_usage(connection, session, tenant_id, resource, count)
+
+
+def _mark_usages_dirty(session, query, query_context, result):
+    # A bulk delete does not tell which tenants owned the deleted rows
+    if not result.rowcount:
+        return
+    usages = QuotaUsage.__table__
+    for description in query.column_descriptions:
+        for resource, model in TRACKED_MODELS.iteritems():
+            if description['type'] is model:
+                session.execute(usages.update().
+                                where(usages.c.resource == resource).
+                                values(dirty=True))
+
+
+def _track_usages():
+    global _usage_tracking
+    if _usage_tracking:
+        return
+    for resource, model in TRACKED_MODELS.iteritems():
+        event.listen(model, 'after_insert', _usage_updater(resource, 1))
+        event.listen(model, 'after_delete', _usage_updater(resource, -1))
+    event.listen(orm.Session, 'after_bulk_delete', _mark_usages_dirty)
+    _usage_tracking = True
+
+
 class DbQuotaDriver(object):
     """Driver to perform necessary checks to enforce quotas and obtain quota
     information.
@@ -179,3 +295,154 @@ class DbQuotaDriver(object):
                  if quotas[key] >= 0 and quotas[key] < val]
         if overs:
             raise exceptions.OverQuota(overs=sorted(overs))
+
+
+class UsageDbQuotaDriver(DbQuotaDriver):
+    """DbQuotaDriver keeping the usage of the resources in the database.
+
+    Instead of counting the resources of the tenant on every create, the
+    requests reserve the resources they create against the usages stored in
+    QuotaUsage, which are only recounted when missing or dirty. Resources
+    without a model in TRACKED_MODELS are counted on every reservation.
+    """
+
+    def __init__(self):
+        _track_usages()
+
+    @staticmethod
+    def _create_usages(context, tenant_id, keys):
+        """Create the missing usages of keys, to be counted once locked.
+
+        Each usage is created with its own session and transaction, so that
+        the duplicate entry inserted by a concurrent first reservation of the
+        tenant does not fail the transaction of the caller.
+        """
+        keys = [key for key in keys if key in TRACKED_MODELS]
+        if not keys:
+            return
+        existing = context.session.query(QuotaUsage.resource).filter_by(
+            tenant_id=tenant_id).filter(QuotaUsage.resource.in_(keys))
+        existing = set(resource for resource, in existing)
+        session = db_api.get_session()
+        for key in keys:
+            if key in existing:
+                continue
+            try:
+                with session.begin():
+                    session.add(QuotaUsage(tenant_id=tenant_id,
+                                           resource=key,
+                                           in_use=0,
+                                           dirty=True))
+            except sa_exc.IntegrityError:
+                # Created by a concurrent request, locked by _get_usages
+                pass
+
+    def _get_usages(self, context, tenant_id, resources, keys,
+                    *args, **kwargs):
+        """Return the resources of keys in use by tenant_id.
+
+        Must be called in a transaction, after _create_usages: the usages
+        are locked until its end. The other arguments are passed to the
+        count functions.
+        """
+        usages = context.session.query(QuotaUsage).filter_by(
+            tenant_id=tenant_id).filter(QuotaUsage.resource.in_(keys))
+        usages = dict((usage.resource, usage)
+                      for usage in usages.with_lockmode('update'))
+        in_use = {}
+        for key in keys:
+            usage = usages.get(key)
+            if key in TRACKED_MODELS and usage and not usage.dirty:
+                in_use[key] = usage.in_use
+                continue
+            in_use[key] = resources[key].count(context, *args, **kwargs)
+            if usage:
+                usage.update({'in_use': in_use[key], 'dirty': False})
+        return in_use
+
+    def make_reservation(self, context, tenant_id, resources, deltas,
+                         *args, **kwargs):
+        """Check and reserve the resources about to be created.
+
+        The usages of tenant_id are locked while the check is made, so
+        that concurrent requests can not both take the last resources of a
+        quota.
+
+        This method will raise a QuotaResourceUnknown exception if a
+        given resource is unknown, and an OverQuota exception with the
+        sorted list of the resources which would go over quota.  The
+        arguments following deltas are passed to the count functions.
+
+        :param context: The request context, for access checks.
+        :param tenant_id: The tenant_id to check the quota.
+        :param resources: A dictionary of the registered resources.
+        :param deltas: A dictionary of the number of resources to reserve.
+        :return: the list of the ids of the reservations made.
+        """
+
+        unders = [key for key, val in deltas.items() if val < 0]
+        if unders:
+            raise exceptions.InvalidQuotaValue(unders=sorted(unders))
+
+        quotas = self._get_quotas(context, tenant_id, resources, deltas.keys())
+
+        now = timeutils.utcnow()
+        expiration = now + datetime.timedelta(
+            seconds=cfg.CONF.QUOTAS.reservation_expire)
+        self._create_usages(context, tenant_id, deltas.keys())
+        with context.session.begin(subtransactions=True):
+            in_use = self._get_usages(context, tenant_id, resources,
+                                      deltas.keys(), *args, **kwargs)
+            # Reservations left over by a failed server expire
+            expired = context.session.query(Reservation).filter(
+                Reservation.tenant_id == tenant_id,
+                Reservation.expiration < now)
+            expired.delete(synchronize_session=False)
+            reserved = context.session.query(
+                Reservation.resource, sa.func.sum(Reservation.delta)).filter(
+                    Reservation.tenant_id == tenant_id,
+                    Reservation.resource.in_(deltas.keys())).group_by(
+                        Reservation.resource)
+            reserved = dict((key, int(total)) for key, total in reserved)
+
+            overs = [key for key, val in deltas.items()
+                     if quotas[key] >= 0 and
+                     quotas[key] < in_use[key] + reserved.get(key, 0) + val]
+            if overs:
+                raise exceptions.OverQuota(overs=sorted(overs))
+
+            reservation_ids = []
+            reserved = _session_reservations.setdefault(context.session, {})
+            for key, val in deltas.items():
+                reservation = Reservation(id=uuidutils.generate_uuid(),
+                                          tenant_id=tenant_id,
+                                          resource=key,
+                                          delta=val,
+                                          expiration=expiration)
+                context.session.add(reservation)
+                reservation_ids.append(reservation.id)
+                reserved[(tenant_id, key)] = reservation.id
+        return reservation_ids
+
+    @staticmethod
+    def _delete_reservations(context, reservation_ids):
+        reserved = _session_reservations.get(context.session, {})
+        for key, reservation_id in reserved.items():
+            if reservation_id in reservation_ids:
+                del reserved[key]
+        with context.session.begin(subtransactions=True):
+            reservations = context.session.query(Reservation).filter(
+                Reservation.id.in_(reservation_ids))
+            reservations.delete(synchronize_session=False)
+
+    def commit_reservation(self, context, reservation_ids):
+        """Release reservations whose resources have been created.
+
+        The usages already account for the resources created, which were
+        taken from the reservations in the transaction creating them.
+        """
+        self._delete_reservations(context, reservation_ids)
+
+    def cancel_reservation(self, context, reservation_ids):
+        """Release reservations whose resources have not been created."""
+        self._delete_reservations(context, reservation_ids)
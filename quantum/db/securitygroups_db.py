@@ -406,6 +406,10 @@ class SecurityGroupDbMixin(ext_sg.SecurityGroupPluginBase):
     db_base_plugin_v2.QuantumDbPluginV2.register_dict_extend_funcs(
         attr.PORTS, [_extend_port_dict_security_group])
 
+    # The rules are read by _make_security_group_dict
+    db_base_plugin_v2.QuantumDbPluginV2.register_eager_loads(
+        SecurityGroup, ['rules'])
+
     def _process_port_create_security_group(self, context, port,
                                             security_group_ids):
         if attr.is_attr_set(security_group_ids):
@@ -16,16 +16,29 @@
 #    under the License.
 
 import netaddr
+from oslo.config import cfg
 
 from quantum.common import constants as q_const
 from quantum.common import utils
+from quantum.db import api as db
 from quantum.db import models_v2
 from quantum.db import securitygroups_db as sg_db
 from quantum.extensions import securitygroup as ext_sg
+from quantum import manager
 from quantum.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
 
+security_group_rpc_opts = [
+    cfg.BoolOpt('security_group_rpc_cache', default=False,
+                help=_("Cache the security group rules, remote group "
+                       "members and DHCP ips served to the agents. Only "
+                       "enable it with a single server process whose plugin "
+                       "notifies every security group change, it is ignored "
+                       "with more than one API worker")),
+]
+cfg.CONF.register_opts(security_group_rpc_opts)
+
 
 IP_MASK = {q_const.IPv4: 32,
            q_const.IPv6: 128}
@@ -35,6 +48,142 @@ DIRECTION_IP_PREFIX = {'ingress': 'source_ip_prefix',
                        'egress': 'dest_ip_prefix'}
 
 
+class SecurityGroupRpcCache(object):
+    """Query results of SecurityGroupServerRpcCallbackMixin.
+
+    Entries are dropped by the same plugin hooks notifying the agents of
+    security group changes, and when their security group or network is
+    deleted. Each invalidation bumps the generation, so that
+    a query racing with an invalidation does not store a stale result.
+    """
+
+    def __init__(self):
+        self.generation = 0
+        # security group id -> rule dicts
+        self.rules = {}
+        # security group id -> member ips
+        self.member_ips = {}
+        # network id -> dhcp port ips
+        self.dhcp_ips = {}
+
+    def lookup(self, store, keys, query):
+        """Return {key: value} for keys, querying the missing ones at once.
+
+        query is called with the list of keys not cached and returns a dict
+        holding a value for each of them.
+        """
+        generation = self.generation
+        result = {}
+        missing = []
+        for key in set(keys):
+            if key in store:
+                result[key] = store[key]
+            else:
+                missing.append(key)
+        if missing:
+            fetched = query(missing)
+            if generation == self.generation:
+                store.update(fetched)
+            result.update(fetched)
+        return result
+
+    def _invalidate(self, store, keys):
+        self.generation += 1
+        for key in keys:
+            store.pop(key, None)
+
+    def invalidate_rules(self, security_group_ids):
+        self._invalidate(self.rules, security_group_ids)
+
+    def invalidate_member_ips(self, security_group_ids):
+        self._invalidate(self.member_ips, security_group_ids)
+
+    def invalidate_dhcp_ips(self, network_ids):
+        self._invalidate(self.dhcp_ips, network_ids)
+
+    def forget_security_groups(self, security_group_ids):
+        self._invalidate(self.rules, security_group_ids)
+        self._invalidate(self.member_ips, security_group_ids)
+
+    def clear(self):
+        self.generation += 1
+        self.rules.clear()
+        self.member_ips.clear()
+        self.dhcp_ips.clear()
+
+
+RPC_CACHE = SecurityGroupRpcCache()
+_rpc_cache_rejected = False
+
+
+def rpc_cache_enabled():
+    """Return whether RPC_CACHE is used.
+
+    The cache is only invalidated in the process changing the security
+    groups, so it is not used when the server forks API workers.
+    """
+    global _rpc_cache_rejected
+    if not cfg.CONF.security_group_rpc_cache:
+        return False
+    # Only registered by the servers able to fork API workers
+    if getattr(cfg.CONF, 'api_workers', 1) > 1:
+        if not _rpc_cache_rejected:
+            LOG.error(_("security_group_rpc_cache is ignored, it can not "
+                        "be used with more than one API worker"))
+            _rpc_cache_rejected = True
+        return False
+    return True
+
+
+def get_ports_with_security_groups(criterion):
+    """Return {port_id: port} of the ports matching criterion.
+
+    The port dicts hold the security groups and fixed ips of the ports as
+    expected by the agents. All the ports are looked up with two queries,
+    whatever their number.
+    """
+    session = db.get_session()
+    sg_binding_port = sg_db.SecurityGroupPortBinding.port_id
+
+    query = session.query(models_v2.Port,
+                          sg_db.SecurityGroupPortBinding.security_group_id)
+    query = query.outerjoin(sg_db.SecurityGroupPortBinding,
+                            models_v2.Port.id == sg_binding_port)
+    query = query.filter(criterion)
+    ports = {}
+    security_groups = {}
+    for port, sg_id in query:
+        ports[port['id']] = port
+        port_sgs = security_groups.setdefault(port['id'], [])
+        if sg_id:
+            port_sgs.append(sg_id)
+    if not ports:
+        return {}
+
+    fixed_ips = dict((port_id, []) for port_id in ports)
+    ip_query = session.query(models_v2.IPAllocation)
+    ip_query = ip_query.filter(
+        models_v2.IPAllocation.port_id.in_(ports.keys()))
+    for ip in ip_query:
+        fixed_ips[ip['port_id']].append(ip)
+
+    plugin = manager.QuantumManager.get_plugin()
+    columns = [column.name for column in models_v2.Port.__table__.columns]
+    port_dicts = {}
+    for port_id, port in ports.iteritems():
+        port_values = dict((column, port[column]) for column in columns)
+        port_values['fixed_ips'] = fixed_ips[port_id]
+        port_dict = plugin._make_port_dict(port_values,
+                                           process_extensions=False)
+        port_dict[ext_sg.SECURITYGROUPS] = security_groups[port_id]
+        port_dict['security_group_rules'] = []
+        port_dict['security_group_source_groups'] = []
+        port_dict['fixed_ips'] = [ip['ip_address']
+                                  for ip in fixed_ips[port_id]]
+        port_dicts[port_id] = port_dict
+    return port_dicts
+
+
 class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
 
     def create_security_group_rule(self, context, security_group_rule):
@@ -42,6 +191,7 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
         rule = self.create_security_group_rule_bulk_native(context,
                                                            bulk_rule)[0]
         sgids = [rule['security_group_id']]
+        RPC_CACHE.invalidate_rules(sgids)
         self.notifier.security_groups_rule_updated(context, sgids)
         return rule
 
@@ -51,13 +201,20 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
                       self).create_security_group_rule_bulk_native(
                           context, security_group_rule)
         sgids = set([r['security_group_id'] for r in rules])
+        RPC_CACHE.invalidate_rules(sgids)
         self.notifier.security_groups_rule_updated(context, list(sgids))
         return rules
 
+    def delete_security_group(self, context, id):
+        super(SecurityGroupServerRpcMixin,
+              self).delete_security_group(context, id)
+        RPC_CACHE.forget_security_groups([id])
+
     def delete_security_group_rule(self, context, sgrid):
         rule = self.get_security_group_rule(context, sgrid)
         super(SecurityGroupServerRpcMixin,
               self).delete_security_group_rule(context, sgrid)
+        RPC_CACHE.invalidate_rules([rule['security_group_id']])
         self.notifier.security_groups_rule_updated(context,
                                                    [rule['security_group_id']])
 
@@ -98,6 +255,9 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
             not utils.compare_elements(
                 original_port.get(ext_sg.SECURITYGROUPS),
                 updated_port.get(ext_sg.SECURITYGROUPS))):
+            # The groups the port left lose a member too
+            RPC_CACHE.invalidate_member_ips(
+                original_port.get(ext_sg.SECURITYGROUPS) or [])
             self.notify_security_groups_member_updated(
                 context, updated_port)
             need_notify = True
@@ -115,11 +275,32 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
         rule in the other RPC call (security_group_rules_for_devices).
         """
         if port['device_owner'] == q_const.DEVICE_OWNER_DHCP:
+            RPC_CACHE.invalidate_dhcp_ips([port['network_id']])
             self.notifier.security_groups_provider_updated(context)
         else:
+            RPC_CACHE.invalidate_member_ips(
+                port.get(ext_sg.SECURITYGROUPS) or [])
             self.notifier.security_groups_member_updated(
                 context, port.get(ext_sg.SECURITYGROUPS))
 
+    def notify_security_groups_member_updated_bulk(self, context, ports):
+        """Notify the updates of many ports with a single event per kind."""
+        network_ids = set()
+        security_group_ids = set()
+        for port in ports:
+            if port['device_owner'] == q_const.DEVICE_OWNER_DHCP:
+                network_ids.add(port['network_id'])
+            else:
+                security_group_ids.update(
+                    port.get(ext_sg.SECURITYGROUPS) or [])
+        if network_ids:
+            RPC_CACHE.invalidate_dhcp_ips(list(network_ids))
+            self.notifier.security_groups_provider_updated(context)
+        if security_group_ids:
+            RPC_CACHE.invalidate_member_ips(list(security_group_ids))
+            self.notifier.security_groups_member_updated(
+                context, list(security_group_ids))
+
 
 class SecurityGroupServerRpcCallbackMixin(object):
     """A mix-in that enable SecurityGroup agent support in plugin
@@ -136,16 +317,63 @@ class SecurityGroupServerRpcCallbackMixin(object):
         :returns: port correspond to the devices with security group rules
         """
         devices = kwargs.get('devices')
+        ports = self._select_ports_for_devices(devices)
+        return self._security_group_rules_for_ports(context, ports)
+
+    def security_group_info_for_devices(self, context, **kwargs):
+        """Return security group rules and remote group members.
+
+        Unlike security_group_rules_for_devices, remote_group_id rules are
+        not converted to ip prefixes: the member ips of the remote groups
+        are returned once, for the agent to match them with ipsets.
+
+        :params devices: list of devices
+        :returns: {'devices': ports with security group rules,
+                   'sg_member_ips': {sg_id: {ethertype: [ip, ...]}}}
+        """
+        devices = kwargs.get('devices')
+        ports = self._select_ports_for_devices(devices)
+        self._add_security_group_rules_to_ports(context, ports)
+        for port in ports.values():
+            source_groups = port['security_group_source_groups']
+            for rule in port['security_group_rules']:
+                remote_group_id = rule.get('remote_group_id')
+                if remote_group_id and remote_group_id not in source_groups:
+                    source_groups.append(remote_group_id)
+        remote_group_ids = self._select_remote_group_ids(ports)
+        return {'devices': ports,
+                'sg_member_ips': self._select_member_ips_for_groups(
+                    context, remote_group_ids)}
+
+    def security_group_members(self, context, **kwargs):
+        """Return the member ips of security groups.
 
+        :params security_groups: list of security group ids
+        :returns: {sg_id: {ethertype: [ip, ...]}}
+        """
+        security_groups = kwargs.get('security_groups', [])
+        return self._select_member_ips_for_groups(context, security_groups)
+
+    def get_ports_from_devices(self, devices):
+        """Return {device: port} for the devices found.
+
+        Plugins should override this to look all the devices up at once,
+        rather than with one get_port_from_device() query per device.
+        """
         ports = {}
         for device in devices:
             port = self.get_port_from_device(device)
-            if not port:
-                continue
+            if port:
+                ports[device] = port
+        return ports
+
+    def _select_ports_for_devices(self, devices):
+        ports = {}
+        for port in self.get_ports_from_devices(devices).values():
             if port['device_owner'].startswith('network:'):
                 continue
             ports[port['id']] = port
-        return self._security_group_rules_for_ports(context, ports)
+        return ports
 
     def _select_rules_for_ports(self, context, ports):
         if not ports:
@@ -163,9 +391,16 @@ class SecurityGroupServerRpcCallbackMixin(object):
         return query.all()
 
     def _select_ips_for_remote_group(self, context, remote_group_ids):
-        ips_by_group = {}
         if not remote_group_ids:
-            return ips_by_group
+            return {}
+        if rpc_cache_enabled():
+            return RPC_CACHE.lookup(
+                RPC_CACHE.member_ips, remote_group_ids,
+                lambda ids: self._query_ips_for_remote_group(context, ids))
+        return self._query_ips_for_remote_group(context, remote_group_ids)
+
+    def _query_ips_for_remote_group(self, context, remote_group_ids):
+        ips_by_group = {}
         for remote_group_id in remote_group_ids:
             ips_by_group[remote_group_id] = []
 
@@ -182,6 +417,17 @@ class SecurityGroupServerRpcCallbackMixin(object):
             ips_by_group[security_group_id].append(ip_address)
         return ips_by_group
 
+    def _select_member_ips_for_groups(self, context, security_group_ids):
+        ips = self._select_ips_for_remote_group(context, security_group_ids)
+        member_ips = {}
+        for security_group_id, group_ips in ips.iteritems():
+            members = {q_const.IPv4: [], q_const.IPv6: []}
+            for ip in group_ips:
+                version = netaddr.IPAddress(ip).version
+                members['IPv%s' % version].append(ip)
+            member_ips[security_group_id] = members
+        return member_ips
+
     def _select_remote_group_ids(self, ports):
         remote_group_ids = []
         for port in ports.values():
@@ -197,6 +443,14 @@ class SecurityGroupServerRpcCallbackMixin(object):
     def _select_dhcp_ips_for_network_ids(self, context, network_ids):
         if not network_ids:
             return {}
+        if rpc_cache_enabled():
+            return RPC_CACHE.lookup(
+                RPC_CACHE.dhcp_ips, network_ids,
+                lambda ids: self._query_dhcp_ips_for_network_ids(context,
+                                                                 ids))
+        return self._query_dhcp_ips_for_network_ids(context, network_ids)
+
+    def _query_dhcp_ips_for_network_ids(self, context, network_ids):
         query = context.session.query(models_v2.Port,
                                       models_v2.IPAllocation.ip_address)
         query = query.join(models_v2.IPAllocation)
@@ -279,24 +533,58 @@ class SecurityGroupServerRpcCallbackMixin(object):
             self._add_ingress_dhcp_rule(port, ips)
 
     def _security_group_rules_for_ports(self, context, ports):
-        rules_in_db = self._select_rules_for_ports(context, ports)
-        for (binding, rule_in_db) in rules_in_db:
-            port_id = binding['port_id']
-            port = ports[port_id]
-            direction = rule_in_db['direction']
-            rule_dict = {
-                'security_group_id': rule_in_db['security_group_id'],
-                'direction': direction,
-                'ethertype': rule_in_db['ethertype'],
-            }
-            for key in ('protocol', 'port_range_min', 'port_range_max',
-                        'remote_ip_prefix', 'remote_group_id'):
-                if rule_in_db.get(key):
-                    if key == 'remote_ip_prefix':
-                        direction_ip_prefix = DIRECTION_IP_PREFIX[direction]
-                        rule_dict[direction_ip_prefix] = rule_in_db[key]
-                        continue
-                    rule_dict[key] = rule_in_db[key]
-            port['security_group_rules'].append(rule_dict)
-        self._apply_provider_rule(context, ports)
+        self._add_security_group_rules_to_ports(context, ports)
         return self._convert_remote_group_id_to_ip_prefix(context, ports)
+
+    def _add_security_group_rules_to_ports(self, context, ports):
+        if rpc_cache_enabled():
+            self._add_cached_security_group_rules_to_ports(context, ports)
+        else:
+            rules_in_db = self._select_rules_for_ports(context, ports)
+            for (binding, rule_in_db) in rules_in_db:
+                port = ports[binding['port_id']]
+                port['security_group_rules'].append(
+                    self._make_rule_dict_for_agent(rule_in_db))
+        self._apply_provider_rule(context, ports)
+
+    def _add_cached_security_group_rules_to_ports(self, context, ports):
+        security_group_ids = set()
+        for port in ports.values():
+            security_group_ids.update(port.get(ext_sg.SECURITYGROUPS) or [])
+        if not security_group_ids:
+            return
+        rules_by_group = RPC_CACHE.lookup(
+            RPC_CACHE.rules, security_group_ids,
+            lambda ids: self._select_rules_for_groups(context, ids))
+        for port in ports.values():
+            for security_group_id in port.get(ext_sg.SECURITYGROUPS) or []:
+                port['security_group_rules'].extend(
+                    dict(rule) for rule in rules_by_group[security_group_id])
+
+    def _select_rules_for_groups(self, context, security_group_ids):
+        rules_by_group = dict((security_group_id, [])
+                              for security_group_id in security_group_ids)
+        sgr_sgid = sg_db.SecurityGroupRule.security_group_id
+        query = context.session.query(sg_db.SecurityGroupRule)
+        query = query.filter(sgr_sgid.in_(security_group_ids))
+        for rule_in_db in query:
+            rules_by_group[rule_in_db['security_group_id']].append(
+                self._make_rule_dict_for_agent(rule_in_db))
+        return rules_by_group
+
+    def _make_rule_dict_for_agent(self, rule_in_db):
+        direction = rule_in_db['direction']
+        rule_dict = {
+            'security_group_id': rule_in_db['security_group_id'],
+            'direction': direction,
+            'ethertype': rule_in_db['ethertype'],
+        }
+        for key in ('protocol', 'port_range_min', 'port_range_max',
+                    'remote_ip_prefix', 'remote_group_id'):
+            if rule_in_db.get(key):
+                if key == 'remote_ip_prefix':
+                    direction_ip_prefix = DIRECTION_IP_PREFIX[direction]
+                    rule_dict[direction_ip_prefix] = rule_in_db[key]
+                    continue
+                rule_dict[key] = rule_in_db[key]
+        return rule_dict
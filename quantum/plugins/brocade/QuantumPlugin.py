@@ -77,10 +77,11 @@ class BridgeRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
                          sg_db_rpc.SecurityGroupServerRpcCallbackMixin):
     """Agent callback."""
 
-    RPC_API_VERSION = '1.1'
+    RPC_API_VERSION = '1.2'
     # Device names start with "tap"
     # history
     #   1.1 Support Security Group RPC
+    #   1.2 Support the security group info and members RPC
     TAP_PREFIX_LEN = 3
 
     def create_rpc_dispatcher(self):
@@ -117,6 +118,25 @@ class BridgeRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
             port['binding:vif_type'] = 'bridge'
         return port
 
+    @classmethod
+    def get_ports_from_devices(cls, devices):
+        """Get the ports of the devices from the brocade specific db."""
+
+        if not devices:
+            return {}
+        session = db.get_session()
+        ports = brocade_db.get_ports_from_devices(
+            session, [device[cls.TAP_PREFIX_LEN:] for device in devices])
+        device_ports = {}
+        for device in devices:
+            port = ports.get(device[cls.TAP_PREFIX_LEN:])
+            if port:
+                port['device'] = device
+                port['device_owner'] = AGENT_OWNER_PREFIX
+                port['binding:vif_type'] = 'bridge'
+                device_ports[device] = port
+        return device_ports
+
     def get_device_details(self, rpc_context, **kwargs):
         """Agent requests device details."""
 
@@ -323,6 +343,7 @@ class BrocadePluginV2(db_base_plugin_v2.QuantumDbPluginV2,
 
         # relinquish vlan in bitmap
         self._vlan_bitmap.release_vlan(int(vlan_id))
+        sg_db_rpc.RPC_CACHE.invalidate_dhcp_ips([net_id])
         return result
 
     def create_port(self, context, port):
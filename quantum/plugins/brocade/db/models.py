@@ -142,6 +142,14 @@ def get_port_from_device(session, port_id):
     return port
 
 
+def get_ports_from_devices(session, port_ids):
+    """get the ports of the tap devices at once."""
+
+    ports = session.query(BrocadePort).filter(
+        BrocadePort.port_id.in_(port_ids))
+    return dict((port.port_id, port) for port in ports)
+
+
 def update_port_state(context, port_id, admin_state_up):
     """Update port attributes."""
 
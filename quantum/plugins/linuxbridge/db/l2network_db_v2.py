@@ -14,12 +14,14 @@
 # limitations under the License.
 
 
+import sqlalchemy as sa
 from sqlalchemy.orm import exc
 
 from quantum.common import exceptions as q_exc
 import quantum.db.api as db
 from quantum.db import models_v2
 from quantum.db import securitygroups_db as sg_db
+from quantum.db import securitygroups_rpc_base as sg_db_rpc
 from quantum import manager
 from quantum.openstack.common import log as logging
 from quantum.plugins.linuxbridge.common import config  # noqa
@@ -229,6 +231,23 @@ def get_port_from_device(device):
     return port_dict
 
 
+def get_ports_from_devices(devices):
+    """Get the ports of the devices, truncated port ids, at once."""
+    LOG.debug(_("get_ports_from_devices() called"))
+    if not devices:
+        return {}
+    ports = sg_db_rpc.get_ports_with_security_groups(
+        sa.or_(*[models_v2.Port.id.startswith(device)
+                 for device in devices]))
+    device_ports = {}
+    for device in devices:
+        for port_id, port in ports.iteritems():
+            if port_id.startswith(device):
+                device_ports[device] = port
+                break
+    return device_ports
+
+
 def set_port_status(port_id, status):
     """Set the port status."""
     LOG.debug(_("set_port_status as %s called"), status)
@@ -55,7 +55,8 @@ class LinuxBridgeRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
 
     # history
     #   1.1 Support Security Group RPC
-    RPC_API_VERSION = '1.1'
+    #   1.2 Support the security group info and members RPC
+    RPC_API_VERSION = '1.2'
     # Device names start with "tap"
     TAP_PREFIX_LEN = 3
 
@@ -75,6 +76,18 @@ class LinuxBridgeRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
             port['device'] = device
         return port
 
+    @classmethod
+    def get_ports_from_devices(cls, devices):
+        ports = db.get_ports_from_devices(
+            [device[cls.TAP_PREFIX_LEN:] for device in devices])
+        device_ports = {}
+        for device in devices:
+            port = ports.get(device[cls.TAP_PREFIX_LEN:])
+            if port:
+                port['device'] = device
+                device_ports[device] = port
+        return device_ports
+
     def get_device_details(self, rpc_context, **kwargs):
         """Agent requests device details."""
         agent_id = kwargs.get('agent_id')
@@ -434,6 +447,7 @@ class LinuxBridgePluginV2(db_base_plugin_v2.QuantumDbPluginV2,
                                    binding.vlan_id, self.network_vlan_ranges)
             # the network_binding record is deleted via cascade from
             # the network record, so explicit removal is not necessary
+        sg_db_rpc.RPC_CACHE.invalidate_dhcp_ips([id])
         self.notifier.network_delete(context, id)
 
     def get_network(self, context, id, fields=None):
@@ -502,6 +516,23 @@ class LinuxBridgePluginV2(db_base_plugin_v2.QuantumDbPluginV2,
         self.notify_security_groups_member_updated(context, port)
         return self._extend_port_dict_binding(context, port)
 
+    def create_port_bulk(self, context, ports):
+        with context.session.begin(subtransactions=True):
+            sgids = []
+            for port in ports['ports']:
+                # Set port status as 'DOWN'. This will be updated by agent
+                port['port']['status'] = q_const.PORT_STATUS_DOWN
+                self._ensure_default_security_group_on_port(context, port)
+                sgids.append(self._get_security_groups_on_port(context,
+                                                               port))
+            created = self._create_port_bulk_db(context, ports)
+            for port, port_sgids in zip(created, sgids):
+                self._process_port_create_security_group(context, port,
+                                                         port_sgids)
+        self.notify_security_groups_member_updated_bulk(context, created)
+        return [self._extend_port_dict_binding(context, port)
+                for port in created]
+
     def update_port(self, context, id, port):
         original_port = self.get_port(context, id)
         session = context.session
@@ -21,6 +21,7 @@ from quantum.db import api as db
 from quantum.db import model_base
 from quantum.db import models_v2
 from quantum.db import securitygroups_db as sg_db
+from quantum.db import securitygroups_rpc_base as sg_db_rpc
 from quantum.extensions import securitygroup as ext_sg
 from quantum import manager
 from quantum.openstack.common import log as logging
@@ -226,3 +227,12 @@ def get_port_from_device(port_id):
     port_dict['fixed_ips'] = [ip['ip_address']
                               for ip in port['fixed_ips']]
     return port_dict
+
+
+def get_ports_from_devices(port_ids):
+    """Get the ports of the devices with their security groups at once."""
+    LOG.debug(_("get_ports_from_devices() called:port_ids=%s"), port_ids)
+    if not port_ids:
+        return {}
+    return sg_db_rpc.get_ports_with_security_groups(
+        models_v2.Port.id.in_(port_ids))
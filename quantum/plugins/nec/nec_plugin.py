@@ -328,6 +328,7 @@ class NECPluginV2(nec_plugin_base.NECPluginV2Base,
                    get_packet_filters(context, filters=filters))
 
         super(NECPluginV2, self).delete_network(context, id)
+        sg_db_rpc.RPC_CACHE.invalidate_dhcp_ips([id])
         try:
             # 'net' parameter is required to lookup old OFC mapping
             self.ofc.delete_ofc_network(context, id, net)
@@ -604,8 +605,9 @@ class NECPluginV2AgentNotifierApi(proxy.RpcProxy,
 
 
 class DhcpRpcCallback(dhcp_rpc_base.DhcpRpcCallbackMixin):
-    # DhcpPluginApi BASE_RPC_API_VERSION
-    RPC_API_VERSION = '1.0'
+    # history
+    #   1.1 Support the bulk network info and lease expirations RPC
+    RPC_API_VERSION = '1.1'
 
 
 class L3RpcCallback(l3_rpc_base.L3RpcCallbackMixin):
@@ -628,6 +630,13 @@ class SecurityGroupServerRpcCallback(
                   {'device': device, 'ret': port})
         return port
 
+    @staticmethod
+    def get_ports_from_devices(devices):
+        ports = ndb.get_ports_from_devices(devices)
+        for device, port in ports.iteritems():
+            port['device'] = device
+        return ports
+
 
 class NECPluginV2RPCCallbacks(object):
 
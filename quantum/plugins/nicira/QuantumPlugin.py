@@ -105,8 +105,9 @@ def create_nvp_cluster(cluster_opts, concurrent_connections,
 
 class NVPRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin):
 
-    # Set RPC API version to 1.0 by default.
-    RPC_API_VERSION = '1.0'
+    # history
+    #   1.1 Support the bulk network info and lease expirations RPC
+    RPC_API_VERSION = '1.1'
 
     def create_rpc_dispatcher(self):
         '''Get the rpc dispatcher for this manager.
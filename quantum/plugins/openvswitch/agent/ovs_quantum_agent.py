@@ -20,6 +20,8 @@
 # @author: Dave Lapsley, Nicira Networks, Inc.
 # @author: Aaron Rosen, Nicira Networks, Inc.
 
+import contextlib
+import signal
 import sys
 import time
 
@@ -28,6 +30,7 @@ from oslo.config import cfg
 
 from quantum.agent.linux import ip_lib
 from quantum.agent.linux import ovs_lib
+from quantum.agent.linux import ovsdb_monitor
 from quantum.agent.linux import utils
 from quantum.agent import rpc as agent_rpc
 from quantum.agent import securitygroups_rpc as sg_rpc
@@ -152,7 +155,8 @@ class OVSQuantumAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin):
 
     def __init__(self, integ_br, tun_br, local_ip,
                  bridge_mappings, root_helper,
-                 polling_interval, enable_tunneling):
+                 polling_interval, enable_tunneling,
+                 use_ovsdb_monitor=False, ovsdb_monitor_resync_interval=60):
         '''Constructor.
 
         :param integ_br: name of the integration bridge.
@@ -162,6 +166,10 @@ class OVSQuantumAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin):
         :param root_helper: utility to use when running shell cmds.
         :param polling_interval: interval (secs) to poll DB.
         :param enable_tunneling: if True enable GRE networks.
+        :param use_ovsdb_monitor: if True detect device changes with
+               ovsdb-client monitor rather than by polling.
+        :param ovsdb_monitor_resync_interval: interval (secs) between the
+               full device listings done when the monitor is used.
         '''
         self.root_helper = root_helper
         self.available_local_vlans = set(
@@ -172,6 +180,11 @@ class OVSQuantumAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin):
         self.local_vlan_map = {}
 
         self.polling_interval = polling_interval
+        self.ovsdb_monitor = None
+        self.ovsdb_monitor_resync_interval = ovsdb_monitor_resync_interval
+        self.last_full_poll = None
+        if use_ovsdb_monitor:
+            self.ovsdb_monitor = ovsdb_monitor.InterfaceMonitor(root_helper)
 
         self.enable_tunneling = enable_tunneling
         self.local_ip = local_ip
@@ -587,7 +600,24 @@ class OVSQuantumAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin):
             int_veth.link.set_up()
             phys_veth.link.set_up()
 
+    def _ovsdb_monitor_usable(self):
+        if self.ovsdb_monitor is None:
+            return False
+        if not self.ovsdb_monitor.is_active():
+            LOG.info(_("Starting ovsdb-client monitor"))
+            self.ovsdb_monitor.start()
+            return False
+        return (self.last_full_poll is not None and
+                time.time() - self.last_full_poll <
+                self.ovsdb_monitor_resync_interval)
+
     def update_ports(self, registered_ports):
+        if self._ovsdb_monitor_usable():
+            added, removed, resync_needed = self.ovsdb_monitor.get_events()
+            if not resync_needed:
+                return self._update_ports_from_events(registered_ports,
+                                                      added, removed)
+        self.last_full_poll = time.time()
         ports = self.int_br.get_vif_port_set()
         if ports == registered_ports:
             return
@@ -597,6 +627,20 @@ class OVSQuantumAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin):
                 'added': added,
                 'removed': removed}
 
+    def _update_ports_from_events(self, registered_ports, added, removed):
+        if added:
+            # The monitor reports the interfaces of every bridge
+            port_names = set(self.int_br.get_port_name_list())
+            added = set(vif_id for name, vif_id in added.iteritems()
+                        if name in port_names)
+            added -= registered_ports
+        removed = removed & registered_ports
+        if not (added or removed):
+            return
+        return {'current': (registered_ports | added) - removed,
+                'added': added,
+                'removed': removed}
+
     def treat_vif_port(self, vif_port, port_id, network_id, network_type,
                        physical_network, segmentation_id, admin_state_up):
         if vif_port:
@@ -661,6 +705,20 @@ class OVSQuantumAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin):
                 self.port_unbound(device)
         return resync
 
+    @contextlib.contextmanager
+    def deferred_flows(self):
+        """Program the flows of all the bridges in batches on exit."""
+        bridges = [self.int_br] + self.phys_brs.values()
+        if self.enable_tunneling:
+            bridges.append(self.tun_br)
+        for bridge in bridges:
+            bridge.defer_apply_on()
+        try:
+            yield
+        finally:
+            for bridge in bridges:
+                bridge.defer_apply_off()
+
     def process_network_ports(self, port_info):
         resync_a = False
         resync_b = False
@@ -697,6 +755,7 @@ class OVSQuantumAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin):
                 if sync:
                     LOG.info(_("Agent out of sync with plugin!"))
                     ports.clear()
+                    self.last_full_poll = None
                     sync = False
 
                 # Notify the plugin of tunnel IP
@@ -710,7 +769,8 @@ class OVSQuantumAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin):
                 if port_info:
                     LOG.debug(_("Agent loop has new devices!"))
                     # If treat devices fails - must resync with plugin
-                    sync = self.process_network_ports(port_info)
+                    with self.deferred_flows():
+                        sync = self.process_network_ports(port_info)
                     ports = port_info['current']
 
             except Exception:
@@ -721,7 +781,11 @@ class OVSQuantumAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin):
             # sleep till end of polling interval
             elapsed = (time.time() - start)
             if (elapsed < self.polling_interval):
-                time.sleep(self.polling_interval - elapsed)
+                if self.ovsdb_monitor and self.ovsdb_monitor.is_active():
+                    # Wake up as soon as a device is plugged
+                    self.ovsdb_monitor.wait(self.polling_interval - elapsed)
+                else:
+                    time.sleep(self.polling_interval - elapsed)
             else:
                 LOG.debug(_("Loop iteration exceeded interval "
                             "(%(polling_interval)s vs. %(elapsed)s)!"),
@@ -729,7 +793,11 @@ class OVSQuantumAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin):
                            'elapsed': elapsed})
 
     def daemon_loop(self):
-        self.rpc_loop()
+        try:
+            self.rpc_loop()
+        finally:
+            if self.ovsdb_monitor:
+                self.ovsdb_monitor.stop()
 
 
 def create_agent_config_map(config):
@@ -751,6 +819,9 @@ def create_agent_config_map(config):
         root_helper=config.AGENT.root_helper,
         polling_interval=config.AGENT.polling_interval,
         enable_tunneling=config.OVS.enable_tunneling,
+        use_ovsdb_monitor=config.AGENT.ovsdb_monitor,
+        ovsdb_monitor_resync_interval=(
+            config.AGENT.ovsdb_monitor_resync_interval),
     )
 
     if kwargs['enable_tunneling'] and not kwargs['local_ip']:
@@ -772,6 +843,8 @@ def main():
         sys.exit(1)
 
     plugin = OVSQuantumAgent(**agent_config)
+    # Let daemon_loop clean up when the agent is stopped
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
     # Start everything.
     LOG.info(_("Agent initialized successfully, now running... "))
@@ -58,6 +58,15 @@ agent_opts = [
     cfg.IntOpt('polling_interval', default=2,
                help=_("The number of seconds the agent will wait between "
                       "polling for local device changes.")),
+    cfg.BoolOpt('ovsdb_monitor', default=False,
+                help=_("Detect local device changes from a long lived "
+                       "ovsdb-client monitor process, instead of listing "
+                       "the ports of the integration bridge every polling "
+                       "interval.")),
+    cfg.IntOpt('ovsdb_monitor_resync_interval', default=60,
+               help=_("The number of seconds between the full listings of "
+                      "the integration bridge ports done as a safety net "
+                      "when ovsdb_monitor is enabled.")),
 ]
 
 
@@ -23,6 +23,7 @@ from quantum.common import exceptions as q_exc
 import quantum.db.api as db
 from quantum.db import models_v2
 from quantum.db import securitygroups_db as sg_db
+from quantum.db import securitygroups_rpc_base as sg_db_rpc
 from quantum.extensions import securitygroup as ext_sg
 from quantum import manager
 from quantum.openstack.common import log as logging
@@ -342,6 +343,18 @@ def get_port_from_device(port_id):
     return port_dict
 
 
+def get_ports_from_devices(port_ids):
+    """Get the ports of the devices with their security groups.
+
+    All the ports are looked up with two queries, whatever their number.
+    """
+    LOG.debug(_("get_ports_from_devices() called:port_ids=%s"), port_ids)
+    if not port_ids:
+        return {}
+    return sg_db_rpc.get_ports_with_security_groups(
+        models_v2.Port.id.in_(port_ids))
+
+
 def set_port_status(port_id, status):
     session = db.get_session()
     try:
@@ -22,6 +22,7 @@ from quantum.common import exceptions as q_exc
 import quantum.db.api as db
 from quantum.db import models_v2
 from quantum.db import securitygroups_db as sg_db
+from quantum.db import securitygroups_rpc_base as sg_db_rpc
 from quantum.extensions import securitygroup as ext_sg
 from quantum import manager
 from quantum.openstack.common import log as logging
@@ -60,6 +61,14 @@ def get_port_from_device(port_id):
     return port_dict
 
 
+def get_ports_from_devices(port_ids):
+    LOG.debug(_("get_ports_from_devices() called:port_ids=%s"), port_ids)
+    if not port_ids:
+        return {}
+    return sg_db_rpc.get_ports_with_security_groups(
+        models_v2.Port.id.in_(port_ids))
+
+
 class TunnelKey(object):
     # VLAN: 12 bits
     # GRE, VXLAN: 24bits
@@ -45,7 +45,8 @@ class HaproxyNSDriver(object):
         pool_id = logical_config['pool']['id']
         namespace = get_ns_name(pool_id)
 
-        self._plug(namespace, logical_config['vip']['port'])
+        with ip_lib.batch(self.root_helper, namespace):
+            self._plug(namespace, logical_config['vip']['port'])
         self._spawn(logical_config)
 
     def update(self, logical_config):
@@ -83,7 +84,8 @@ class HaproxyNSDriver(object):
 
         # unplug the ports
         if pool_id in self.pool_to_port_id:
-            self._unplug(namespace, self.pool_to_port_id[pool_id])
+            with ip_lib.batch(self.root_helper, namespace):
+                self._unplug(namespace, self.pool_to_port_id[pool_id])
 
         # remove the configuration directory
         conf_dir = os.path.dirname(self._get_state_file_path(pool_id, ''))
@@ -19,6 +19,8 @@
 Policy engine for quantum.  Largely copied from nova.
 """
 
+import re
+
 from oslo.config import cfg
 
 from quantum.api.v2 import attributes
@@ -31,6 +33,11 @@ from quantum.openstack.common import policy
 LOG = logging.getLogger(__name__)
 _POLICY_PATH = None
 _POLICY_CACHE = {}
+# (action, explicitly set attributes) -> compiled match rule, valid as long
+# as the rules they were compiled from are loaded
+_COMPILED_RULES = {}
+_COMPILED_FROM = None
+_TARGET_KEY_RE = re.compile(r'%\(([^)]+)\)')
 ADMIN_CTX_POLICY = 'context_is_admin'
 cfg.CONF.import_opt('policy_file', 'quantum.common.config')
 
@@ -38,8 +45,10 @@ cfg.CONF.import_opt('policy_file', 'quantum.common.config')
 def reset():
     global _POLICY_PATH
     global _POLICY_CACHE
+    global _COMPILED_RULES
     _POLICY_PATH = None
     _POLICY_CACHE = {}
+    _COMPILED_RULES = {}
     policy.reset()
 
 
@@ -76,11 +85,13 @@ def _is_attribute_explicitly_set(attribute_name, resource, target):
             target[attribute_name] != resource[attribute_name]['default'])
 
 
-def _build_target(action, original_target, plugin, context):
+def _build_target(action, original_target, plugin, context,
+                  parent_tenant_ids=None):
     """Augment dictionary of target attributes for policy engine.
 
     This routine adds to the dictionary attributes belonging to the
-    "parent" resource of the targeted one.
+    "parent" resource of the targeted one. When parent_tenant_ids is given,
+    the tenant ids of the parents are looked up and cached in it.
     """
     target = original_target.copy()
     resource, _a = get_resource_and_action(action)
@@ -88,15 +99,60 @@ def _build_target(action, original_target, plugin, context):
     if hierarchy_info and plugin:
         # use the 'singular' version of the resource name
         parent_resource = hierarchy_info['parent'][:-1]
-        parent_id = hierarchy_info['identified_by']
-        f = getattr(plugin, 'get_%s' % parent_resource)
-        # f *must* exist, if not found it is better to let quantum explode
-        # Note: we do not use admin context
-        data = f(context, target[parent_id], fields=['tenant_id'])
-        target['%s_tenant_id' % parent_resource] = data['tenant_id']
+        parent_id = target[hierarchy_info['identified_by']]
+        if parent_tenant_ids is not None and parent_id in parent_tenant_ids:
+            tenant_id = parent_tenant_ids[parent_id]
+        else:
+            f = getattr(plugin, 'get_%s' % parent_resource)
+            # f *must* exist, if not found it is better to let quantum
+            # explode
+            # Note: we do not use admin context
+            data = f(context, parent_id, fields=['tenant_id'])
+            tenant_id = data['tenant_id']
+            if parent_tenant_ids is not None:
+                parent_tenant_ids[parent_id] = tenant_id
+        target['%s_tenant_id' % parent_resource] = tenant_id
     return target
 
 
+def _get_parent_tenant_ids(action, targets, plugin, context):
+    """Retrieve the tenant ids of the parents of targets in a single call.
+
+    :returns: a dict mapping parent ids to tenant ids
+    """
+    resource, _a = get_resource_and_action(action)
+    hierarchy_info = attributes.RESOURCE_HIERARCHY_MAP.get(resource, None)
+    if not (hierarchy_info and plugin and targets):
+        return {}
+    parent_ids = set(target.get(hierarchy_info['identified_by'])
+                     for target in targets)
+    parent_ids.discard(None)
+    f = getattr(plugin, 'get_%s' % hierarchy_info['parent'])
+    # Parents which are not visible in this context are left out, and
+    # looked up one at a time by _build_target as before
+    parents = f(context, filters={'id': list(parent_ids)},
+                fields=['id', 'tenant_id'])
+    return dict((parent['id'], parent['tenant_id']) for parent in parents)
+
+
+def _enforced_attributes(action, target):
+    """Return the names of the attributes whose value is checked by action.
+
+    These are the attributes with an 'enforce_policy' flag which are
+    explicitly set by a write action.
+    """
+    resource, is_write = get_resource_and_action(action)
+    res_map = attributes.RESOURCE_ATTRIBUTE_MAP
+    if not is_write or resource not in res_map:
+        return ()
+    return tuple(attribute_name
+                 for attribute_name, attribute in res_map[resource].iteritems()
+                 if ('enforce_policy' in attribute and
+                     _is_attribute_explicitly_set(attribute_name,
+                                                  res_map[resource],
+                                                  target)))
+
+
 def _build_match_rule(action, target):
     """Create the rule to match for a given action.
 
@@ -109,24 +165,86 @@ def _build_match_rule(action, target):
     """
 
     match_rule = policy.RuleCheck('rule', action)
-    resource, is_write = get_resource_and_action(action)
-    if is_write:
-        # assigning to variable with short name for improving readability
-        res_map = attributes.RESOURCE_ATTRIBUTE_MAP
-        if resource in res_map:
-            for attribute_name in res_map[resource]:
-                if _is_attribute_explicitly_set(attribute_name,
-                                                res_map[resource],
-                                                target):
-                    attribute = res_map[resource][attribute_name]
-                    if 'enforce_policy' in attribute and is_write:
-                        attr_rule = policy.RuleCheck('rule', '%s:%s' %
-                                                     (action, attribute_name))
-                        match_rule = policy.AndCheck([match_rule, attr_rule])
+    for attribute_name in _enforced_attributes(action, target):
+        attr_rule = policy.RuleCheck('rule', '%s:%s' %
+                                     (action, attribute_name))
+        match_rule = policy.AndCheck([match_rule, attr_rule])
 
     return match_rule
 
 
+def _compile_check(rule):
+    """Turn a check tree into a single callable.
+
+    The rules referenced by 'rule:' checks are resolved once, and the 'and',
+    'or' and 'not' checks are replaced by closures over their compiled
+    operands.
+
+    :returns: (callable, keys) where keys is the sorted tuple of the target
+              keys the result depends on, or None if it may depend on any.
+    """
+    if isinstance(rule, policy.RuleCheck):
+        try:
+            return _compile_check(policy._rules[rule.match])
+        except (KeyError, TypeError):
+            # No matching rule, or no rules at all; fail closed
+            return policy.FalseCheck(), ()
+    if isinstance(rule, policy.NotCheck):
+        func, keys = _compile_check(rule.rule)
+        return (lambda target, cred: not func(target, cred)), keys
+    if isinstance(rule, (policy.AndCheck, policy.OrCheck)):
+        compiled = [_compile_check(sub_rule) for sub_rule in rule.rules]
+        funcs = [func for func, keys in compiled]
+        if any(keys is None for func, keys in compiled):
+            keys = None
+        else:
+            keys = tuple(sorted(set(key for func, keys in compiled
+                                    for key in keys)))
+        if isinstance(rule, policy.AndCheck):
+            def and_check(target, cred):
+                for func in funcs:
+                    if not func(target, cred):
+                        return False
+                return True
+            return and_check, keys
+
+        def or_check(target, cred):
+            for func in funcs:
+                if func(target, cred):
+                    return True
+            return False
+        return or_check, keys
+    if isinstance(rule, (policy.TrueCheck, policy.FalseCheck,
+                         policy.RoleCheck)):
+        return rule, ()
+    if isinstance(rule, FieldCheck):
+        return rule, (rule.field,)
+    if isinstance(rule, policy.GenericCheck):
+        return rule, tuple(sorted(set(_TARGET_KEY_RE.findall(rule.match))))
+    # e.g. 'http:' checks send the whole target
+    return rule, None
+
+
+def _get_match_rule(action, target):
+    """Return the compiled match rule of action for target.
+
+    :returns: (key, callable, keys) where key identifies the rule and keys
+              are the target keys its result depends on, see _compile_check.
+    """
+    global _COMPILED_RULES
+    global _COMPILED_FROM
+    if _COMPILED_FROM is not policy._rules:
+        # The rules were reloaded
+        _COMPILED_RULES = {}
+        _COMPILED_FROM = policy._rules
+    key = (action, _enforced_attributes(action, target))
+    if key not in _COMPILED_RULES:
+        _COMPILED_RULES[key] = _compile_check(
+            _build_match_rule(action, target))
+    func, keys = _COMPILED_RULES[key]
+    return key, func, keys
+
+
 @policy.register('field')
 class FieldCheck(policy.Check):
     def __init__(self, kind, match):
@@ -179,9 +297,54 @@ def check(context, action, target, plugin=None):
     if target is None:
         target = {}
     real_target = _build_target(action, target, plugin, context)
-    match_rule = _build_match_rule(action, real_target)
+    _key, match_rule, _keys = _get_match_rule(action, real_target)
+    credentials = context.to_dict()
+    return match_rule(real_target, credentials)
+
+
+def check_list(context, action, targets, plugin=None):
+    """Return the targets on which the action is valid in this context.
+
+    Gives the same result as calling check on each target, but retrieves
+    the tenant ids of the parent resources of all the targets at once, and
+    evaluates the rule once for the targets which only differ by values the
+    rule does not look at.
+
+    :param context: quantum context
+    :param action: string representing the action to be checked
+        this should be colon separated for clarity.
+    :param targets: list of dictionaries representing the objects of the
+        action
+    :param plugin: quantum plugin used to retrieve information required
+        for augmenting the targets
+
+    :return: Returns the list of targets on which access is permitted.
+    """
+    init()
+    parent_tenant_ids = _get_parent_tenant_ids(action, targets, plugin,
+                                               context)
     credentials = context.to_dict()
-    return policy.check(match_rule, real_target, credentials)
+    # (rule key, values of the target keys it depends on) -> result
+    results = {}
+    allowed = []
+    for target in targets:
+        real_target = _build_target(action, target, plugin, context,
+                                    parent_tenant_ids)
+        key, match_rule, keys = _get_match_rule(action, real_target)
+        if keys is None:
+            result = match_rule(real_target, credentials)
+        else:
+            key = (key, tuple(real_target.get(k) for k in keys))
+            try:
+                result = results[key]
+            except KeyError:
+                result = results[key] = match_rule(real_target, credentials)
+            except TypeError:
+                # Unhashable target values
+                result = match_rule(real_target, credentials)
+        if result:
+            allowed.append(target)
+    return allowed
 
 
 def enforce(context, action, target, plugin=None):
@@ -204,10 +367,12 @@ def enforce(context, action, target, plugin=None):
     if target is None:
         target = {}
     real_target = _build_target(action, target, plugin, context)
-    match_rule = _build_match_rule(action, real_target)
+    _key, match_rule, _keys = _get_match_rule(action, real_target)
     credentials = context.to_dict()
-    return policy.check(match_rule, real_target, credentials,
-                        exceptions.PolicyNotAuthorized, action=action)
+    result = match_rule(real_target, credentials)
+    if not result:
+        raise exceptions.PolicyNotAuthorized(action=action)
+    return result
 
 
 def check_is_admin(context):
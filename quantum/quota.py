@@ -48,6 +48,10 @@ quota_opts = [
     cfg.StrOpt('quota_driver',
                default='quantum.quota.ConfDriver',
                help=_('Default driver to use for quota checks')),
+    cfg.IntOpt('reservation_expire',
+               default=3600,
+               help=_('Number of seconds until a reservation of resources '
+                      'expires, for drivers keeping the usages')),
 ]
 # Register the configuration options
 cfg.CONF.register_opts(quota_opts, 'QUOTAS')
@@ -280,6 +284,55 @@ class QuotaEngine(object):
         return self._driver.limit_check(context, tenant_id,
                                         self._resources, values)
 
+    def make_reservation(self, context, tenant_id, deltas, *args, **kwargs):
+        """Check that resources may be created for a tenant.
+
+        deltas maps the names of the resources to the number of resources
+        about to be created. The arguments following deltas are passed to
+        the count functions of the resources.
+
+        Drivers keeping the usages of the resources reserve them until the
+        returned reservation is committed or cancelled. With other drivers
+        the resources are counted and checked with limit_check(), and None
+        is returned.
+
+        This method will raise a QuotaResourceUnknown exception if a given
+        resource is unknown, and an OverQuota exception if the resources
+        can not be created.
+
+        :param context: The request context, for access checks.
+        :param tenant_id: The tenant_id to check the quota.
+        :param deltas: A dictionary of the number of resources to create.
+        """
+
+        if hasattr(self._driver, 'make_reservation'):
+            return self._driver.make_reservation(context, tenant_id,
+                                                 self._resources, deltas,
+                                                 *args, **kwargs)
+        values = dict((resource, self.count(context, resource,
+                                            *args, **kwargs) + delta)
+                      for resource, delta in deltas.iteritems())
+        self.limit_check(context, tenant_id, **values)
+
+    def commit_reservation(self, context, reservation):
+        """Release a reservation once its resources are created."""
+        if reservation is None:
+            return
+        try:
+            self._driver.commit_reservation(context, reservation)
+        except Exception:
+            # The resources are created, the reservation expires instead
+            LOG.exception(_("Failed to commit reservation %s"), reservation)
+
+    def cancel_reservation(self, context, reservation):
+        """Release a reservation whose resources were not created."""
+        if reservation is None:
+            return
+        try:
+            self._driver.cancel_reservation(context, reservation)
+        except Exception:
+            LOG.exception(_("Failed to cancel reservation %s"), reservation)
+
     @property
     def resources(self):
         return self._resources
@@ -0,0 +1,179 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Long lived root wrapper, serving commands over a UNIX socket.
+
+The daemon loads the filters once and runs each command it is sent, in its
+own thread, if it is allowed by the same filters as quantum-rootwrap.
+
+A request is a JSON document {"cmd": [...], "stdin": ...} written by the
+client before it shuts down its side of the connection. The daemon replies
+with {"returncode": ..., "stdout": ..., "stderr": ...} and closes the
+connection. Strings are latin-1 decoded, so that any output is kept as is.
+"""
+
+import json
+import os
+import pwd
+import signal
+import socket
+import SocketServer
+import struct
+import subprocess
+
+from quantum.rootwrap import wrapper
+
+
+RC_UNAUTHORIZED = 99
+
+# Not exposed by the socket module of python 2
+SO_PEERCRED = getattr(socket, 'SO_PEERCRED', 17)
+
+
+def _subprocess_setup():
+    # Python installs a SIGPIPE handler by default. This is usually not what
+    # non-Python subprocesses expect.
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+
+def _encode(data):
+    return data.decode('latin-1') if data is not None else None
+
+
+def _decode(data):
+    return data.encode('latin-1') if data is not None else None
+
+
+def _recv_all(sock):
+    chunks = []
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            return ''.join(chunks)
+        chunks.append(chunk)
+
+
+def run_command(filters, userargs, process_input=None):
+    """Run userargs if allowed by filters.
+
+    :returns: (returncode, stdout, stderr)
+    """
+    filtermatch = wrapper.match_filter(filters, userargs)
+    if not filtermatch:
+        return (RC_UNAUTHORIZED, '',
+                'Unauthorized command: %s\n' % ' '.join(userargs))
+    obj = subprocess.Popen(filtermatch.get_command(userargs),
+                           stdin=subprocess.PIPE,
+                           stdout=subprocess.PIPE,
+                           stderr=subprocess.PIPE,
+                           preexec_fn=_subprocess_setup,
+                           close_fds=True,
+                           env=filtermatch.get_environment(userargs))
+    stdout, stderr = obj.communicate(process_input)
+    return obj.returncode, stdout, stderr
+
+
+class RootwrapRequestHandler(SocketServer.BaseRequestHandler):
+
+    def handle(self):
+        request = json.loads(_recv_all(self.request))
+        userargs = [str(arg) for arg in request['cmd']]
+        try:
+            returncode, stdout, stderr = run_command(
+                self.server.filters, userargs, _decode(request.get('stdin')))
+        except OSError as e:
+            returncode, stdout, stderr = (1, '', 'Unable to run %s: %s\n' %
+                                          (' '.join(userargs), e))
+        self.request.sendall(json.dumps({'returncode': returncode,
+                                         'stdout': _encode(stdout),
+                                         'stderr': _encode(stderr)}))
+
+
+class RootwrapServer(SocketServer.ThreadingMixIn,
+                     SocketServer.UnixStreamServer):
+    """Serve the commands of the clients running as allowed_uid."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, filters, allowed_uid, allowed_gid):
+        self.filters = filters
+        self.allowed_uid = allowed_uid
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        # Nobody else may connect before the socket is given to allowed_uid
+        old_umask = os.umask(0177)
+        try:
+            SocketServer.UnixStreamServer.__init__(self, socket_path,
+                                                   RootwrapRequestHandler)
+        finally:
+            os.umask(old_umask)
+        os.chown(socket_path, allowed_uid, allowed_gid)
+
+    def verify_request(self, request, client_address):
+        creds = request.getsockopt(socket.SOL_SOCKET, SO_PEERCRED,
+                                   struct.calcsize('3i'))
+        pid, uid, gid = struct.unpack('3i', creds)
+        return uid in (0, self.allowed_uid)
+
+
+def execute(socket_path, userargs, process_input=None):
+    """Run a command with the daemon listening on socket_path.
+
+    :returns: (returncode, stdout, stderr)
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps({'cmd': userargs,
+                                 'stdin': _encode(process_input)}))
+        sock.shutdown(socket.SHUT_WR)
+        response = json.loads(_recv_all(sock))
+    finally:
+        sock.close()
+    return (response['returncode'], _decode(response['stdout']),
+            _decode(response['stderr']))
+
+
+def get_allowed_ids(user=None):
+    """Return the (uid, gid) of the user allowed to use the daemon.
+
+    Without user, it is the user which started the daemon with sudo, and
+    None is returned when the daemon was not started with sudo. KeyError
+    is raised for an unknown user.
+    """
+    if user:
+        entry = pwd.getpwnam(user)
+        return entry.pw_uid, entry.pw_gid
+    if 'SUDO_UID' not in os.environ:
+        return None
+    return (int(os.environ['SUDO_UID']),
+            int(os.environ.get('SUDO_GID', os.getgid())))
+
+
+def serve(socket_path, filters_path, allowed_uid, allowed_gid,
+          filters_cache=None):
+    """Serve the commands of allowed_uid until killed."""
+    filters = wrapper.load_filters(filters_path, filters_cache)
+    socket_dir = os.path.dirname(socket_path)
+    if not os.path.isdir(socket_dir):
+        os.makedirs(socket_dir, 0755)
+    server = RootwrapServer(socket_path, filters, allowed_uid, allowed_gid)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
@@ -32,6 +32,13 @@ class CommandFilter(object):
         """Only check that the first argument (command) matches exec_path."""
         return os.path.basename(self.exec_path) == userargs[0]
 
+    def get_exec_name(self):
+        """Returns the first argument of the commands matched by the filter.
+
+        None means that the filter has to be checked for any command.
+        """
+        return os.path.basename(self.exec_path)
+
     def get_command(self, userargs):
         """Returns command to execute (with sudo -u if run_as != root)."""
         if (self.run_as != 'root'):
@@ -52,25 +59,33 @@ class ExecCommandFilter(CommandFilter):
 class RegExpFilter(CommandFilter):
     """Command filter doing regexp matching for every argument."""
 
+    def __init__(self, exec_path, run_as, *args):
+        super(RegExpFilter, self).__init__(exec_path, run_as, *args)
+        try:
+            # Anchoring pattern explicitly at end of string
+            self.patterns = [re.compile(pattern + '$') for pattern in args]
+        except re.error:
+            # DENY: Badly-formed filter
+            self.patterns = None
+
     def match(self, userargs):
         # Early skip if command or number of args don't match
-        if (len(self.args) != len(userargs)):
+        if self.patterns is None or len(self.patterns) != len(userargs):
             # DENY: argument numbers don't match
             return False
-        # Compare each arg (anchoring pattern explicitly at end of string)
-        for (pattern, arg) in zip(self.args, userargs):
-            try:
-                if not re.match(pattern + '$', arg):
-                    break
-            except re.error:
-                # DENY: Badly-formed filter
+        # Compare each arg
+        for (pattern, arg) in zip(self.patterns, userargs):
+            if not pattern.match(arg):
+                # DENY: Some arguments did not match
                 return False
-        else:
-            # ALLOW: All arguments matched
-            return True
+        # ALLOW: All arguments matched
+        return True
 
-        # DENY: Some arguments did not match
-        return False
+    def get_exec_name(self):
+        # Only a literal command pattern can be used as index
+        if self.args and re.match(r'[\w-]+$', self.args[0]):
+            return self.args[0]
+        return None
 
 
 class DnsmasqFilter(CommandFilter):
@@ -99,6 +114,10 @@ class DnsmasqFilter(CommandFilter):
     def get_command(self, userargs):
         return [self.exec_path] + userargs[3:]
 
+    def get_exec_name(self):
+        # Commands start with environment variables
+        return None
+
     def get_environment(self, userargs):
         env = os.environ.copy()
         env['QUANTUM_RELAY_SOCKET_PATH'] = userargs[0].split('=')[-1]
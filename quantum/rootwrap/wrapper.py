@@ -17,8 +17,11 @@
 
 
 import ConfigParser
+import json
 import os
+import stat
 import string
+import tempfile
 
 # this import has the effect of defining global var "filters",
 # referenced by build_filter(), below.  It gets set up by
@@ -26,6 +29,52 @@ import string
 from quantum.rootwrap import filters
 
 
+class FilterList(object):
+    """Filters in priority order, indexed by the command they match."""
+
+    def __init__(self, filter_list):
+        self.filters = list(filter_list)
+        # command name -> positions of the filters matching it
+        self._by_name = {}
+        # positions of the filters which may match any command
+        self._any_name = []
+        for position, f in enumerate(self.filters):
+            name = f.get_exec_name()
+            if name is None:
+                self._any_name.append(position)
+            else:
+                self._by_name.setdefault(name, []).append(position)
+        self._candidates = {}
+        self._leaf_filters = None
+
+    def __iter__(self):
+        return iter(self.filters)
+
+    def __len__(self):
+        return len(self.filters)
+
+    def __getitem__(self, index):
+        return self.filters[index]
+
+    def candidates(self, userargs):
+        """Returns the filters which may match userargs, in order."""
+        name = userargs[0] if userargs else None
+        if name not in self._by_name:
+            return [self.filters[i] for i in self._any_name]
+        if name not in self._candidates:
+            positions = sorted(self._by_name[name] + self._any_name)
+            self._candidates[name] = [self.filters[i] for i in positions]
+        return self._candidates[name]
+
+    def leaf_filters(self):
+        """Returns the filters which do not run another command."""
+        if self._leaf_filters is None:
+            self._leaf_filters = FilterList(
+                f for f in self.filters
+                if not isinstance(f, filters.ExecCommandFilter))
+        return self._leaf_filters
+
+
 def build_filter(class_name, *args):
     """Returns a filter object of class class_name."""
     if not hasattr(filters, class_name):
@@ -35,22 +84,82 @@ def build_filter(class_name, *args):
     return filterclass(*args)
 
 
-def load_filters(filters_path):
-    """Load filters from a list of directories."""
-    filterlist = []
+def _filter_files(filters_path):
+    """Returns (path, mtime, size) of the filter files, in loading order."""
+    filter_files = []
     for filterdir in filters_path:
         if not os.path.isdir(filterdir):
             continue
         for filterfile in os.listdir(filterdir):
-            filterconfig = ConfigParser.RawConfigParser()
-            filterconfig.read(os.path.join(filterdir, filterfile))
-            for (name, value) in filterconfig.items("Filters"):
-                filterdefinition = [string.strip(s) for s in value.split(',')]
-                newfilter = build_filter(*filterdefinition)
-                if newfilter is None:
-                    continue
-                filterlist.append(newfilter)
-    return filterlist
+            path = os.path.join(filterdir, filterfile)
+            file_stat = os.stat(path)
+            filter_files.append([path, file_stat.st_mtime,
+                                 file_stat.st_size])
+    return filter_files
+
+
+def _parse_filter_files(filter_files):
+    definitions = []
+    for path, mtime, size in filter_files:
+        filterconfig = ConfigParser.RawConfigParser()
+        filterconfig.read(path)
+        for (name, value) in filterconfig.items("Filters"):
+            definitions.append([string.strip(s) for s in value.split(',')])
+    return definitions
+
+
+def _read_cache(cache_path, filter_files):
+    try:
+        cache_stat = os.stat(cache_path)
+        # Only trust a cache which can not be written by another user
+        if (cache_stat.st_uid not in (0, os.geteuid()) or
+                cache_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH)):
+            return None
+        with open(cache_path) as cache_file:
+            cache = json.load(cache_file)
+    except (IOError, OSError, ValueError):
+        return None
+    if cache.get('files') != filter_files:
+        return None
+    return [[arg.encode('utf-8') for arg in definition]
+            for definition in cache['definitions']]
+
+
+def _write_cache(cache_path, filter_files, definitions):
+    cache_dir = os.path.dirname(os.path.abspath(cache_path))
+    try:
+        with tempfile.NamedTemporaryFile('w', dir=cache_dir,
+                                         delete=False) as cache_file:
+            json.dump({'files': filter_files, 'definitions': definitions},
+                      cache_file)
+        os.chmod(cache_file.name, 0644)
+        os.rename(cache_file.name, cache_path)
+    except (IOError, OSError):
+        # The cache is only an optimization
+        pass
+
+
+def load_filters(filters_path, cache_path=None):
+    """Load filters from a list of directories.
+
+    The filter definitions parsed are saved in cache_path, if set, and read
+    back as long as no filter file was added, removed or modified.
+    """
+    filter_files = _filter_files(filters_path)
+    definitions = None
+    if cache_path:
+        definitions = _read_cache(cache_path, filter_files)
+    if definitions is None:
+        definitions = _parse_filter_files(filter_files)
+        if cache_path:
+            _write_cache(cache_path, filter_files, definitions)
+    filterlist = []
+    for filterdefinition in definitions:
+        newfilter = build_filter(*filterdefinition)
+        if newfilter is None:
+            continue
+        filterlist.append(newfilter)
+    return FilterList(filterlist)
 
 
 def match_filter(filter_list, userargs):
@@ -60,17 +169,17 @@ def match_filter(filter_list, userargs):
     """
 
     found_filter = None
+    if not isinstance(filter_list, FilterList):
+        filter_list = FilterList(filter_list)
 
-    for f in filter_list:
+    for f in filter_list.candidates(userargs):
         if f.match(userargs):
             if isinstance(f, filters.ExecCommandFilter):
                 # This command calls exec verify that remaining args
                 # matches another filter.
-                leaf_filters = [fltr for fltr in filter_list
-                                if not isinstance(fltr,
-                                                  filters.ExecCommandFilter)]
                 args = f.exec_args(userargs)
-                if not args or not match_filter(leaf_filters, args):
+                if not args or not match_filter(filter_list.leaf_filters(),
+                                                args):
                     continue
 
             # Try other filters if executable is absent
@@ -0,0 +1,111 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure IptablesManager._modify_rules on large iptables-save dumps.
+
+Replays the filter table of a compute node hosting many security group
+enabled ports, growing up to --lines lines, and reports the merge time per
+dump line, which stays flat when the merge is linear:
+
+    python -m quantum.tests.benchmarks.bench_iptables --lines 50000
+"""
+
+import time
+
+from oslo.config import cfg
+
+from quantum.agent.linux import iptables_manager
+
+
+cli_opts = [
+    cfg.IntOpt('lines', default=50000,
+               help=_('Number of lines of the largest iptables-save dump')),
+    cfg.IntOpt('steps', default=4,
+               help=_('Number of dump sizes, halving from --lines')),
+    cfg.IntOpt('top-rules', default=1000,
+               help=_('Number of rules added with top=True')),
+    cfg.IntOpt('repeat', default=3,
+               help=_('Number of merges per dump size')),
+]
+
+PORT_RULES = ['-m state --state INVALID -j DROP',
+              '-m state --state RELATED,ESTABLISHED -j RETURN',
+              '-s 10.0.0.1/32 -p udp -m udp --sport 67 --dport 68 -j RETURN',
+              '-p tcp -m tcp --dport 22 -j RETURN',
+              '-p icmp -j RETURN',
+              '-j $sg-fallback']
+
+
+def _port_chains(index):
+    port = '%08x-%02x' % (index, index % 256)
+    return ['i' + port, 'o' + port]
+
+
+def build(lines, top_rules):
+    """Return the dump lines and the table applied on top of them."""
+    bn = iptables_manager.binary_name
+    manager = iptables_manager.IptablesManager(state_less=True)
+    table = manager.ipv4['filter']
+    table.add_chain('sg-fallback')
+    table.add_rule('sg-fallback', '-j DROP')
+    declarations = ['*filter',
+                    ':INPUT ACCEPT [0:0]',
+                    ':FORWARD ACCEPT [0:0]',
+                    ':OUTPUT ACCEPT [0:0]',
+                    ':%s-sg-fallback - [0:0]' % bn]
+    dump_rules = ['-A %s-sg-fallback -j DROP' % bn]
+    index = 0
+    while len(declarations) + len(dump_rules) < lines:
+        for chain in _port_chains(index):
+            table.add_chain(chain)
+            declarations.append(':%s-%s - [0:0]' % (bn, chain))
+            # Chains of other components sharing the table
+            declarations.append(':nova-compute-%s - [0:0]' % chain)
+            for rule in PORT_RULES:
+                table.add_rule(chain, rule)
+                wrapped = rule.replace('$', '%s-' % bn)
+                dump_rules.append('-A %s-%s %s' % (bn, chain, wrapped))
+                dump_rules.append('-A nova-compute-%s %s' %
+                                  (chain, rule.replace('$', 'nova-')))
+        index += 1
+    for i in range(top_rules):
+        rule = '-s 10.%d.%d.0/24 -j ACCEPT' % (i // 256, i % 256)
+        table.add_rule('FORWARD', rule, wrap=False, top=True)
+        dump_rules.append('-A FORWARD %s' % rule)
+    dump = declarations + dump_rules + ['COMMIT', '']
+    return dump, table, manager
+
+
+def main():
+    cfg.CONF.register_cli_opts(cli_opts)
+    cfg.CONF(project='quantum')
+    conf = cfg.CONF
+    sizes = [conf.lines >> i for i in reversed(range(conf.steps))]
+    for size in sizes:
+        dump, table, manager = build(size, conf.top_rules)
+        elapsed = 0
+        for i in range(conf.repeat):
+            start = time.time()
+            manager._modify_rules(dump, table)
+            elapsed += time.time() - start
+        elapsed /= conf.repeat
+        print('%7d lines %8.3f sec %6.2f usec/line' %
+              (len(dump), elapsed, elapsed * 1e6 / len(dump)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Measure the time for the L3 agent to converge after a full sync.
+
+Each router is configured by waiting --router-latency seconds, which stands
+for the ip and iptables commands it runs, so the result measures how the
+agent schedules the routers rather than the commands themselves. Reports
+the time until the last router is configured, for each number of workers:
+
+    python -m quantum.tests.benchmarks.bench_l3_agent --routers 800
+"""
+
+import time
+
+import eventlet
+from oslo.config import cfg
+
+from quantum.agent.common import config as agent_config
+from quantum.agent import l3_agent
+from quantum.agent.linux import interface
+from quantum.openstack.common import uuidutils
+
+
+cli_opts = [
+    cfg.IntOpt('routers', default=800,
+               help=_('Number of routers synced')),
+    cfg.FloatOpt('router-latency', default=0.05,
+                 help=_('Seconds spent configuring each router')),
+    cfg.ListOpt('workers', default=['1', '8', '32'],
+                help=_('Numbers of router processing workers to compare')),
+]
+
+
+class BenchL3NATAgent(l3_agent.L3NATAgent):
+
+    def _destroy_router_namespaces(self, only_router_id=None):
+        pass
+
+    def _fetch_external_net_id(self):
+        return None
+
+    def _router_added(self, router_id, router):
+        self.router_info[router_id] = l3_agent.RouterInfo(
+            router_id, self.root_helper, self.conf.use_namespaces, router)
+
+    def process_router(self, ri):
+        eventlet.sleep(self.conf.router_latency)
+
+
+def main():
+    conf = cfg.CONF
+    conf.register_cli_opts(cli_opts)
+    conf.register_opts(l3_agent.L3NATAgent.OPTS)
+    agent_config.register_root_helper(conf)
+    conf.register_opts(interface.OPTS)
+    conf(project='quantum')
+    conf.set_override('interface_driver',
+                      'quantum.agent.linux.interface.NullDriver')
+    conf.set_override('external_network_bridge', '')
+    routers = [{'id': uuidutils.generate_uuid(),
+                'admin_state_up': True,
+                'external_gateway_info': {}} for i in range(conf.routers)]
+    for workers in conf.workers:
+        conf.set_override('router_processing_workers', int(workers))
+        agent = BenchL3NATAgent('bench', conf)
+        start = time.time()
+        agent._process_routers(routers, all_routers=True)
+        print('%3s workers %8.3f sec to converge %d routers' %
+              (workers, time.time() - start, conf.routers))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Measure process_router on a router with many floating IPs.
+
+The commands run by the agent are replaced by a no-op, so the result is the
+time spent by the agent bookkeeping and building the iptables rules. Reports
+the time to add all the floating IPs, remap some of them, process the router
+unchanged and remove all of them:
+
+    python -m quantum.tests.benchmarks.bench_l3_floatingips --floating-ips 5000
+"""
+
+import time
+
+import netaddr
+from oslo.config import cfg
+
+from quantum.agent.common import config as agent_config
+from quantum.agent import l3_agent
+from quantum.agent.linux import interface
+from quantum.agent.linux import utils
+from quantum.common import constants as l3_constants
+from quantum.openstack.common import uuidutils
+
+
+cli_opts = [
+    cfg.IntOpt('floating-ips', default=5000,
+               help=_('Number of floating IPs of the router')),
+    cfg.IntOpt('remapped', default=50,
+               help=_('Number of floating IPs remapped to another fixed IP')),
+]
+
+
+class BenchL3NATAgent(l3_agent.L3NATAgent):
+
+    def _destroy_router_namespaces(self, only_router_id=None):
+        pass
+
+    def _fetch_external_net_id(self):
+        return None
+
+
+def _execute(*args, **kwargs):
+    return ''
+
+
+def _port(cidr, ip_address):
+    return {'id': uuidutils.generate_uuid(),
+            'network_id': uuidutils.generate_uuid(),
+            'admin_state_up': True,
+            'mac_address': 'fa:16:3e:00:00:01',
+            'fixed_ips': [{'ip_address': ip_address,
+                           'subnet_id': uuidutils.generate_uuid()}],
+            'subnet': {'cidr': cidr,
+                       'gateway_ip': str(netaddr.IPNetwork(cidr)[1])}}
+
+
+def _floating_ips(count):
+    floating_net = netaddr.IPNetwork('172.16.0.0/12')
+    fixed_net = netaddr.IPNetwork('10.0.0.0/8')
+    return [{'id': uuidutils.generate_uuid(),
+             'floating_ip_address': str(floating_net[i + 10]),
+             'fixed_ip_address': str(fixed_net[i + 10]),
+             'port_id': uuidutils.generate_uuid()} for i in range(count)]
+
+
+def main():
+    conf = cfg.CONF
+    conf.register_cli_opts(cli_opts)
+    conf.register_opts(l3_agent.L3NATAgent.OPTS)
+    agent_config.register_root_helper(conf)
+    conf.register_opts(interface.OPTS)
+    conf(project='quantum')
+    conf.set_override('interface_driver',
+                      'quantum.agent.linux.interface.NullDriver')
+    conf.set_override('external_network_bridge', '')
+    conf.set_override('send_arp_for_ha', 0)
+    utils.execute = _execute
+
+    agent = BenchL3NATAgent('bench', conf)
+    floating_ips = _floating_ips(conf.floating_ips)
+    router = {'id': uuidutils.generate_uuid(),
+              'routes': [],
+              'gw_port': _port('172.16.0.0/12', '172.16.0.2'),
+              l3_constants.INTERFACE_KEY: [_port('10.0.0.0/8', '10.0.0.1')],
+              l3_constants.FLOATINGIP_KEY: floating_ips}
+    ri = l3_agent.RouterInfo(router['id'], agent.root_helper,
+                             conf.use_namespaces, router)
+
+    remapped = [dict(fip, fixed_ip_address='192.168.%d.%d' %
+                     divmod(i + 1, 256))
+                for i, fip in enumerate(floating_ips[:conf.remapped])]
+    steps = (('add', floating_ips),
+             ('remap', remapped + floating_ips[conf.remapped:]),
+             ('unchanged', None),
+             ('remove', []))
+    for name, fips in steps:
+        if fips is not None:
+            router[l3_constants.FLOATINGIP_KEY] = fips
+        start = time.time()
+        agent.process_router(ri)
+        print('%-10s %8.3f sec for %d floating IPs' %
+              (name, time.time() - start, conf.floating_ips))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Measure the flow programming of an OVS agent resync.
+
+Programs the flows the OVS agent installs for --networks VLAN networks of
+--ports ports each on a scratch bridge, once flow by flow and once with the
+flows deferred, and reports the time to program them all. Needs Open
+vSwitch and root privileges:
+
+    python -m quantum.tests.benchmarks.bench_ovs_flows --networks 500
+"""
+
+import time
+
+from oslo.config import cfg
+
+from quantum.agent.linux import ovs_lib
+
+
+cli_opts = [
+    cfg.StrOpt('bridge', default='br-bench',
+               help=_('Name of the scratch bridge, reset by the benchmark')),
+    cfg.StrOpt('root-helper', default='sudo',
+               help=_('Root helper used to run ovs-vsctl and ovs-ofctl')),
+    cfg.IntOpt('networks', default=500,
+               help=_('Number of networks provisioned')),
+    cfg.IntOpt('ports', default=2,
+               help=_('Number of ports bound per network')),
+]
+
+
+def resync(bridge, networks, ports):
+    """Replay the flows of provision_local_vlan and port_bound."""
+    for lvid in range(1, networks + 1):
+        bridge.add_flow(priority=4, in_port=1, dl_vlan=lvid,
+                        actions="mod_vlan_vid:%s,normal" % (lvid + 1000))
+        bridge.add_flow(priority=3, in_port=2, dl_vlan=lvid + 1000,
+                        actions="mod_vlan_vid:%s,normal" % lvid)
+        for i in range(ports):
+            ofport = 10 + (lvid * ports + i) % 60000
+            bridge.add_flow(priority=2, in_port=ofport, actions="drop")
+            bridge.delete_flows(in_port=ofport)
+
+
+def main():
+    cfg.CONF.register_cli_opts(cli_opts)
+    cfg.CONF(project='quantum')
+    conf = cfg.CONF
+    bridge = ovs_lib.OVSBridge(conf.bridge, conf.root_helper)
+    bridge.reset_bridge()
+    try:
+        results = {}
+        for name in ('per flow', 'deferred'):
+            bridge.remove_all_flows()
+            start = time.time()
+            if name == 'deferred':
+                with bridge.deferred():
+                    resync(bridge, conf.networks, conf.ports)
+            else:
+                resync(bridge, conf.networks, conf.ports)
+            results[name] = time.time() - start
+            print('%-10s %8.3f sec for %d networks, %d flows installed' %
+                  (name, results[name], conf.networks, bridge.count_flows()))
+        print('speedup    %8.1fx' %
+              (results['per flow'] / results['deferred']))
+    finally:
+        bridge.run_vsctl(["--", "--if-exists", "del-br", conf.bridge])
+
+
+if __name__ == '__main__':
+    main()
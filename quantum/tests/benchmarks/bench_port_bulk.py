@@ -0,0 +1,117 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare bulk port creation one port at a time and vectorized.
+
+    python -m quantum.tests.benchmarks.bench_port_bulk --ports 500
+"""
+
+import os
+import tempfile
+import time
+
+from oslo.config import cfg
+
+from quantum.api.v2 import attributes
+from quantum.common import config  # noqa
+from quantum import context
+from quantum.db import api as db
+from quantum.db import db_base_plugin_v2
+
+
+cli_opts = [
+    cfg.StrOpt('connection',
+               help=_('SQLAlchemy connection string of the benchmark '
+                      'database')),
+    cfg.IntOpt('ports', default=500,
+               help=_('Number of ports in each bulk request')),
+    cfg.IntOpt('repeat', default=3,
+               help=_('Number of bulk requests per code path')),
+]
+
+
+def _ports_request(network_id, count):
+    return {'ports': [{'port': {'network_id': network_id,
+                                'tenant_id': 'bench',
+                                'name': 'bench-%d' % i,
+                                'admin_state_up': True,
+                                'mac_address': attributes.ATTR_NOT_SPECIFIED,
+                                'fixed_ips': attributes.ATTR_NOT_SPECIFIED,
+                                'device_id': '',
+                                'device_owner': ''}}
+                      for i in range(count)]}
+
+
+def _setup_network(plugin, ctx):
+    network = plugin.create_network(
+        ctx, {'network': {'name': 'bench', 'admin_state_up': True,
+                          'shared': False, 'tenant_id': 'bench'}})
+    plugin.create_subnet(
+        ctx, {'subnet': {'network_id': network['id'],
+                         'tenant_id': 'bench',
+                         'name': 'bench',
+                         'cidr': '10.0.0.0/16',
+                         'ip_version': 4,
+                         'enable_dhcp': True,
+                         'gateway_ip': attributes.ATTR_NOT_SPECIFIED,
+                         'allocation_pools': attributes.ATTR_NOT_SPECIFIED,
+                         'dns_nameservers': attributes.ATTR_NOT_SPECIFIED,
+                         'host_routes': attributes.ATTR_NOT_SPECIFIED}})
+    return network['id']
+
+
+def main():
+    cfg.CONF.register_cli_opts(cli_opts)
+    cfg.CONF(project='quantum')
+    conf = cfg.CONF
+    db_file = None
+    connection = conf.connection
+    if not connection:
+        fd, db_file = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        connection = 'sqlite:///%s' % db_file
+    cfg.CONF.set_override('sql_connection', connection, 'DATABASE')
+    db.configure_db()
+    try:
+        plugin = db_base_plugin_v2.QuantumDbPluginV2()
+        ctx = context.get_admin_context()
+        network_id = _setup_network(plugin, ctx)
+        paths = (('per port', lambda ports:
+                  plugin._create_bulk('port', ctx, ports)),
+                 ('vectorized', lambda ports:
+                  plugin.create_port_bulk(ctx, ports)))
+        results = {}
+        for name, create in paths:
+            elapsed = 0
+            for i in range(conf.repeat):
+                ports = _ports_request(network_id, conf.ports)
+                start = time.time()
+                create(ports)
+                elapsed += time.time() - start
+            results[name] = elapsed / conf.repeat
+            print('%-12s %8.3f sec per %d ports' %
+                  (name, results[name], conf.ports))
+        print('speedup      %8.1fx' %
+              (results['per port'] / results['vectorized']))
+    finally:
+        db.clear_db()
+        if db_file:
+            os.unlink(db_file)
+
+
+if __name__ == '__main__':
+    main()
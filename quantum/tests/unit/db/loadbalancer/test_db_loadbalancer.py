@@ -496,7 +496,7 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
             for k, v in keys:
                 self.assertEqual(res['vips'][0][k], v)
 
-    def test_list_vips_with_sort_emulated(self):
+    def test_list_vips_with_sort(self):
         with self.subnet() as subnet:
             with contextlib.nested(
                 self.vip(name='vip1', subnet=subnet, protocol_port=81),
@@ -509,7 +509,7 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
                     [('protocol_port', 'asc'), ('name', 'desc')]
                 )
 
-    def test_list_vips_with_pagination_emulated(self):
+    def test_list_vips_with_pagination(self):
         with self.subnet() as subnet:
             with contextlib.nested(self.vip(name='vip1', subnet=subnet),
                                    self.vip(name='vip2', subnet=subnet),
@@ -519,7 +519,7 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
                                                 (vip1, vip2, vip3),
                                                 ('name', 'asc'), 2, 2)
 
-    def test_list_vips_with_pagination_reverse_emulated(self):
+    def test_list_vips_with_pagination_reverse(self):
         with self.subnet() as subnet:
             with contextlib.nested(self.vip(name='vip1', subnet=subnet),
                                    self.vip(name='vip2', subnet=subnet),
@@ -611,7 +611,7 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
             for k, v in keys:
                 self.assertEqual(res['pool'][k], v)
 
-    def test_list_pools_with_sort_emulated(self):
+    def test_list_pools_with_sort(self):
         with contextlib.nested(self.pool(name='p1'),
                                self.pool(name='p2'),
                                self.pool(name='p3')
@@ -619,7 +619,7 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
             self._test_list_with_sort('pool', (p3, p2, p1),
                                       [('name', 'desc')])
 
-    def test_list_pools_with_pagination_emulated(self):
+    def test_list_pools_with_pagination(self):
         with contextlib.nested(self.pool(name='p1'),
                                self.pool(name='p2'),
                                self.pool(name='p3')
@@ -628,7 +628,7 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
                                             (p1, p2, p3),
                                             ('name', 'asc'), 2, 2)
 
-    def test_list_pools_with_pagination_reverse_emulated(self):
+    def test_list_pools_with_pagination_reverse(self):
         with contextlib.nested(self.pool(name='p1'),
                                self.pool(name='p2'),
                                self.pool(name='p3')
@@ -759,7 +759,7 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
                 for k, v in keys:
                     self.assertEqual(res['member'][k], v)
 
-    def test_list_members_with_sort_emulated(self):
+    def test_list_members_with_sort(self):
         with self.pool() as pool:
             with contextlib.nested(self.member(pool_id=pool['pool']['id'],
                                                protocol_port=81),
@@ -771,7 +771,7 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
                 self._test_list_with_sort('member', (m3, m2, m1),
                                           [('protocol_port', 'desc')])
 
-    def test_list_members_with_pagination_emulated(self):
+    def test_list_members_with_pagination(self):
         with self.pool() as pool:
             with contextlib.nested(self.member(pool_id=pool['pool']['id'],
                                                protocol_port=81),
@@ -784,7 +784,7 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
                     'member', (m1, m2, m3), ('protocol_port', 'asc'), 2, 2
                 )
 
-    def test_list_members_with_pagination_reverse_emulated(self):
+    def test_list_members_with_pagination_reverse(self):
         with self.pool() as pool:
             with contextlib.nested(self.member(pool_id=pool['pool']['id'],
                                                protocol_port=81),
@@ -888,7 +888,7 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
             for k, v in keys:
                 self.assertEqual(res['health_monitor'][k], v)
 
-    def test_list_healthmonitors_with_sort_emulated(self):
+    def test_list_healthmonitors_with_sort(self):
         with contextlib.nested(self.health_monitor(delay=30),
                                self.health_monitor(delay=31),
                                self.health_monitor(delay=32)
@@ -896,7 +896,7 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
             self._test_list_with_sort('health_monitor', (m3, m2, m1),
                                       [('delay', 'desc')])
 
-    def test_list_healthmonitors_with_pagination_emulated(self):
+    def test_list_healthmonitors_with_pagination(self):
         with contextlib.nested(self.health_monitor(delay=30),
                                self.health_monitor(delay=31),
                                self.health_monitor(delay=32)
@@ -905,7 +905,7 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
                                             (m1, m2, m3),
                                             ('delay', 'asc'), 2, 2)
 
-    def test_list_healthmonitors_with_pagination_reverse_emulated(self):
+    def test_list_healthmonitors_with_pagination_reverse(self):
         with contextlib.nested(self.health_monitor(delay=30),
                                self.health_monitor(delay=31),
                                self.health_monitor(delay=32)
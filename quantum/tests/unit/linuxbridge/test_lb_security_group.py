@@ -93,6 +93,33 @@ class TestLinuxBridgeSecurityGroupsDB(LinuxBridgeSecurityGroupsTestCase):
                                      port_dict['fixed_ips'])
                     self._delete('ports', port['port']['id'])
 
+    def test_security_group_get_ports_from_devices(self):
+        with self.network() as n:
+            with self.subnet(n):
+                with self.security_group() as sg:
+                    security_group_id = sg['security_group']['id']
+                    res1 = self._create_port(
+                        self.fmt, n['network']['id'],
+                        security_groups=[security_group_id])
+                    port1 = self.deserialize(self.fmt, res1)['port']
+                    res2 = self._create_port(self.fmt, n['network']['id'])
+                    port2 = self.deserialize(self.fmt, res2)['port']
+                    devices = [port1['id'][:8], port2['id'][:8],
+                               'bad_device_id']
+                    ports = lb_db.get_ports_from_devices(devices)
+                    self.assertEqual(sorted(ports.keys()),
+                                     sorted(devices[:2]))
+                    port_dict = ports[devices[0]]
+                    self.assertEqual(port1['id'], port_dict['id'])
+                    self.assertEqual([security_group_id],
+                                     port_dict[ext_sg.SECURITYGROUPS])
+                    self.assertEqual(
+                        [ip['ip_address'] for ip in port1['fixed_ips']],
+                        port_dict['fixed_ips'])
+                    self.assertEqual(port2['id'], ports[devices[1]]['id'])
+                    self._delete('ports', port1['id'])
+                    self._delete('ports', port2['id'])
+
     def test_security_group_get_port_from_device_with_no_port(self):
         port_dict = lb_db.get_port_from_device('bad_device_id')
         self.assertEqual(None, port_dict)
@@ -13,6 +13,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
+
+import mock
+
+from quantum.db import db_base_plugin_v2
 from quantum.extensions import portbindings
 from quantum.tests.unit import _test_extension_portbindings as test_bindings
 from quantum.tests.unit import test_db_plugin as test_plugin
@@ -47,6 +52,20 @@ class TestOpenvswitchPortsV2(test_plugin.TestPortsV2,
             self.assertEqual(port['port']['status'], 'DOWN')
             self.assertEqual(self.port_create_status, 'DOWN')
 
+    def test_create_ports_bulk_not_one_at_a_time(self):
+        base_plugin = db_base_plugin_v2.QuantumDbPluginV2
+        with contextlib.nested(
+            self.network(),
+            mock.patch.object(base_plugin, 'create_port')
+        ) as (net, create_port):
+            res = self._create_port_bulk(self.fmt, 2, net['network']['id'],
+                                         'test', True)
+            ports = self.deserialize(self.fmt, res)['ports']
+            self.assertFalse(create_port.called)
+            for p in ports:
+                self.assertEqual(p['status'], 'DOWN')
+                self._delete('ports', p['id'])
+
 
 class TestOpenvswitchNetworksV2(test_plugin.TestNetworksV2,
                                 OpenvswitchPluginV2TestCase):
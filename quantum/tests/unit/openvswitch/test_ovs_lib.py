@@ -15,9 +15,11 @@
 #    under the License.
 # @author: Dan Wendlandt, Nicira, Inc.
 
+import eventlet
 import mox
 
 from quantum.agent.linux import ovs_lib, utils
+from quantum.openstack.common import jsonutils
 from quantum.openstack.common import uuidutils
 from quantum.tests import base
 
@@ -131,6 +133,80 @@ class OVS_Lib_Test(base.BaseTestCase):
                          (vid, ofport))
         self.mox.VerifyAll()
 
+    def test_deferred_flows(self):
+        ofport = "5"
+        utils.execute(["ovs-ofctl", "add-flow", self.BR_NAME, "-"],
+                      process_input="hard_timeout=0,idle_timeout=0,"
+                      "priority=2,in_port=%s,actions=drop\n"
+                      "hard_timeout=0,idle_timeout=0,"
+                      "priority=1,actions=normal\n" % ofport,
+                      root_helper=self.root_helper)
+        utils.execute(["ovs-ofctl", "del-flows", self.BR_NAME, "-"],
+                      process_input="in_port=%s\n" % ofport,
+                      root_helper=self.root_helper)
+        utils.execute(["ovs-ofctl", "add-flow", self.BR_NAME, "-"],
+                      process_input="hard_timeout=0,idle_timeout=0,"
+                      "priority=2,actions=drop\n",
+                      root_helper=self.root_helper)
+        self.mox.ReplayAll()
+
+        with self.br.deferred():
+            self.br.add_flow(priority=2, in_port=ofport, actions="drop")
+            self.br.add_flow(priority=1, actions="normal")
+            self.br.delete_flows(in_port=ofport)
+            self.br.add_flow(priority=2, actions="drop")
+        self.assertEqual(self.br.deferred_flows, {})
+        self.mox.VerifyAll()
+
+    def test_deferred_flows_other_greenthread_not_deferred(self):
+        utils.execute(["ovs-ofctl", "add-flow", self.BR_NAME,
+                       "hard_timeout=0,idle_timeout=0,"
+                       "priority=2,actions=drop"],
+                      root_helper=self.root_helper)
+        utils.execute(["ovs-ofctl", "add-flow", self.BR_NAME, "-"],
+                      process_input="hard_timeout=0,idle_timeout=0,"
+                      "priority=1,actions=normal\n",
+                      root_helper=self.root_helper)
+        self.mox.ReplayAll()
+
+        with self.br.deferred():
+            self.br.add_flow(priority=1, actions="normal")
+            eventlet.spawn(self.br.add_flow, priority=2,
+                           actions="drop").wait()
+        self.mox.VerifyAll()
+
+    def test_deferred_flows_batch_failure_applies_one_at_a_time(self):
+        utils.execute(["ovs-ofctl", "add-flow", self.BR_NAME, "-"],
+                      process_input="hard_timeout=0,idle_timeout=0,"
+                      "priority=1,actions=bad\n"
+                      "hard_timeout=0,idle_timeout=0,"
+                      "priority=1,actions=normal\n",
+                      root_helper=self.root_helper).AndRaise(RuntimeError())
+        utils.execute(["ovs-ofctl", "add-flow", self.BR_NAME,
+                       "hard_timeout=0,idle_timeout=0,"
+                       "priority=1,actions=bad"],
+                      root_helper=self.root_helper).AndRaise(RuntimeError())
+        utils.execute(["ovs-ofctl", "add-flow", self.BR_NAME,
+                       "hard_timeout=0,idle_timeout=0,"
+                       "priority=1,actions=normal"],
+                      root_helper=self.root_helper)
+        self.mox.ReplayAll()
+
+        with self.br.deferred():
+            self.br.add_flow(priority=1, actions="bad")
+            self.br.add_flow(priority=1, actions="normal")
+        self.mox.VerifyAll()
+
+    def test_remove_all_flows_drops_deferred_flows(self):
+        utils.execute(["ovs-ofctl", "del-flows", self.BR_NAME],
+                      root_helper=self.root_helper)
+        self.mox.ReplayAll()
+
+        with self.br.deferred():
+            self.br.add_flow(priority=1, actions="normal")
+            self.br.remove_all_flows()
+        self.mox.VerifyAll()
+
     def test_get_port_ofport(self):
         pname = "tap99"
         ofport = "6"
@@ -225,9 +301,15 @@ class OVS_Lib_Test(base.BaseTestCase):
         self.assertEqual(self.br.add_patch_port(pname, peer), ofport)
         self.mox.VerifyAll()
 
+    def _interfaces_json(self, *rows):
+        return jsonutils.dumps(
+            {'headings': ['name', 'ofport', 'external_ids'],
+             'data': [[name, ofport, ['map', sorted(ids.items())]]
+                      for name, ofport, ids in rows]})
+
     def _test_get_vif_ports(self, is_xen=False):
         pname = "tap99"
-        ofport = "6"
+        ofport = 6
         vif_id = uuidutils.generate_uuid()
         mac = "ca:fe:de:ad:be:ef"
 
@@ -235,18 +317,19 @@ class OVS_Lib_Test(base.BaseTestCase):
                       root_helper=self.root_helper).AndReturn("%s\n" % pname)
 
         if is_xen:
-            external_ids = ('{xs-vif-uuid="%s", attached-mac="%s"}'
-                            % (vif_id, mac))
+            external_ids = {'xs-vif-uuid': vif_id, 'attached-mac': mac}
         else:
-            external_ids = ('{iface-id="%s", attached-mac="%s"}'
-                            % (vif_id, mac))
-
-        utils.execute(["ovs-vsctl", self.TO, "get",
-                       "Interface", pname, "external_ids"],
-                      root_helper=self.root_helper).AndReturn(external_ids)
-        utils.execute(["ovs-vsctl", self.TO, "get",
-                       "Interface", pname, "ofport"],
-                      root_helper=self.root_helper).AndReturn(ofport)
+            external_ids = {'iface-id': vif_id, 'attached-mac': mac}
+        # Interfaces of other bridges and without VIF are skipped
+        output = self._interfaces_json(
+            (pname, ofport, external_ids),
+            ("tap-other-br", 7, {'iface-id': 'other', 'attached-mac': mac}),
+            ("patch-tun", 1, {}))
+
+        utils.execute(["ovs-vsctl", self.TO, "--format=json", "--",
+                       "--columns=name,ofport,external_ids",
+                       "list", "Interface"],
+                      root_helper=self.root_helper).AndReturn(output)
         if is_xen:
             utils.execute(["xe", "vif-param-get", "param-name=other-config",
                            "param-key=nicira-iface-id", "uuid=" + vif_id],
@@ -268,6 +351,60 @@ class OVS_Lib_Test(base.BaseTestCase):
     def test_get_vif_ports_xen(self):
         self._test_get_vif_ports(True)
 
+    def test_get_vif_port_set(self):
+        mac = "ca:fe:de:ad:be:ef"
+        utils.execute(["ovs-vsctl", self.TO, "list-ports", self.BR_NAME],
+                      root_helper=self.root_helper).AndReturn("tap1\ntap2\n")
+        output = self._interfaces_json(
+            ("tap1", 1, {'iface-id': 'vif1', 'attached-mac': mac}),
+            ("tap2", ['set', []], {'iface-id': 'vif2', 'attached-mac': mac}))
+        utils.execute(["ovs-vsctl", self.TO, "--format=json", "--",
+                       "--columns=name,ofport,external_ids",
+                       "list", "Interface"],
+                      root_helper=self.root_helper).AndReturn(output)
+        self.mox.ReplayAll()
+
+        self.assertEqual(self.br.get_vif_port_set(), set(['vif1', 'vif2']))
+        self.mox.VerifyAll()
+
+    def test_get_vif_port_set_no_ports(self):
+        utils.execute(["ovs-vsctl", self.TO, "list-ports", self.BR_NAME],
+                      root_helper=self.root_helper).AndReturn("")
+        self.mox.ReplayAll()
+
+        self.assertEqual(self.br.get_vif_port_set(), set())
+        self.mox.VerifyAll()
+
+    def test_get_vif_port_by_id(self):
+        vif_id = uuidutils.generate_uuid()
+        mac = "ca:fe:de:ad:be:ef"
+        output = self._interfaces_json(
+            ("tap99", 6, {'iface-id': vif_id, 'attached-mac': mac}))
+        utils.execute(["ovs-vsctl", self.TO, "--format=json", "--",
+                       "--columns=name,ofport,external_ids",
+                       "find", "Interface",
+                       'external_ids:iface-id="%s"' % vif_id],
+                      root_helper=self.root_helper).AndReturn(output)
+        self.mox.ReplayAll()
+
+        port = self.br.get_vif_port_by_id(vif_id)
+        self.assertEqual(port.port_name, "tap99")
+        self.assertEqual(port.ofport, 6)
+        self.assertEqual(port.vif_id, vif_id)
+        self.assertEqual(port.vif_mac, mac)
+        self.mox.VerifyAll()
+
+    def test_get_vif_port_by_id_not_found(self):
+        utils.execute(["ovs-vsctl", self.TO, "--format=json", "--",
+                       "--columns=name,ofport,external_ids",
+                       "find", "Interface", 'external_ids:iface-id="vif"'],
+                      root_helper=self.root_helper).AndReturn(
+                          self._interfaces_json())
+        self.mox.ReplayAll()
+
+        self.assertIsNone(self.br.get_vif_port_by_id("vif"))
+        self.mox.VerifyAll()
+
     def test_clear_db_attribute(self):
         pname = "tap77"
         utils.execute(["ovs-vsctl", self.TO, "clear", "Port",
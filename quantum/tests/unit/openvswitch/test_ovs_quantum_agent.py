@@ -16,6 +16,7 @@
 
 import contextlib
 import sys
+import time
 
 import mock
 from oslo.config import cfg
@@ -91,6 +92,18 @@ class TestOvsQuantumAgent(base.BaseTestCase):
             self.agent.port_dead(mock.Mock())
         self.assertTrue(add_flow_func.called)
 
+    def test_deferred_flows(self):
+        phys_br = mock.Mock()
+        self.agent.phys_brs = {'physnet1': phys_br}
+        self.agent.enable_tunneling = True
+        bridges = (self.agent.int_br, phys_br, self.agent.tun_br)
+        with self.agent.deferred_flows():
+            for bridge in bridges:
+                bridge.defer_apply_on.assert_called_once_with()
+                self.assertFalse(bridge.defer_apply_off.called)
+        for bridge in bridges:
+            bridge.defer_apply_off.assert_called_once_with()
+
     def mock_update_ports(self, vif_port_set=None, registered_ports=None):
         with mock.patch.object(self.agent.int_br, 'get_vif_port_set',
                                return_value=vif_port_set):
@@ -106,6 +119,57 @@ class TestOvsQuantumAgent(base.BaseTestCase):
         actual = self.mock_update_ports(vif_port_set, registered_ports)
         self.assertEqual(expected, actual)
 
+    def _mock_ovsdb_monitor(self, added=None, removed=None,
+                            resync_needed=False):
+        monitor = mock.Mock()
+        monitor.is_active.return_value = True
+        monitor.get_events.return_value = (added or {}, removed or set(),
+                                           resync_needed)
+        self.agent.ovsdb_monitor = monitor
+        self.agent.last_full_poll = time.time()
+        return monitor
+
+    def test_update_ports_from_ovsdb_monitor(self):
+        self._mock_ovsdb_monitor(added={'tap3': 3, 'qg-4': 4},
+                                 removed=set([2, 5]))
+        with mock.patch.object(self.agent.int_br, 'get_port_name_list',
+                               return_value=['tap1', 'tap2', 'tap3']):
+            actual = self.mock_update_ports(set([7]), set([1, 2]))
+        self.assertEqual(actual, dict(current=set([1, 3]), added=set([3]),
+                                      removed=set([2])))
+
+    def test_update_ports_from_ovsdb_monitor_without_events(self):
+        self._mock_ovsdb_monitor()
+        with mock.patch.object(self.agent.int_br,
+                               'get_vif_port_set') as get_vif_port_set:
+            self.assertIsNone(self.agent.update_ports(set([1])))
+        self.assertFalse(get_vif_port_set.called)
+
+    def test_update_ports_ovsdb_monitor_resync(self):
+        self._mock_ovsdb_monitor(resync_needed=True)
+        actual = self.mock_update_ports(set([1, 3]), set([1]))
+        self.assertEqual(actual, dict(current=set([1, 3]), added=set([3]),
+                                      removed=set()))
+
+    def test_update_ports_ovsdb_monitor_periodic_full_poll(self):
+        monitor = self._mock_ovsdb_monitor()
+        self.agent.last_full_poll -= self.agent.ovsdb_monitor_resync_interval
+        self.assertIsNone(self.mock_update_ports(set([1]), set([1])))
+        self.assertFalse(monitor.get_events.called)
+
+    def test_update_ports_starts_inactive_ovsdb_monitor(self):
+        monitor = self._mock_ovsdb_monitor()
+        monitor.is_active.return_value = False
+        self.assertIsNone(self.mock_update_ports(set([1]), set([1])))
+        monitor.start.assert_called_once_with()
+
+    def test_daemon_loop_stops_ovsdb_monitor(self):
+        monitor = self._mock_ovsdb_monitor()
+        with mock.patch.object(self.agent, 'rpc_loop',
+                               side_effect=SystemExit):
+            self.assertRaises(SystemExit, self.agent.daemon_loop)
+        monitor.stop.assert_called_once_with()
+
     def test_treat_devices_added_returns_true_for_missing_device(self):
         with mock.patch.object(self.agent.plugin_rpc, 'get_device_details',
                                side_effect=Exception()):
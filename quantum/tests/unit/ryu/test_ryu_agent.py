@@ -313,156 +313,82 @@ class TestOVSBridge(RyuAgentTestCase):
         ])
         self.assertEqual(ofport, 1)
 
+    def _iface(self, name, ofport=1, external_ids=None, options=None):
+        return {'name': name, 'ofport': ofport,
+                'external_ids': external_ids or {},
+                'options': options or {}}
+
     def test_get_ports(self):
-        with nested(
-            mock.patch(self._AGENT_NAME + '.OVSBridge.get_port_name_list',
-                       return_value=['p1', 'p2']),
-            mock.patch(self._AGENT_NAME + '.OVSBridge.get_ofport',
-                       return_value=1)
-        ) as (mock_name, mock_ofport):
+        ifaces = [self._iface('p1'), self._iface('p2')]
+        with mock.patch(self._AGENT_NAME + '.OVSBridge.get_interfaces',
+                        return_value=ifaces) as mock_ifaces:
             get_port = mock.Mock(side_effect=['port1', 'port2'])
             br = self.mod_agent.OVSBridge('br_name', 'helper')
             ports = br._get_ports(get_port)
 
-        mock_name.assert_calls([
-            mock.call()
-        ])
-        mock_ofport.assert_calls([
-            mock.call('p1'),
-            mock.call('p2')
-        ])
-        get_port.assert_calls([
-            mock.call('p1'),
-            mock.call('p2')
-        ])
-        self.assertEqual(len(ports), 2)
+        mock_ifaces.assert_called_once_with(
+            ('name', 'ofport', 'external_ids', 'options'))
+        self.assertEqual(get_port.call_args_list,
+                         [mock.call(ifaces[0]), mock.call(ifaces[1])])
         self.assertEqual(ports, ['port1', 'port2'])
 
     def test_get_ports_empty(self):
-        with nested(
-            mock.patch(self._AGENT_NAME + '.OVSBridge.get_port_name_list',
-                       return_value=[]),
-            mock.patch(self._AGENT_NAME + '.OVSBridge.get_ofport',
-                       return_value=1)
-        ) as (mock_name, mock_ofport):
+        with mock.patch(self._AGENT_NAME + '.OVSBridge.get_interfaces',
+                        return_value=[]):
             get_port = mock.Mock(side_effect=['port1', 'port2'])
             br = self.mod_agent.OVSBridge('br_name', 'helper')
             ports = br._get_ports(get_port)
 
-        mock_name.assert_calls([
-            mock.call()
-        ])
-        self.assertEqual(mock_ofport.call_count, 0)
         self.assertEqual(get_port.call_count, 0)
         self.assertEqual(len(ports), 0)
 
     def test_get_ports_invalid_ofport(self):
-        with nested(
-            mock.patch(self._AGENT_NAME + '.OVSBridge.get_port_name_list',
-                       return_value=['p1', 'p2']),
-            mock.patch(self._AGENT_NAME + '.OVSBridge.get_ofport',
-                       side_effect=[-1, 1])
-        ) as (mock_name, mock_ofport):
-            get_port = mock.Mock(side_effect=['port1', 'port2'])
+        ifaces = [self._iface('p1', ofport=-1), self._iface('p2')]
+        with mock.patch(self._AGENT_NAME + '.OVSBridge.get_interfaces',
+                        return_value=ifaces):
+            get_port = mock.Mock(side_effect=['port2'])
             br = self.mod_agent.OVSBridge('br_name', 'helper')
             ports = br._get_ports(get_port)
 
-        mock_name.assert_calls([
-            mock.call()
-        ])
-        mock_ofport.assert_calls([
-            mock.call('p1'),
-            mock.call('p2')
-        ])
-        get_port.assert_calls([
-            mock.call('p2')
-        ])
-        self.assertEqual(len(ports), 1)
-        self.assertEqual(ports, ['port1'])
+        get_port.assert_called_once_with(ifaces[1])
+        self.assertEqual(ports, ['port2'])
 
     def test_get_ports_invalid_port(self):
-        with nested(
-            mock.patch(self._AGENT_NAME + '.OVSBridge.get_port_name_list',
-                       return_value=['p1', 'p2']),
-            mock.patch(self._AGENT_NAME + '.OVSBridge.get_ofport',
-                       side_effect=[1, 2])
-        ) as (mock_name, mock_ofport):
+        ifaces = [self._iface('p1'), self._iface('p2')]
+        with mock.patch(self._AGENT_NAME + '.OVSBridge.get_interfaces',
+                        return_value=ifaces):
             get_port = mock.Mock(side_effect=[None, 'port2'])
             br = self.mod_agent.OVSBridge('br_name', 'helper')
             ports = br._get_ports(get_port)
 
-        mock_name.assert_calls([
-            mock.call()
-        ])
-        mock_ofport.assert_calls([
-            mock.call('p1'),
-            mock.call('p2')
-        ])
-        get_port.assert_calls([
-            mock.call('p1'),
-            mock.call('p2')
-        ])
-        self.assertEqual(len(ports), 1)
+        self.assertEqual(get_port.call_count, 2)
         self.assertEqual(ports, ['port2'])
 
     def test_get_external_port(self):
-        with nested(
-            mock.patch(self._AGENT_NAME + '.OVSBridge.db_get_map',
-                       side_effect=[None, {'opts': 'opts_val'}]),
-            mock.patch(self._AGENT_NAME + '.OVSBridge.get_ofport',
-                       return_value=1),
-            mock.patch(self._AGENT_NAME + '.VifPort')
-        ) as (mock_db, mock_ofport, mock_vif):
+        with mock.patch(self._AGENT_NAME + '.VifPort') as mock_vif:
             br = self.mod_agent.OVSBridge('br_name', 'helper')
-            vifport = br._get_external_port('iface')
+            vifport = br._get_external_port(
+                self._iface('iface', options={'opts': 'opts_val'}))
 
-        mock_db.assert_calls([
-            mock.call('Interface', 'iface', 'external_ids'),
-            mock.call('Interface', 'iface', 'options'),
-        ])
-        mock_ofport.assert_calls([
-            mock.call('iface')
-        ])
-        mock_vif.assert_calls([
-            mock.call('iface', 1, None, None, br)
-        ])
+        mock_vif.assert_called_once_with('iface', 1, None, None, br)
         self.assertEqual(vifport, mock_vif.return_value)
 
     def test_get_external_port_vmport(self):
-        with nested(
-            mock.patch(self._AGENT_NAME + '.OVSBridge.db_get_map',
-                       side_effect=[{'extids': 'extid_val'},
-                                    {'opts': 'opts_val'}]),
-            mock.patch(self._AGENT_NAME + '.OVSBridge.get_ofport',
-                       return_value=1),
-            mock.patch(self._AGENT_NAME + '.VifPort')
-        ) as (mock_db, mock_ofport, mock_vif):
+        with mock.patch(self._AGENT_NAME + '.VifPort') as mock_vif:
             br = self.mod_agent.OVSBridge('br_name', 'helper')
-            vifport = br._get_external_port('iface')
+            vifport = br._get_external_port(
+                self._iface('iface', external_ids={'extids': 'extid_val'},
+                            options={'opts': 'opts_val'}))
 
-        mock_db.assert_calls([
-            mock.call('Interface', 'iface', 'external_ids'),
-        ])
-        self.assertEqual(mock_ofport.call_count, 0)
         self.assertEqual(mock_vif.call_count, 0)
         self.assertEqual(vifport, None)
 
     def test_get_external_port_tunnel(self):
-        with nested(
-            mock.patch(self._AGENT_NAME + '.OVSBridge.db_get_map',
-                       side_effect=[None, {'remote_ip': '0.0.0.0'}]),
-            mock.patch(self._AGENT_NAME + '.OVSBridge.get_ofport',
-                       return_value=1),
-            mock.patch(self._AGENT_NAME + '.VifPort')
-        ) as (mock_db, mock_ofport, mock_vif):
+        with mock.patch(self._AGENT_NAME + '.VifPort') as mock_vif:
             br = self.mod_agent.OVSBridge('br_name', 'helper')
-            vifport = br._get_external_port('iface')
+            vifport = br._get_external_port(
+                self._iface('iface', options={'remote_ip': '0.0.0.0'}))
 
-        mock_db.assert_calls([
-            mock.call('Interface', 'iface', 'external_ids'),
-            mock.call('Interface', 'iface', 'options'),
-        ])
-        self.assertEqual(mock_ofport.call_count, 0)
         self.assertEqual(mock_vif.call_count, 0)
         self.assertEqual(vifport, None)
 
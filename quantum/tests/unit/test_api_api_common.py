@@ -19,9 +19,11 @@
 #
 
 from testtools import matchers
+import webob
 from webob import exc
 
 from quantum.api import api_common as common
+from quantum.common import config  # noqa
 from quantum.tests import base
 
 
@@ -97,3 +99,50 @@ class APICommonTestCase(base.BaseTestCase):
                           self.controller._prepare_request_body,
                           body,
                           params)
+
+
+class PaginationEmulatedHelperTestCase(base.BaseTestCase):
+    def setUp(self):
+        super(PaginationEmulatedHelperTestCase, self).setUp()
+        self.items = [{'id': 'a', 'name': 'n3'},
+                      {'id': 'b', 'name': 'n1'},
+                      {'id': 'c', 'name': 'n2'},
+                      {'id': 'd', 'name': 'n1'}]
+
+    def _paginate(self, query, sort=True):
+        if sort:
+            query += '&sort_key=name&sort_dir=asc'
+        request = webob.Request.blank('/?' + query)
+        sorting_helper = common.SortingEmulatedHelper(
+            request, {'id': {}, 'name': {}})
+        pagination_helper = common.PaginationEmulatedHelper(request)
+        return [item['id'] for item in
+                pagination_helper.paginate(self.items, sorting_helper)]
+
+    def test_paginate_first_page(self):
+        self.assertEqual(['b', 'd'], self._paginate('limit=2'))
+
+    def test_paginate_after_marker(self):
+        self.assertEqual(['c', 'a'], self._paginate('limit=2&marker=d'))
+
+    def test_paginate_reverse(self):
+        self.assertEqual(['d', 'c'],
+                         self._paginate('limit=2&marker=a&page_reverse=True'))
+
+    def test_paginate_reverse_near_first_item(self):
+        self.assertEqual(['b', 'd'],
+                         self._paginate('limit=5&marker=c&page_reverse=True'))
+
+    def test_paginate_reverse_without_marker(self):
+        self.assertEqual(['c', 'a'],
+                         self._paginate('limit=2&page_reverse=True'))
+
+    def test_paginate_with_unknown_marker(self):
+        self.assertEqual([], self._paginate('limit=2&marker=e'))
+
+    def test_paginate_without_limit(self):
+        self.assertEqual(['b', 'd', 'c', 'a'], self._paginate(''))
+
+    def test_paginate_without_sort(self):
+        self.assertEqual(['c', 'd'],
+                         self._paginate('limit=2&marker=b', sort=False))
@@ -0,0 +1,211 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+import netaddr
+from oslo.config import cfg
+
+from quantum.common import exceptions as q_exc
+from quantum import context
+from quantum.db import ipam
+from quantum.db import models_v2
+from quantum.manager import QuantumManager
+from quantum.tests import base
+from quantum.tests.unit import test_db_plugin
+
+INTERVAL_ALLOCATOR = 'quantum.db.ipam.IntervalAllocator'
+
+
+class TestIPIntervalSet(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestIPIntervalSet, self).setUp()
+        self.free = ipam.IPIntervalSet()
+        self.free.add(10, 19, 'pool1')
+        self.free.add(30, 30, 'pool1')
+        self.free.add(40, 49, 'pool2')
+
+    def test_size(self):
+        self.assertEqual(len(self.free), 3)
+        self.assertEqual(self.free.size, 21)
+
+    def test_find(self):
+        self.assertEqual(self.free.find(15)[:3], (10, 19, 'pool1'))
+        self.assertEqual(self.free.find(30)[:3], (30, 30, 'pool1'))
+        self.assertIsNone(self.free.find(9))
+        self.assertIsNone(self.free.find(20))
+        self.assertIsNone(self.free.find(50))
+
+    def test_neighbours(self):
+        self.assertEqual(self.free.ending_at(19)[0], 10)
+        self.assertIsNone(self.free.ending_at(18))
+        self.assertEqual(self.free.starting_at(40)[1], 49)
+        self.assertIsNone(self.free.starting_at(41))
+
+    def test_remove(self):
+        self.free.remove(self.free.find(30))
+        self.assertEqual(len(self.free), 2)
+        self.assertEqual(self.free.size, 20)
+        self.assertIsNone(self.free.find(30))
+
+    def test_string_representation(self):
+        interval = self.free.add(int(netaddr.IPAddress('10.0.0.2')),
+                                 int(netaddr.IPAddress('10.0.0.9')), 'pool3')
+        self.assertEqual(interval[3:], ('10.0.0.2', '10.0.0.9'))
+
+    def test_pick_is_weighted(self):
+        with mock.patch('random.randint', return_value=10):
+            self.assertEqual(self.free.pick()[0], 30)
+        with mock.patch('random.randint', return_value=11):
+            self.assertEqual(self.free.pick()[0], 40)
+
+    def test_pick_empty(self):
+        self.assertIsNone(ipam.IPIntervalSet().pick())
+
+
+class TestIntervalAllocator(test_db_plugin.QuantumDbPluginV2TestCase):
+
+    def setUp(self):
+        super(TestIntervalAllocator, self).setUp()
+        cfg.CONF.set_override('ipam_driver', INTERVAL_ALLOCATOR)
+        self.addCleanup(ipam._ALLOCATORS.clear)
+        self.plugin = QuantumManager.get_plugin()
+        self.context = context.get_admin_context()
+
+    def _free_ranges(self, subnet_id):
+        query = self.context.session.query(models_v2.IPAvailabilityRange)
+        query = query.join(models_v2.IPAllocationPool)
+        return sorted((netaddr.IPAddress(r['first_ip']),
+                       netaddr.IPAddress(r['last_ip']))
+                      for r in query.filter_by(subnet_id=subnet_id))
+
+    def test_get_allocator(self):
+        self.assertIsInstance(ipam.get_allocator(), ipam.IntervalAllocator)
+
+    def test_generate_ips_unique_until_exhausted(self):
+        with self.subnet(cidr='10.0.0.0/28') as subnet:
+            s = subnet['subnet']
+            with self.context.session.begin(subtransactions=True):
+                ips = self.plugin._generate_ips(self.context, [s], 13)
+            addresses = set(ip['ip_address'] for ip in ips)
+            self.assertEqual(len(addresses), 13)
+            for address in addresses:
+                self.assertTrue(self.plugin._check_subnet_ip(s['cidr'],
+                                                             address))
+                self.assertNotEqual(address, s['gateway_ip'])
+            self.assertEqual(self._free_ranges(s['id']), [])
+            self.assertRaises(q_exc.IpAddressGenerationFailure,
+                              self.plugin._generate_ips,
+                              self.context, [s], 1)
+
+    def test_generate_ips_splits_ranges(self):
+        with self.subnet(cidr='10.0.0.0/24') as subnet:
+            s = subnet['subnet']
+            with mock.patch('random.randint', return_value=1):
+                ips = self.plugin._generate_ips(self.context, [s], 2)
+            self.assertEqual([ip['ip_address'] for ip in ips],
+                             ['10.0.0.66', '10.0.0.67'])
+            self.assertEqual(
+                self._free_ranges(s['id']),
+                [(netaddr.IPAddress('10.0.0.2'),
+                  netaddr.IPAddress('10.0.0.65')),
+                 (netaddr.IPAddress('10.0.0.68'),
+                  netaddr.IPAddress('10.0.0.254'))])
+
+    def test_generate_ips_reloads_stale_cache(self):
+        with self.subnet(cidr='10.0.0.0/29') as subnet:
+            s = subnet['subnet']
+            allocator = ipam.get_allocator()
+            free = allocator._get_free(self.context, s['id'])
+            # Another server consumes the whole range behind our back
+            self.context.session.query(
+                models_v2.IPAvailabilityRange).delete()
+            free.add(1000, 1010, 'stale-pool')
+            self.assertRaises(q_exc.IpAddressGenerationFailure,
+                              self.plugin._generate_ips,
+                              self.context, [s], 1)
+            self.assertEqual(allocator._free[s['id']].size, 0)
+
+    def test_allocate_specific_ip(self):
+        with self.subnet(cidr='10.0.0.0/24') as subnet:
+            s = subnet['subnet']
+            self.plugin._allocate_specific_ip(self.context, s['id'],
+                                              '10.0.0.10')
+            self.assertEqual(
+                self._free_ranges(s['id']),
+                [(netaddr.IPAddress('10.0.0.2'),
+                  netaddr.IPAddress('10.0.0.9')),
+                 (netaddr.IPAddress('10.0.0.11'),
+                  netaddr.IPAddress('10.0.0.254'))])
+
+    def test_recycle_ip_merges_ranges(self):
+        with self.subnet(cidr='10.0.0.0/24') as subnet:
+            s = subnet['subnet']
+            allocator = ipam.get_allocator()
+            allocator.allocate_specific_ip(self.context, s['id'], '10.0.0.10')
+            allocator.recycle_ip(self.context, s['network_id'], s['id'],
+                                 '10.0.0.10')
+            self.assertEqual(
+                self._free_ranges(s['id']),
+                [(netaddr.IPAddress('10.0.0.2'),
+                  netaddr.IPAddress('10.0.0.254'))])
+            self.assertEqual(len(allocator._free[s['id']]), 1)
+
+    def test_rollback_evicts_changed_subnets(self):
+        with self.subnet(cidr='10.0.0.0/24') as subnet:
+            s = subnet['subnet']
+            allocator = ipam.get_allocator()
+            try:
+                with self.context.session.begin():
+                    allocator.allocate_specific_ip(self.context, s['id'],
+                                                   '10.0.0.10')
+                    self.assertIsNone(
+                        allocator._free[s['id']].find(
+                            int(netaddr.IPAddress('10.0.0.10'))))
+                    raise ValueError()
+            except ValueError:
+                pass
+            self.assertNotIn(s['id'], allocator._free)
+            self.assertEqual(
+                self._free_ranges(s['id']),
+                [(netaddr.IPAddress('10.0.0.2'),
+                  netaddr.IPAddress('10.0.0.254'))])
+
+    def test_delete_subnet_evicts_cache(self):
+        with self.network() as network:
+            with self.subnet(network=network, cidr='10.0.0.0/24',
+                             do_delete=False) as subnet:
+                s = subnet['subnet']
+                allocator = ipam.get_allocator()
+                allocator._get_free(self.context, s['id'])
+            self._delete('subnets', s['id'])
+            self.assertNotIn(s['id'], allocator._free)
+
+    def test_create_and_delete_ports(self):
+        with self.subnet(cidr='10.0.0.0/29') as subnet:
+            ports = []
+            for i in range(5):
+                ports.append(self._make_port(self.fmt,
+                                             subnet['subnet']['network_id']))
+            addresses = set(p['port']['fixed_ips'][0]['ip_address']
+                            for p in ports)
+            self.assertEqual(len(addresses), 5)
+            res = self._create_port(self.fmt,
+                                    net_id=subnet['subnet']['network_id'])
+            self.assertEqual(res.status_int, 409)
+            for port in ports:
+                self._delete('ports', port['port']['id'])
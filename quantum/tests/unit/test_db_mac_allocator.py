@@ -0,0 +1,93 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import contextlib
+
+import mock
+from oslo.config import cfg
+
+from quantum.common import exceptions as q_exc
+from quantum import context
+from quantum.db import mac_allocator
+from quantum.tests.unit import test_db_plugin
+
+
+class TestMacAllocator(test_db_plugin.QuantumDbPluginV2TestCase):
+
+    def setUp(self):
+        super(TestMacAllocator, self).setUp()
+        self.addCleanup(mac_allocator._RESERVED.clear)
+        self.context = context.get_admin_context()
+
+    def test_generate_macs(self):
+        with self.network() as network:
+            macs = mac_allocator.generate_macs(self.context,
+                                               network['network']['id'], 10)
+            self.assertEqual(len(set(macs)), 10)
+            for mac in macs:
+                self.assertTrue(mac.startswith('12:34:56:78:'))
+
+    def test_generate_macs_single_query_per_attempt(self):
+        with self.port() as port:
+            net_id = port['port']['network_id']
+            used = port['port']['mac_address']
+            candidates = iter([used, 'fa:16:3e:00:00:01', 'fa:16:3e:00:00:02',
+                               'fa:16:3e:00:00:03'])
+            with contextlib.nested(
+                mock.patch.object(mac_allocator, '_random_mac',
+                                  side_effect=lambda base: candidates.next()),
+                mock.patch.object(mac_allocator, 'get_macs_in_use',
+                                  wraps=mac_allocator.get_macs_in_use)
+            ) as (random_mac, in_use):
+                macs = mac_allocator.generate_macs(self.context, net_id, 3)
+            self.assertEqual(sorted(macs), ['fa:16:3e:00:00:01',
+                                            'fa:16:3e:00:00:02',
+                                            'fa:16:3e:00:00:03'])
+            self.assertEqual(in_use.call_count, 2)
+            self.assertEqual(in_use.call_args[0][2],
+                             set(['fa:16:3e:00:00:03']))
+
+    def test_generate_macs_exhausted(self):
+        with self.port() as port:
+            net_id = port['port']['network_id']
+            with mock.patch.object(mac_allocator, '_random_mac',
+                                   return_value=port['port']['mac_address']):
+                self.assertRaises(q_exc.MacAddressGenerationFailure,
+                                  mac_allocator.generate_macs,
+                                  self.context, net_id, 1)
+
+    def test_reserved_cache_skips_generated_macs(self):
+        cfg.CONF.set_override('mac_generation_cache_size', 1)
+        candidates = iter(['fa:16:3e:00:00:01', 'fa:16:3e:00:00:01',
+                           'fa:16:3e:00:00:02', 'fa:16:3e:00:00:02',
+                           'fa:16:3e:00:00:03'])
+        with self.network() as network:
+            net_id = network['network']['id']
+            with mock.patch.object(mac_allocator, '_random_mac',
+                                   side_effect=lambda base: candidates.next()):
+                self.assertEqual(
+                    mac_allocator.generate_macs(self.context, net_id, 1),
+                    ['fa:16:3e:00:00:01'])
+                self.assertEqual(
+                    mac_allocator.generate_macs(self.context, net_id, 1),
+                    ['fa:16:3e:00:00:02'])
+                # The cache only remembers the last mac
+                self.assertEqual(
+                    mac_allocator.generate_macs(self.context, net_id, 1),
+                    ['fa:16:3e:00:00:03'])
+        reserved, order = mac_allocator._RESERVED['12:34:56:78:90:ab']
+        self.assertEqual(reserved, set(['fa:16:3e:00:00:03']))
@@ -23,6 +23,7 @@ import random
 
 import mock
 from oslo.config import cfg
+import sqlalchemy as sa
 import testtools
 from testtools import matchers
 import webob.exc
@@ -40,8 +41,10 @@ from quantum import context
 from quantum.db import api as db
 from quantum.db import db_base_plugin_v2
 from quantum.db import models_v2
+from quantum.db import quota_db
 from quantum.manager import QuantumManager
 from quantum.openstack.common import timeutils
+from quantum import quota
 from quantum.tests import base
 from quantum.tests.unit import test_extensions
 from quantum.tests.unit import testlib_api
@@ -838,6 +841,29 @@ class TestPortsV2(QuantumDbPluginV2TestCase):
             for p in self.deserialize(self.fmt, res)['ports']:
                 self._delete('ports', p['id'])
 
+    def test_create_ports_bulk_native_usage_quotas(self):
+        if self._skip_native_bulk:
+            self.skipTest("Plugin does not support native bulk port create")
+        cfg.CONF.set_override('quota_port', 4, group='QUOTAS')
+        engine = quota.QuotaEngine('quantum.db.quota_db.UsageDbQuotaDriver')
+        with mock.patch.object(quota, 'QUOTAS', new=engine):
+            quota.register_resources_from_config()
+            with self.network() as net:
+                net_id = net['network']['id']
+                res = self._create_port_bulk(self.fmt, 3, net_id, 'test',
+                                             True)
+                self.assertEqual(res.status_int, 201)
+                ports = self.deserialize(self.fmt, res)['ports']
+                usage = context.get_admin_context().session.query(
+                    quota_db.QuotaUsage).filter_by(
+                        tenant_id=self._tenant_id, resource='port').one()
+                self.assertEqual(usage.in_use, 3)
+                res = self._create_port_bulk(self.fmt, 2, net_id, 'test',
+                                             True)
+                self.assertEqual(res.status_int, 409)
+                for p in ports:
+                    self._delete('ports', p['id'])
+
     def test_create_ports_bulk_emulated(self):
         real_has_attr = hasattr
 
@@ -916,6 +942,50 @@ class TestPortsV2(QuantumDbPluginV2TestCase):
                 # We expect a 500 as we injected a fault in the plugin
                 self._validate_behavior_on_bulk_failure(res, 'ports', 500)
 
+    def test_create_ports_bulk_native_allocations(self):
+        if self._skip_native_bulk:
+            self.skipTest("Plugin does not support native bulk port create")
+        with self.subnet() as subnet:
+            net_id = subnet['subnet']['network_id']
+            overrides = {0: {'fixed_ips': [{'ip_address': '10.0.0.3'}]},
+                         2: {'mac_address': '00:11:22:33:44:55'}}
+            res = self._create_port_bulk(self.fmt, 3, net_id, 'test', True,
+                                         override=overrides)
+            self.assertEqual(res.status_int, 201)
+            ports = self.deserialize(self.fmt, res)['ports']
+            self.assertEqual([p['name'] for p in ports],
+                             ['test_0', 'test_1', 'test_2'])
+            self.assertEqual([p['fixed_ips'][0]['ip_address'] for p in ports],
+                             ['10.0.0.3', '10.0.0.2', '10.0.0.4'])
+            self.assertEqual(ports[2]['mac_address'], '00:11:22:33:44:55')
+            self.assertEqual(len(set(p['mac_address'] for p in ports)), 3)
+            for p in ports:
+                port = self._show('ports', p['id'])['port']
+                self.assertEqual(port['fixed_ips'], p['fixed_ips'])
+                self._delete('ports', p['id'])
+
+    def test_create_ports_bulk_native_duplicate_mac(self):
+        if self._skip_native_bulk:
+            self.skipTest("Plugin does not support native bulk port create")
+        with self.network() as net:
+            overrides = {0: {'mac_address': '00:11:22:33:44:55'},
+                         1: {'mac_address': '00:11:22:33:44:55'}}
+            res = self._create_port_bulk(self.fmt, 2, net['network']['id'],
+                                         'test', True, override=overrides)
+            self._validate_behavior_on_bulk_failure(res, 'ports', 409)
+
+    def test_create_ports_bulk_native_duplicate_ip(self):
+        if self._skip_native_bulk:
+            self.skipTest("Plugin does not support native bulk port create")
+        with self.subnet() as subnet:
+            fixed_ips = [{'ip_address': '10.0.0.5'}]
+            overrides = {0: {'fixed_ips': fixed_ips},
+                         1: {'fixed_ips': fixed_ips}}
+            res = self._create_port_bulk(self.fmt, 2,
+                                         subnet['subnet']['network_id'],
+                                         'test', True, override=overrides)
+            self._validate_behavior_on_bulk_failure(res, 'ports', 409)
+
     def test_list_ports(self):
         # for this test we need to enable overlapping ips
         cfg.CONF.set_default('allow_overlapping_ips', True)
@@ -1660,6 +1730,32 @@ fixed_ips=ip_address%%3D%s&fixed_ips=ip_address%%3D%s&fixed_ips=subnet_id%%3D%s
                     ip_allocation.expiration - timeutils.utcnow(),
                     matchers.GreaterThan(datetime.timedelta(seconds=10)))
 
+    def test_update_fixed_ip_lease_expirations(self):
+        cfg.CONF.set_override('dhcp_lease_duration', 10)
+        plugin = QuantumManager.get_plugin()
+        with self.subnet() as subnet:
+            with contextlib.nested(self.port(subnet=subnet),
+                                   self.port(subnet=subnet)) as (p1, p2):
+                update_context = context.Context('', p1['port']['tenant_id'])
+                ip1 = p1['port']['fixed_ips'][0]['ip_address']
+                ip2 = p2['port']['fixed_ips'][0]['ip_address']
+                plugin.update_fixed_ip_lease_expirations(
+                    update_context, subnet['subnet']['network_id'],
+                    {ip1: 500, ip2: 1000, '255.255.255.0': 120})
+
+                q = update_context.session.query(models_v2.IPAllocation)
+                expirations = dict(
+                    (a.ip_address, a.expiration - timeutils.utcnow())
+                    for a in q.filter(models_v2.IPAllocation.ip_address.in_(
+                        [ip1, ip2])))
+
+                self.assertThat(
+                    expirations[ip1],
+                    matchers.GreaterThan(datetime.timedelta(seconds=10)))
+                self.assertThat(
+                    expirations[ip2],
+                    matchers.GreaterThan(datetime.timedelta(seconds=500)))
+
     def test_port_delete_holds_ip(self):
         base_class = db_base_plugin_v2.QuantumDbPluginV2
         with mock.patch.object(base_class, '_hold_ip') as hold_ip:
@@ -3425,6 +3521,54 @@ class TestSubnetsV2(QuantumDbPluginV2TestCase):
         self.assertEqual(res.status_int, 204)
 
 
+class TestCollectionQueries(QuantumDbPluginV2TestCase):
+
+    # Number of queries allowed to list ports, whatever their number
+    PORTS_QUERY_BUDGET = 5
+
+    def _count_queries(self, func, *args, **kwargs):
+        queries = []
+        counting = [True]
+
+        def before_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+            if counting[0]:
+                queries.append(statement)
+
+        # The listener goes away with the engine in tearDown
+        sa.event.listen(db._ENGINE, 'before_cursor_execute', before_execute)
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            counting[0] = False
+        return result, len(queries)
+
+    def test_get_ports_query_count(self):
+        plugin = QuantumManager.get_plugin()
+        ctx = context.get_admin_context()
+        network = self._make_network(self.fmt, 'net1', True)
+        self._make_subnet(self.fmt, network, '10.0.0.1', '10.0.0.0/22')
+        network_id = network['network']['id']
+        ports = {'ports': [{'port': {'network_id': network_id,
+                                     'tenant_id': 'tenant',
+                                     'name': 'port%d' % i,
+                                     'admin_state_up': True,
+                                     'mac_address': ATTR_NOT_SPECIFIED,
+                                     'fixed_ips': ATTR_NOT_SPECIFIED,
+                                     'device_id': '',
+                                     'device_owner': ''}}
+                           for i in range(1000)]}
+        plugin.create_port_bulk(ctx, ports)
+
+        result, queries = self._count_queries(
+            plugin.get_ports, context.get_admin_context(),
+            filters={'network_id': [network_id]})
+        self.assertEqual(1000, len(result))
+        self.assertTrue(all(port['fixed_ips'] for port in result))
+        self.assertThat(queries,
+                        matchers.LessThan(self.PORTS_QUERY_BUDGET + 1))
+
+
 class DbModelTestCase(base.BaseTestCase):
     """DB model tests."""
     def test_repr(self):
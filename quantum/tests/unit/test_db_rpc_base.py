@@ -64,6 +64,33 @@ class TestDhcpRpcCallackMixin(base.BaseTestCase):
         self.assertEqual(retval['subnets'], subnet_retval)
         self.assertEqual(retval['ports'], port_retval)
 
+    def test_get_networks_info(self):
+        self.plugin.get_networks.return_value = [dict(id='a'), dict(id='b')]
+        self.plugin.get_subnets.return_value = [
+            dict(id='s1', network_id='a'), dict(id='s2', network_id='b'),
+            dict(id='s3', network_id='a')]
+        self.plugin.get_ports.return_value = [dict(id='p1', network_id='b')]
+
+        retval = self.callbacks.get_networks_info(mock.Mock(),
+                                                  network_ids=['a', 'b'])
+
+        self.assertEqual([net['id'] for net in retval], ['a', 'b'])
+        self.assertEqual([s['id'] for s in retval[0]['subnets']],
+                         ['s1', 's3'])
+        self.assertEqual(retval[0]['ports'], [])
+        self.assertEqual([p['id'] for p in retval[1]['ports']], ['p1'])
+        self.plugin.assert_has_calls([
+            mock.call.get_networks(mock.ANY, filters=dict(id=['a', 'b'])),
+            mock.call.get_subnets(mock.ANY,
+                                  filters=dict(network_id=['a', 'b'])),
+            mock.call.get_ports(mock.ANY,
+                                filters=dict(network_id=['a', 'b']))])
+
+    def test_get_networks_info_empty(self):
+        self.assertEqual(
+            self.callbacks.get_networks_info(mock.Mock(), network_ids=[]), [])
+        self.assertFalse(self.plugin.get_networks.called)
+
     def _test_get_dhcp_port_helper(self, port_retval, other_expectations=[],
                                    update_port=None, create_port=None):
         subnets_retval = [dict(id='a', enable_dhcp=True),
@@ -148,3 +175,16 @@ class TestDhcpRpcCallackMixin(base.BaseTestCase):
                                                        device_id=['devid'])),
             mock.call.update_port(mock.ANY, 'port_id',
                                   dict(port=port_update))])
+
+    def test_update_lease_expirations(self):
+        leases = {'net1': {'10.0.0.2': 120, '10.0.0.3': 60},
+                  'net2': {'10.0.1.2': 120}}
+
+        self.callbacks.update_lease_expirations(mock.ANY, leases=leases,
+                                                host='host')
+
+        self.plugin.assert_has_calls([
+            mock.call.update_fixed_ip_lease_expirations(
+                mock.ANY, 'net1', leases['net1']),
+            mock.call.update_fixed_ip_lease_expirations(
+                mock.ANY, 'net2', leases['net2'])], any_order=True)
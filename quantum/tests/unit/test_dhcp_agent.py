@@ -33,6 +33,7 @@ from quantum.agent.linux import interface
 from quantum.common import constants
 from quantum.common import exceptions
 from quantum.openstack.common import jsonutils
+from quantum.openstack.common.rpc import common as rpc_common
 from quantum.tests import base
 
 
@@ -184,11 +185,13 @@ class TestDhcpAgent(base.BaseTestCase):
             dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
             attrs_to_mock = dict(
                 [(a, mock.DEFAULT) for a in
-                 ['sync_state', 'lease_relay', 'periodic_resync']])
+                 ['sync_state', 'lease_relay', 'periodic_resync',
+                  'periodic_lease_updates']])
             with mock.patch.multiple(dhcp, **attrs_to_mock) as mocks:
                 dhcp.run()
                 mocks['sync_state'].assert_called_once_with()
                 mocks['periodic_resync'].assert_called_once_with()
+                mocks['periodic_lease_updates'].assert_called_once_with()
                 mocks['lease_relay'].assert_has_mock_calls(
                     [mock.call.start()])
 
@@ -236,6 +239,7 @@ class TestDhcpAgent(base.BaseTestCase):
                 self.assertTrue(dhcp.needs_resync)
 
     def test_update_lease(self):
+        cfg.CONF.set_override('dhcp_lease_update_interval', 0)
         with mock.patch('quantum.agent.dhcp_agent.DhcpPluginApi') as plug:
             dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
             dhcp.update_lease('net_id', '192.168.1.1', 120)
@@ -244,6 +248,7 @@ class TestDhcpAgent(base.BaseTestCase):
                     'net_id', '192.168.1.1', 120)])
 
     def test_update_lease_failure(self):
+        cfg.CONF.set_override('dhcp_lease_update_interval', 0)
         with mock.patch('quantum.agent.dhcp_agent.DhcpPluginApi') as plug:
             plug.return_value.update_lease_expiration.side_effect = Exception
 
@@ -257,31 +262,109 @@ class TestDhcpAgent(base.BaseTestCase):
                 self.assertTrue(log.called)
                 self.assertTrue(dhcp.needs_resync)
 
+    def test_update_lease_batched(self):
+        cfg.CONF.set_override('dhcp_lease_update_interval', 1)
+        with mock.patch('quantum.agent.dhcp_agent.DhcpPluginApi') as plug:
+            with mock.patch('time.time') as time:
+                time.return_value = 1000
+                dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
+                dhcp.update_lease('net_id', '192.168.1.1', 120)
+                dhcp.update_lease('net_id', '192.168.1.2', 120)
+                dhcp.update_lease('net_id', '192.168.1.1', 60)
+                dhcp.update_lease('net_id2', '10.0.0.1', 120)
+                self.assertFalse(
+                    plug.return_value.update_lease_expiration.called)
+
+                time.return_value = 1001
+                dhcp.send_lease_updates()
+                update = plug.return_value.update_lease_expirations
+                update.assert_called_once_with(
+                    {'net_id': {'192.168.1.1': 59, '192.168.1.2': 119},
+                     'net_id2': {'10.0.0.1': 119}})
+                self.assertEqual(dhcp.pending_leases, {})
+
+                dhcp.send_lease_updates()
+                self.assertEqual(update.call_count, 1)
+
+    def test_send_lease_updates_unsupported(self):
+        cfg.CONF.set_override('dhcp_lease_update_interval', 1)
+        with mock.patch('quantum.agent.dhcp_agent.DhcpPluginApi') as plug:
+            plug.return_value.update_lease_expirations.side_effect = (
+                rpc_common.RemoteError('AttributeError'))
+
+            dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
+            dhcp.update_lease('net_id', '192.168.1.1', 120)
+            dhcp.send_lease_updates()
+            dhcp.update_lease('net_id', '192.168.1.2', 120)
+
+            self.assertFalse(dhcp.bulk_lease_updates)
+            self.assertFalse(dhcp.needs_resync)
+            self.assertEqual(dhcp.pending_leases, {})
+            plug.assert_has_calls([
+                mock.call().update_lease_expiration(
+                    'net_id', '192.168.1.1', mock.ANY),
+                mock.call().update_lease_expiration(
+                    'net_id', '192.168.1.2', 120)])
+
+    def test_send_lease_updates_failure(self):
+        cfg.CONF.set_override('dhcp_lease_update_interval', 1)
+        with mock.patch('quantum.agent.dhcp_agent.DhcpPluginApi') as plug:
+            plug.return_value.update_lease_expirations.side_effect = Exception
+
+            with mock.patch.object(dhcp_agent.LOG, 'exception') as log:
+                dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
+                dhcp.update_lease('net_id', '192.168.1.1', 120)
+                dhcp.send_lease_updates()
+
+                self.assertTrue(log.called)
+                self.assertTrue(dhcp.needs_resync)
+
+    def test_periodic_lease_updates(self):
+        cfg.CONF.set_override('dhcp_lease_update_interval', 1)
+        with mock.patch.object(dhcp_agent.loopingcall,
+                               'FixedIntervalLoopingCall') as loop:
+            dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
+            dhcp.periodic_lease_updates()
+            loop.assert_has_calls([mock.call(dhcp.send_lease_updates),
+                                   mock.call().start(interval=1)])
+
+    def test_periodic_lease_updates_disabled(self):
+        cfg.CONF.set_override('dhcp_lease_update_interval', 0)
+        with mock.patch.object(dhcp_agent.loopingcall,
+                               'FixedIntervalLoopingCall') as loop:
+            dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
+            dhcp.periodic_lease_updates()
+            self.assertFalse(loop.called)
+
     def _test_sync_state_helper(self, known_networks, active_networks):
         with mock.patch('quantum.agent.dhcp_agent.DhcpPluginApi') as plug:
             mock_plugin = mock.Mock()
             mock_plugin.get_active_networks.return_value = active_networks
+            mock_plugin.get_networks_info.side_effect = (
+                lambda ids: [FakeModel(net_id) for net_id in ids])
             plug.return_value = mock_plugin
 
             dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
 
             attrs_to_mock = dict(
                 [(a, mock.DEFAULT) for a in
-                 ['refresh_dhcp_helper', 'disable_dhcp_helper', 'cache']])
+                 ['_sync_network', 'disable_dhcp_helper', 'cache']])
 
             with mock.patch.multiple(dhcp, **attrs_to_mock) as mocks:
                 mocks['cache'].get_network_ids.return_value = known_networks
                 dhcp.sync_state()
 
-                exp_refresh = [
-                    mock.call(net_id) for net_id in active_networks]
+                synced = [network.id for (network,), kwargs in
+                          mocks['_sync_network'].call_args_list]
+                self.assertEqual(sorted(synced), sorted(active_networks))
 
                 diff = set(known_networks) - set(active_networks)
                 exp_disable = [mock.call(net_id) for net_id in diff]
 
                 mocks['cache'].assert_has_calls([mock.call.get_network_ids()])
-                mocks['refresh_dhcp_helper'].assert_has_called(exp_refresh)
-                mocks['disable_dhcp_helper'].assert_has_called(exp_disable)
+                mocks['disable_dhcp_helper'].assert_has_calls(exp_disable)
+                self.assertFalse(dhcp.needs_resync)
+        return mock_plugin
 
     def test_sync_state_initial(self):
         self._test_sync_state_helper([], ['a'])
@@ -292,6 +375,111 @@ class TestDhcpAgent(base.BaseTestCase):
     def test_sync_state_disabled_net(self):
         self._test_sync_state_helper(['b'], ['a'])
 
+    def test_sync_state_chunks(self):
+        cfg.CONF.set_override('sync_networks_chunk_size', 4)
+        active_networks = ['net%03d' % i for i in range(10)]
+        mock_plugin = self._test_sync_state_helper([], active_networks)
+        self.assertEqual(mock_plugin.get_networks_info.call_count, 3)
+
+    def test_sync_state_bulk_info_unsupported(self):
+        with mock.patch('quantum.agent.dhcp_agent.DhcpPluginApi') as plug:
+            mock_plugin = mock.Mock()
+            mock_plugin.get_active_networks.return_value = ['a', 'b']
+            mock_plugin.get_networks_info.side_effect = (
+                rpc_common.RemoteError('UnsupportedRpcVersion'))
+            plug.return_value = mock_plugin
+
+            with mock.patch.object(dhcp_agent.LOG, 'warn') as log:
+                dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
+                with mock.patch.object(dhcp, 'refresh_dhcp_helper') as refresh:
+                    dhcp.sync_state()
+                    dhcp.sync_state()
+
+                    self.assertEqual(refresh.call_args_list,
+                                     [mock.call('a'), mock.call('b')] * 2)
+                    self.assertEqual(log.call_count, 1)
+                    self.assertEqual(mock_plugin.get_networks_info.call_count,
+                                     1)
+                    self.assertFalse(dhcp.bulk_networks_info)
+                    self.assertFalse(dhcp.needs_resync)
+
+    def test_sync_state_bulk_info_error(self):
+        with mock.patch('quantum.agent.dhcp_agent.DhcpPluginApi') as plug:
+            mock_plugin = mock.Mock()
+            mock_plugin.get_active_networks.return_value = ['a', 'b']
+            mock_plugin.get_networks_info.side_effect = Exception
+            plug.return_value = mock_plugin
+
+            with mock.patch.object(dhcp_agent.LOG, 'exception') as log:
+                dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
+                dhcp.sync_state()
+
+                self.assertTrue(log.called)
+                self.assertTrue(dhcp.bulk_networks_info)
+                self.assertTrue(dhcp.needs_resync)
+
+    def test_sync_state_network_deleted(self):
+        with mock.patch('quantum.agent.dhcp_agent.DhcpPluginApi') as plug:
+            mock_plugin = mock.Mock()
+            mock_plugin.get_active_networks.return_value = ['a', 'b']
+            mock_plugin.get_networks_info.return_value = [FakeModel('a')]
+            plug.return_value = mock_plugin
+
+            dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
+            with mock.patch.object(dhcp, '_sync_network') as sync_network:
+                dhcp.sync_state()
+
+                self.assertEqual(sync_network.call_count, 1)
+                self.assertTrue(dhcp.needs_resync)
+
+    def test_sync_network_new(self):
+        dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
+        attrs_to_mock = dict(
+            [(a, mock.DEFAULT) for a in
+             ['_enable_dhcp', '_refresh_dhcp', 'cache']])
+        with mock.patch.multiple(dhcp, **attrs_to_mock) as mocks:
+            mocks['cache'].get_network_by_id.return_value = None
+            mocks['cache'].get_version.return_value = 1
+            dhcp._sync_network(fake_network, 1)
+            mocks['_enable_dhcp'].assert_called_once_with(fake_network)
+            self.assertFalse(mocks['_refresh_dhcp'].called)
+
+    def test_sync_network_known(self):
+        dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
+        attrs_to_mock = dict(
+            [(a, mock.DEFAULT) for a in
+             ['_enable_dhcp', '_refresh_dhcp', 'cache']])
+        with mock.patch.multiple(dhcp, **attrs_to_mock) as mocks:
+            mocks['cache'].get_network_by_id.return_value = fake_network
+            mocks['cache'].get_version.return_value = 1
+            dhcp._sync_network(fake_network, 1)
+            mocks['_refresh_dhcp'].assert_called_once_with(fake_network,
+                                                           fake_network)
+            self.assertFalse(mocks['_enable_dhcp'].called)
+
+    def test_sync_network_changed_since_retrieved(self):
+        dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
+        attrs_to_mock = dict(
+            [(a, mock.DEFAULT) for a in
+             ['_enable_dhcp', '_refresh_dhcp', 'refresh_dhcp_helper',
+              'cache']])
+        with mock.patch.multiple(dhcp, **attrs_to_mock) as mocks:
+            mocks['cache'].get_version.return_value = 2
+            dhcp._sync_network(fake_network, 1)
+            mocks['refresh_dhcp_helper'].assert_called_once_with(
+                fake_network.id)
+            self.assertFalse(mocks['_refresh_dhcp'].called)
+            self.assertFalse(mocks['_enable_dhcp'].called)
+
+    def test_sync_network_failure(self):
+        dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
+        with mock.patch.object(dhcp, 'cache') as cache:
+            cache.get_network_by_id.side_effect = Exception
+            with mock.patch.object(dhcp_agent.LOG, 'exception') as log:
+                dhcp._sync_network(fake_network)
+                self.assertTrue(log.called)
+                self.assertTrue(dhcp.needs_resync)
+
     def test_sync_state_plugin_error(self):
         with mock.patch('quantum.agent.dhcp_agent.DhcpPluginApi') as plug:
             mock_plugin = mock.Mock()
@@ -411,6 +599,7 @@ class TestDhcpAgentEventHandler(base.BaseTestCase):
                               'quantum.agent.linux.interface.NullDriver')
         config.register_root_helper(cfg.CONF)
         cfg.CONF.register_opts(dhcp_agent.DhcpAgent.OPTS)
+        cfg.CONF.set_override('dhcp_reload_delay', 0)
 
         self.plugin_p = mock.patch('quantum.agent.dhcp_agent.DhcpPluginApi')
         plugin_cls = self.plugin_p.start()
@@ -699,6 +888,17 @@ class TestDhcpAgentEventHandler(base.BaseTestCase):
         self.call_driver.assert_called_once_with('reload_allocations',
                                                  fake_network)
 
+    def test_port_create_end_bulk(self):
+        payload = dict(ports=[vars(fake_port1), vars(fake_port2)])
+        self.cache.get_network_by_id.return_value = fake_network
+        self.dhcp.port_create_end(None, payload)
+        self.cache.assert_has_calls(
+            [mock.call.get_network_by_id(fake_port1.network_id),
+             mock.call.put_port(mock.ANY),
+             mock.call.put_port(mock.ANY)])
+        self.call_driver.assert_called_once_with('reload_allocations',
+                                                 fake_network)
+
     def test_port_delete_end(self):
         payload = dict(port_id=fake_port2.id)
         self.cache.get_network_by_id.return_value = fake_network
@@ -722,6 +922,33 @@ class TestDhcpAgentEventHandler(base.BaseTestCase):
         self.cache.assert_has_calls([mock.call.get_port_by_id('unknown')])
         self.assertEqual(self.call_driver.call_count, 0)
 
+    def test_schedule_reload_allocations(self):
+        cfg.CONF.set_override('dhcp_reload_delay', 0.5)
+        with mock.patch.object(dhcp_agent.eventlet,
+                               'spawn_after') as spawn_after:
+            self.dhcp.schedule_reload_allocations(fake_network)
+            self.dhcp.schedule_reload_allocations(fake_network)
+
+            spawn_after.assert_called_once_with(
+                0.5, self.dhcp._reload_allocations, fake_network.id)
+            self.assertFalse(self.call_driver.called)
+
+            self.cache.get_network_by_id.return_value = fake_network
+            self.dhcp._reload_allocations(fake_network.id)
+            self.call_driver.assert_called_once_with('reload_allocations',
+                                                     fake_network)
+            self.assertEqual(self.dhcp.pending_reloads, {})
+
+            self.dhcp.schedule_reload_allocations(fake_network)
+            self.assertEqual(spawn_after.call_count, 2)
+
+    def test_reload_allocations_deleted_network(self):
+        self.dhcp.pending_reloads[fake_network.id] = mock.Mock()
+        self.cache.get_network_by_id.return_value = None
+        self.dhcp._reload_allocations(fake_network.id)
+        self.assertFalse(self.call_driver.called)
+        self.assertEqual(self.dhcp.pending_reloads, {})
+
 
 class TestDhcpPluginApiProxy(base.BaseTestCase):
     def setUp(self):
@@ -754,6 +981,16 @@ class TestDhcpPluginApiProxy(base.BaseTestCase):
                                               network_id='netid',
                                               host='foo')
 
+    def test_get_networks_info(self):
+        self.call.return_value = [dict(a=1), dict(a=2)]
+        retval = self.proxy.get_networks_info(['netid1', 'netid2'])
+        self.assertEqual([network.a for network in retval], [1, 2])
+        self.assertEqual(self.call.call_args[1]['version'], '1.1')
+        self.make_msg.assert_called_once_with('get_networks_info',
+                                              network_ids=['netid1',
+                                                           'netid2'],
+                                              host='foo')
+
     def test_get_dhcp_port(self):
         self.call.return_value = dict(a=1)
         retval = self.proxy.get_dhcp_port('netid', 'devid')
@@ -791,6 +1028,14 @@ class TestDhcpPluginApiProxy(base.BaseTestCase):
                                               lease_remaining=1,
                                               host='foo')
 
+    def test_update_lease_expirations(self):
+        with mock.patch.object(self.proxy, 'call') as mock_call:
+            self.proxy.update_lease_expirations({'netid': {'ipaddr': 1}})
+            self.assertEqual(mock_call.call_args[1]['version'], '1.1')
+        self.make_msg.assert_called_once_with('update_lease_expirations',
+                                              leases={'netid': {'ipaddr': 1}},
+                                              host='foo')
+
 
 class TestNetworkCache(base.BaseTestCase):
     def test_put_network(self):
@@ -804,6 +1049,16 @@ class TestNetworkCache(base.BaseTestCase):
         self.assertEqual(nc.port_lookup,
                          {fake_port1.id: fake_network.id})
 
+    def test_network_version(self):
+        nc = dhcp_agent.NetworkCache()
+        self.assertIsNone(nc.get_version(fake_network.id))
+        nc.put(fake_network)
+        version = nc.get_version(fake_network.id)
+        nc.put_port(fake_port1)
+        self.assertNotEqual(nc.get_version(fake_network.id), version)
+        nc.remove(fake_network)
+        self.assertIsNone(nc.get_version(fake_network.id))
+
     def test_put_network_existing(self):
         prev_network_info = mock.Mock()
         nc = dhcp_agent.NetworkCache()
@@ -899,6 +1154,24 @@ class TestNetworkCache(base.BaseTestCase):
         nc.put(fake_network)
         self.assertEqual(nc.get_port_by_id(fake_port1.id), fake_port1)
 
+    def test_put_network_indexes_ports(self):
+        fake_network = FakeModel('12345678-1234-5678-1234567890ab',
+                                 tenant_id='aaaaaaaa-aaaa-aaaa-aaaaaaaaaaaa',
+                                 subnets=[fake_subnet1],
+                                 ports=[fake_port1])
+        nc = dhcp_agent.NetworkCache()
+        nc.put(fake_network)
+        self.assertIsInstance(fake_network.ports, dhcp_agent.NetworkPorts)
+
+        nc.put_port(fake_port2)
+        self.assertEqual(nc.get_port_by_id(fake_port2.id), fake_port2)
+
+    def test_remove_port_unknown(self):
+        nc = dhcp_agent.NetworkCache()
+        nc.put(fake_network)
+        nc.remove_port(fake_port2)
+        self.assertEqual(nc.port_lookup, {fake_port1.id: fake_network.id})
+
 
 class TestDeviceManager(base.BaseTestCase):
     def setUp(self):
@@ -1212,3 +1485,48 @@ class TestDictModel(base.BaseTestCase):
         m = dhcp_agent.DictModel(d)
         self.assertEqual(m.a[0].b, 2)
         self.assertEqual(m.a[1].c, 3)
+
+
+class TestSlotsModel(base.BaseTestCase):
+    def test_port_model(self):
+        d = dict(id='port1', network_id='net1', mac_address='aa:bb',
+                 fixed_ips=[dict(subnet_id='subnet1', ip_address='10.0.0.2')],
+                 security_groups=['sg1'])
+
+        m = dhcp_agent.PortModel(d)
+        self.assertEqual(m.id, 'port1')
+        self.assertEqual(m.fixed_ips[0].ip_address, '10.0.0.2')
+        self.assertIsNone(m.device_owner)
+        self.assertFalse(hasattr(m, 'security_groups'))
+        self.assertFalse(hasattr(m, '__dict__'))
+
+    def test_net_model(self):
+        d = dict(id='net1', admin_state_up=True,
+                 subnets=[dict(id='subnet1', cidr='10.0.0.0/24',
+                               host_routes=[dict(destination='0.0.0.0/0',
+                                                 nexthop='10.0.0.1')])],
+                 ports=[dict(id='port1', fixed_ips=[])])
+
+        m = dhcp_agent.NetModel(d)
+        self.assertTrue(m.admin_state_up)
+        self.assertIsInstance(m.subnets[0], dhcp_agent.SubnetModel)
+        self.assertEqual(m.subnets[0].host_routes[0].nexthop, '10.0.0.1')
+        self.assertIsInstance(m.ports[0], dhcp_agent.PortModel)
+
+
+class TestNetworkPorts(base.BaseTestCase):
+    def test_iterates_in_id_order(self):
+        ports = dhcp_agent.NetworkPorts([fake_port2, fake_port1])
+        self.assertEqual(list(ports), sorted([fake_port1, fake_port2],
+                                             key=lambda port: port.id))
+        self.assertEqual(len(ports), 2)
+
+    def test_put_remove(self):
+        ports = dhcp_agent.NetworkPorts([fake_port1])
+        ports.put(fake_port2)
+        self.assertIn(fake_port2, ports)
+        self.assertEqual(ports.get(fake_port2.id), fake_port2)
+
+        ports.remove(fake_port2.id)
+        self.assertNotIn(fake_port2, ports)
+        self.assertIsNone(ports.get(fake_port2.id))
@@ -0,0 +1,117 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from quantum.api.rpc.agentnotifiers import dhcp_rpc_agent_api
+from quantum.common import constants
+from quantum.tests import base
+
+
+class TestDhcpAgentNotifyAPI(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestDhcpAgentNotifyAPI, self).setUp()
+        self.notifier = dhcp_rpc_agent_api.DhcpAgentNotifyAPI()
+        notification_p = mock.patch.object(self.notifier, '_notification')
+        self.notification = notification_p.start()
+        self.addCleanup(notification_p.stop)
+
+    def test_notify_port(self):
+        port = {'id': 'p1', 'network_id': 'n1'}
+        self.notifier.notify(None, {'port': port}, 'port.create.end')
+        self.notification.assert_called_once_with(
+            None, 'port_create_end', {'port': port}, 'n1')
+
+    def test_notify_ports_bulk_grouped_by_network(self):
+        ports = [{'id': 'p1', 'network_id': 'n1'},
+                 {'id': 'p2', 'network_id': 'n2'},
+                 {'id': 'p3', 'network_id': 'n1'}]
+        self.notifier.notify(None, {'ports': ports}, 'port.create.end')
+        self.assertEqual(self.notification.call_count, 2)
+        self.notification.assert_has_calls(
+            [mock.call(None, 'port_create_end',
+                       {'ports': [ports[0], ports[2]]}, 'n1'),
+             mock.call(None, 'port_create_end',
+                       {'ports': [ports[1]]}, 'n2')],
+            any_order=True)
+
+    def test_notify_subnets_bulk(self):
+        subnets = [{'id': 's1', 'network_id': 'n1'},
+                   {'id': 's2', 'network_id': 'n1'}]
+        self.notifier.notify(None, {'subnets': subnets}, 'subnet.create.end')
+        self.notification.assert_has_calls(
+            [mock.call(None, 'subnet_create_end', {'subnet': subnets[0]},
+                       'n1'),
+             mock.call(None, 'subnet_create_end', {'subnet': subnets[1]},
+                       'n1')])
+
+    def test_notify_invalid_resource(self):
+        self.notifier.notify(None, {'routers': [{'id': 'r1'}]},
+                             'port.create.end')
+        self.assertFalse(self.notification.called)
+
+
+class TestDhcpAgentNotifyAPIBulkPorts(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestDhcpAgentNotifyAPIBulkPorts, self).setUp()
+        self.notifier = dhcp_rpc_agent_api.DhcpAgentNotifyAPI()
+        cast_p = mock.patch.object(self.notifier, 'cast')
+        self.cast = cast_p.start()
+        self.addCleanup(cast_p.stop)
+        fanout_p = mock.patch.object(self.notifier, 'fanout_cast')
+        self.fanout_cast = fanout_p.start()
+        self.addCleanup(fanout_p.stop)
+        plugin_p = mock.patch('quantum.manager.QuantumManager.get_plugin')
+        self.plugin = plugin_p.start().return_value
+        self.addCleanup(plugin_p.stop)
+        ext_p = mock.patch('quantum.common.utils.is_extension_supported')
+        self.ext_supported = ext_p.start()
+        self.addCleanup(ext_p.stop)
+        self.ports = [{'id': 'p1', 'network_id': 'n1'},
+                      {'id': 'p2', 'network_id': 'n1'}]
+
+    def _sent_payloads(self, cast):
+        return [c[0][1]['args']['payload'] for c in cast.call_args_list]
+
+    def _test_notify_ports(self, configurations):
+        self.ext_supported.return_value = True
+        self.plugin.schedule_network.return_value = None
+        self.plugin.get_dhcp_agents_hosting_networks.return_value = [
+            mock.Mock(host='host1', topic='dhcp_agent')]
+        self.plugin.get_configuration_dict.return_value = configurations
+        self.notifier.notify(mock.Mock(), {'ports': self.ports},
+                             'port.create.end')
+        return self._sent_payloads(self.cast)
+
+    def test_notify_ports_bulk_agent(self):
+        payloads = self._test_notify_ports(
+            {constants.DHCP_BULK_PORTS: True})
+        self.assertEqual(payloads, [{'ports': self.ports}])
+
+    def test_notify_ports_older_agent(self):
+        payloads = self._test_notify_ports({})
+        self.assertEqual(payloads, [{'port': self.ports[0]},
+                                    {'port': self.ports[1]}])
+
+    def test_notify_ports_fanout(self):
+        self.ext_supported.return_value = False
+        self.notifier.notify(mock.Mock(), {'ports': self.ports},
+                             'port.create.end')
+        self.assertEqual(self._sent_payloads(self.fanout_cast),
+                         [{'port': self.ports[0]}, {'port': self.ports[1]}])
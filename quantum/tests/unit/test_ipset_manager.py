@@ -0,0 +1,62 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from quantum.agent.linux import ipset_manager
+from quantum.tests import base
+
+
+class IpsetManagerTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(IpsetManagerTestCase, self).setUp()
+        self.execute = mock.Mock()
+        self.ipset = ipset_manager.IpsetManager(execute=self.execute,
+                                                root_helper='sudo')
+
+    def test_get_set_name(self):
+        sg_id = '0b4f0ba5-9d2c-4d0a-8f6e-26f2dfd1dc07'
+        name = ipset_manager.get_set_name(sg_id, 'IPv6')
+        self.assertEqual(name, ('IPv6' + sg_id)[:31])
+        self.assertEqual(len(name), ipset_manager.MAX_SET_NAME_LENGTH)
+
+    def test_set_members_creates_set(self):
+        self.ipset.set_members('IPv6sg', 'IPv6', ['fe80::1'])
+        self.execute.assert_called_once_with(
+            ['ipset', 'restore', '-exist'],
+            process_input='create IPv6sg hash:ip family inet6\n'
+                          'flush IPv6sg\n'
+                          'add IPv6sg fe80::1\n',
+            root_helper='sudo')
+        self.assertTrue(self.ipset.set_exists('IPv6sg'))
+
+    def test_set_members_unchanged(self):
+        self.ipset.set_members('IPv4sg', 'IPv4', ['10.0.0.1'])
+        self.execute.reset_mock()
+        self.ipset.set_members('IPv4sg', 'IPv4', ['10.0.0.1'])
+        self.assertFalse(self.execute.called)
+
+    def test_destroy_set_in_namespace(self):
+        self.ipset.namespace = 'ns'
+        self.ipset.set_members('IPv4sg', 'IPv4', [])
+        self.execute.reset_mock()
+        self.ipset.destroy_set('IPv4sg')
+        self.execute.assert_called_once_with(
+            ['ip', 'netns', 'exec', 'ns', 'ipset', 'destroy', 'IPv4sg'],
+            process_input=None, root_helper='sudo')
+        self.assertFalse(self.ipset.set_exists('IPv4sg'))
@@ -914,3 +914,46 @@ class IptablesFirewallTestCase(base.BaseTestCase):
             pass
         self.iptables_inst.assert_has_calls([call.defer_apply_on(),
                                              call.defer_apply_off()])
+
+    def test_remote_group_with_ipset(self):
+        cfg.CONF.set_override('enable_ipset', True, 'SECURITYGROUP')
+        firewall = IptablesFirewallDriver()
+        firewall.iptables = self.iptables_inst
+        self.iptables_inst.iptables_apply_deferred = False
+        firewall.update_security_group_members(
+            'fake_sgid', {'IPv4': ['10.0.0.2', '10.0.0.3'], 'IPv6': []})
+        # The set is only created once a rule references it
+        self.assertFalse(self.utils_exec.called)
+
+        port = self._fake_port()
+        port['security_group_rules'] = [{'ethertype': 'IPv4',
+                                         'direction': 'ingress',
+                                         'remote_group_id': 'fake_sgid'}]
+        firewall.prepare_port_filter(port)
+        self.v4filter_inst.add_rule.assert_any_call(
+            'ifake_dev', '-j RETURN -m set --match-set IPv4fake_sgid src')
+        self.utils_exec.assert_called_once_with(
+            ['ipset', 'restore', '-exist'],
+            process_input='create IPv4fake_sgid hash:ip family inet\n'
+                          'flush IPv4fake_sgid\n'
+                          'add IPv4fake_sgid 10.0.0.2\n'
+                          'add IPv4fake_sgid 10.0.0.3\n',
+            root_helper=mock.ANY)
+
+        # Member updates only change the set
+        self.utils_exec.reset_mock()
+        self.v4filter_inst.reset_mock()
+        firewall.update_security_group_members(
+            'fake_sgid', {'IPv4': ['10.0.0.3', '10.0.0.4'], 'IPv6': []})
+        self.utils_exec.assert_called_once_with(
+            ['ipset', 'restore', '-exist'],
+            process_input='add IPv4fake_sgid 10.0.0.4\n'
+                          'del IPv4fake_sgid 10.0.0.2\n',
+            root_helper=mock.ANY)
+        self.assertFalse(self.v4filter_inst.add_rule.called)
+
+        self.utils_exec.reset_mock()
+        firewall.remove_port_filter(port)
+        self.utils_exec.assert_called_once_with(
+            ['ipset', 'destroy', 'IPv4fake_sgid'],
+            process_input=None, root_helper=mock.ANY)
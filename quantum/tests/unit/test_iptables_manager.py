@@ -20,6 +20,7 @@
 import inspect
 import os
 
+import mock
 import mox
 
 from quantum.agent.linux import iptables_manager
@@ -302,3 +303,131 @@ class IptablesManagerStateLessTestCase(base.BaseTestCase):
 
     def test_nat_not_found(self):
         self.assertFalse('nat' in self.iptables.ipv4)
+
+    def test_modify_rules_top_rules(self):
+        bn = iptables_manager.binary_name
+        table = self.iptables.ipv4['filter']
+        table.add_rule('FORWARD', '-j ACCEPT', wrap=False, top=True)
+        current = ['*filter',
+                   ':FORWARD ACCEPT [0:0]',
+                   ':%s-FORWARD - [0:0]' % bn,
+                   '-A FORWARD -j DROP',
+                   ' -A FORWARD -j ACCEPT ',
+                   '-A %s-FORWARD -j DROP' % bn,
+                   'COMMIT']
+        new_filter = self.iptables._modify_rules(current, table)
+        rules = [line for line in new_filter if line.startswith('-A')]
+        self.assertEqual(rules[-2:], ['-A FORWARD -j ACCEPT',
+                                      '-A FORWARD -j DROP'])
+        self.assertEqual(new_filter.count('-A FORWARD -j ACCEPT'), 1)
+        self.assertNotIn(' -A FORWARD -j ACCEPT ', new_filter)
+        self.assertNotIn('-A %s-FORWARD -j DROP' % bn, new_filter)
+
+
+class IptablesManagerIncrementalTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(IptablesManagerIncrementalTestCase, self).setUp()
+        self.execute = mock.Mock(return_value='')
+        self.iptables = iptables_manager.IptablesManager(
+            _execute=self.execute, root_helper='sudo', incremental=True)
+        self.bn = iptables_manager.binary_name
+
+    def _restore_inputs(self):
+        return [c[1]['process_input'] for c in self.execute.call_args_list
+                if c[0][0][0] == 'iptables-restore']
+
+    def test_dirty_chains_tracking(self):
+        table = iptables_manager.IptablesTable()
+        table.add_chain('foo')
+        table.add_rule('FORWARD', '-j $foo', wrap=False)
+        self.assertEqual(table.dirty_chains,
+                         set([('foo', True), ('FORWARD', False)]))
+        table.dirty_chains.clear()
+        table.remove_chain('foo')
+        self.assertEqual(table.dirty_chains,
+                         set([('foo', True), ('FORWARD', False)]))
+
+    def test_first_apply_is_full(self):
+        self.iptables.apply()
+        self.assertIn(mock.call(['iptables-save', '-t', 'filter'],
+                                root_helper='sudo'),
+                      self.execute.call_args_list)
+        self.assertEqual(sorted(self.iptables.apply_stats),
+                         ['diff', 'restore', 'save'])
+        self.assertFalse(self.iptables.ipv4['filter'].dirty_chains)
+
+    def test_apply_changed_chains_only(self):
+        self.iptables.apply()
+        self.execute.reset_mock()
+        filter_table = self.iptables.ipv4['filter']
+        filter_table.add_chain('foo')
+        filter_table.add_rule('foo', '-j ACCEPT')
+        filter_table.add_rule('INPUT', '-j $foo')
+        self.iptables.apply()
+        self.execute.assert_called_once_with(
+            ['iptables-restore', '--noflush'], root_helper='sudo',
+            process_input='\n'.join([
+                '*filter',
+                ':%s-INPUT - [0:0]' % self.bn,
+                ':%s-foo - [0:0]' % self.bn,
+                '-A %s-INPUT -j %s-foo' % (self.bn, self.bn),
+                '-A %s-foo -j ACCEPT' % self.bn,
+                'COMMIT',
+                '']))
+
+    def test_apply_unchanged_chain_content(self):
+        filter_table = self.iptables.ipv4['filter']
+        filter_table.add_chain('foo')
+        filter_table.add_rule('foo', '-j ACCEPT')
+        self.iptables.apply()
+        self.execute.reset_mock()
+        filter_table.empty_chain('foo')
+        filter_table.add_rule('foo', '-j ACCEPT')
+        self.iptables.apply()
+        self.assertFalse(self.execute.called)
+
+    def test_apply_removed_chain(self):
+        filter_table = self.iptables.ipv4['filter']
+        filter_table.add_chain('foo')
+        filter_table.add_rule('INPUT', '-j $foo')
+        self.iptables.apply()
+        self.execute.reset_mock()
+        filter_table.remove_chain('foo')
+        self.iptables.apply()
+        self.assertEqual(self._restore_inputs(), ['\n'.join([
+            '*filter',
+            ':%s-INPUT - [0:0]' % self.bn,
+            ':%s-foo - [0:0]' % self.bn,
+            '-X %s-foo' % self.bn,
+            'COMMIT',
+            ''])])
+
+    def test_apply_unwrapped_chain_change_is_full(self):
+        self.iptables.apply()
+        self.execute.reset_mock()
+        self.iptables.ipv4['filter'].add_rule('FORWARD', '-j DROP',
+                                              wrap=False)
+        self.iptables.apply()
+        self.assertIn(mock.call(['iptables-save', '-t', 'filter'],
+                                root_helper='sudo'),
+                      self.execute.call_args_list)
+        self.assertNotIn('--noflush',
+                         [a for c in self.execute.call_args_list
+                          for a in c[0][0]])
+
+    def test_apply_incremental_failure_falls_back_to_full(self):
+        self.iptables.apply()
+        self.execute.reset_mock()
+
+        def execute(args, **kwargs):
+            if '--noflush' in args:
+                raise RuntimeError()
+            return ''
+        self.execute.side_effect = execute
+        self.iptables.ipv4['filter'].add_chain('foo')
+        self.iptables.apply()
+        self.assertIn(mock.call(['iptables-save', '-t', 'filter'],
+                                root_helper='sudo'),
+                      self.execute.call_args_list)
+        self.assertFalse(self.iptables.ipv4['filter'].dirty_chains)
@@ -15,6 +15,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
 import copy
 
 import mock
@@ -362,6 +363,49 @@ class TestBasicRouterOperations(base.BaseTestCase):
         del router['gw_port']
         agent.process_router(ri)
 
+    def testProcessRouterFloatingIPsDiff(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        fips = [{'id': _uuid(),
+                 'floating_ip_address': '8.8.8.%d' % i,
+                 'fixed_ip_address': '7.7.7.%d' % i,
+                 'port_id': _uuid()} for i in range(4)]
+        ri = l3_agent.RouterInfo(_uuid(), self.conf.root_helper,
+                                 self.conf.use_namespaces,
+                                 router={l3_constants.FLOATINGIP_KEY: fips})
+        ex_gw_port = {'id': _uuid()}
+        ri.ex_gw_port = ex_gw_port
+        with contextlib.nested(
+            mock.patch.object(agent, '_floating_ips_added'),
+            mock.patch.object(agent, 'floating_ip_added'),
+            mock.patch.object(agent, 'floating_ip_removed')
+        ) as (fips_added, fip_added, fip_removed):
+            agent.process_router_floating_ips(ri, ex_gw_port)
+            fips_added.assert_called_once_with(
+                ri, ex_gw_port,
+                [(fip['floating_ip_address'], fip['fixed_ip_address'])
+                 for fip in fips])
+            self.assertFalse(fip_added.called)
+            self.assertFalse(fip_removed.called)
+
+            fips_added.reset_mock()
+            remapped = dict(fips[1], fixed_ip_address='7.7.7.10')
+            unassociated = dict(fips[2], port_id=None)
+            ri.router[l3_constants.FLOATINGIP_KEY] = [
+                fips[0], remapped, unassociated]
+            agent.process_router_floating_ips(ri, ex_gw_port)
+            self.assertFalse(fips_added.called)
+            fip_added.assert_called_once_with(ri, ex_gw_port, '8.8.8.1',
+                                              '7.7.7.10')
+            self.assertEqual(fip_removed.call_count, 3)
+            fip_removed.assert_has_calls(
+                [mock.call(ri, ex_gw_port, '8.8.8.1', '7.7.7.1'),
+                 mock.call(ri, ex_gw_port, '8.8.8.2', '7.7.7.2'),
+                 mock.call(ri, ex_gw_port, '8.8.8.3', '7.7.7.3')],
+                any_order=True)
+        self.assertEqual(sorted(ri.floating_ips),
+                         sorted([fips[0]['id'], fips[1]['id']]))
+        self.assertEqual(ri.floating_ips[fips[1]['id']], remapped)
+
     def testRoutersWithAdminStateDown(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
         self.plugin_api.get_external_network_id.return_value = None
@@ -390,6 +434,177 @@ class TestBasicRouterOperations(base.BaseTestCase):
         self.device_exists.assert_has_calls(
             [mock.call(self.conf.external_network_bridge)])
 
+    def _make_routers(self, count):
+        return [{'id': _uuid(),
+                 'admin_state_up': True,
+                 'routes': [],
+                 'external_gateway_info': {}} for i in range(count)]
+
+    def testProcessRoutersContinuesAfterFailure(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_external_network_id.return_value = None
+        routers = self._make_routers(3)
+        with mock.patch.object(agent, 'process_router',
+                               side_effect=[None, RuntimeError, None]):
+            self.assertRaises(Exception, agent._process_routers, routers)
+        self.assertEqual(set(agent.router_info),
+                         set(r['id'] for r in routers))
+
+    def testSyncSkipsRoutersUpdatedDuringSync(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_external_network_id.return_value = None
+        stale, deleted = self._make_routers(2)
+
+        def get_routers(context, router_id):
+            # notifications processed while the routers are fetched
+            agent.router_update_seq[stale['id']] = agent._next_seq()
+            agent.router_deleted(None, deleted['id'])
+            return [stale, deleted]
+
+        self.plugin_api.get_routers.side_effect = get_routers
+        with mock.patch.object(agent, 'process_router') as process_router:
+            agent._sync_routers_task(None)
+        self.assertFalse(process_router.called)
+        self.assertEqual(agent.router_info, {})
+        self.assertFalse(agent.fullsync)
+
+    def testSyncDoesNotRemoveRoutersAddedDuringSync(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_external_network_id.return_value = None
+        added = self._make_routers(1)
+
+        def get_routers(context, router_id):
+            agent.routers_updated(None, added)
+            return []
+
+        self.plugin_api.get_routers.side_effect = get_routers
+        agent._sync_routers_task(None)
+        self.assertIn(added[0]['id'], agent.router_info)
+
+    def _prepare_delta_router(self, agent):
+        self.plugin_api.get_external_network_id.return_value = None
+        ex_gw_port = {'id': _uuid(),
+                      'network_id': _uuid(),
+                      'fixed_ips': [{'ip_address': '19.4.4.4',
+                                     'subnet_id': _uuid()}],
+                      'subnet': {'cidr': '19.4.4.0/24',
+                                 'gateway_ip': '19.4.4.1'}}
+        fips = [{'id': _uuid(),
+                 'floating_ip_address': '8.8.8.%d' % i,
+                 'fixed_ip_address': '7.7.7.%d' % i,
+                 'port_id': _uuid()} for i in range(3)]
+        router = {'id': _uuid(),
+                  'admin_state_up': True,
+                  'routes': [],
+                  'external_gateway_info': {},
+                  'gw_port': ex_gw_port,
+                  l3_constants.INTERFACE_KEY: [],
+                  l3_constants.FLOATINGIP_KEY: fips,
+                  l3_constants.REVISION_KEY: {'epoch': 'e', 'revision': 1}}
+        agent._process_routers([router])
+        return router
+
+    def _delta_router(self, router, base_revision, updated, removed):
+        delta_router = dict(router)
+        del delta_router[l3_constants.FLOATINGIP_KEY]
+        delta_router[l3_constants.REVISION_KEY] = {
+            'epoch': 'e', 'revision': base_revision + 1}
+        delta_router[l3_constants.FLOATINGIP_DELTA_KEY] = {
+            'base_revision': base_revision,
+            'updated': updated,
+            'removed': removed}
+        return delta_router
+
+    def testProcessRouterFloatingIPDelta(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router = self._prepare_delta_router(agent)
+        fips = router[l3_constants.FLOATINGIP_KEY]
+        new_fip = {'id': _uuid(),
+                   'floating_ip_address': '8.8.8.9',
+                   'fixed_ip_address': '7.7.7.9',
+                   'port_id': _uuid()}
+        remapped = dict(fips[1], fixed_ip_address='7.7.7.10')
+        delta_router = self._delta_router(router, 1, [new_fip, remapped],
+                                          [fips[0]['id']])
+        with contextlib.nested(
+            mock.patch.object(agent, '_floating_ips_added'),
+            mock.patch.object(agent, 'floating_ip_added'),
+            mock.patch.object(agent, 'floating_ip_removed')
+        ) as (fips_added, fip_added, fip_removed):
+            agent._process_routers([delta_router])
+        fips_added.assert_called_once_with(
+            mock.ANY, mock.ANY, [('8.8.8.9', '7.7.7.9')])
+        self.assertEqual(fip_added.call_count, 1)
+        self.assertEqual(fip_removed.call_count, 2)
+        ri = agent.router_info[router['id']]
+        self.assertEqual(ri.revision['revision'], 2)
+        self.assertEqual(
+            sorted(ri.floating_ips),
+            sorted([new_fip['id'], fips[1]['id'], fips[2]['id']]))
+        self.assertEqual(
+            sorted(fip['id'] for fip in
+                   ri.router[l3_constants.FLOATINGIP_KEY]),
+            sorted(ri.floating_ips))
+        self.assertNotIn(l3_constants.FLOATINGIP_DELTA_KEY, ri.router)
+        self.assertFalse(self.plugin_api.get_routers.called)
+
+    def testProcessRouterFloatingIPDeltaMissedRevision(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router = self._prepare_delta_router(agent)
+        fetched = dict(router, **{l3_constants.REVISION_KEY:
+                                  {'epoch': 'e', 'revision': 3}})
+        self.plugin_api.get_routers.return_value = [fetched]
+        agent._process_routers([self._delta_router(router, 2, [], [])])
+        self.plugin_api.get_routers.assert_called_once_with(
+            agent.context, router_id=router['id'])
+        self.assertEqual(agent.router_info[router['id']].revision['revision'],
+                         3)
+
+    def testProcessRouterOutdatedRevision(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router = self._prepare_delta_router(agent)
+        agent.router_info[router['id']].revision = {'epoch': 'e',
+                                                    'revision': 5}
+        with mock.patch.object(agent, 'process_router') as process_router:
+            agent._process_routers([router])
+        self.assertFalse(process_router.called)
+
+    def testOlderNotificationSkipped(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_external_network_id.return_value = None
+        router = self._make_routers(1)[0]
+        older_seq = agent._next_seq()
+        agent.router_deleted(None, router['id'])
+        with mock.patch.object(agent, 'process_router') as process_router:
+            agent._process_routers([router], seq=older_seq)
+        self.assertFalse(process_router.called)
+        self.assertEqual(agent.router_info, {})
+
+    def testRouterDeletedForgetsRouter(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_external_network_id.return_value = None
+        router = self._make_routers(1)[0]
+        with mock.patch.object(agent, 'process_router'):
+            agent.routers_updated(None, [router])
+            self.assertIn(router['id'], agent.router_locks)
+            agent.router_deleted(None, router['id'])
+        self.assertEqual(agent.router_info, {})
+        self.assertEqual(agent.router_locks, {})
+        self.assertEqual(agent.router_update_seq, {})
+
+    def testRouterDeletedKeepsSeqForOlderWork(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router_id = _uuid()
+        older_seq = agent._next_seq()
+        agent.seqs_in_progress.add(older_seq)
+        agent.router_deleted(None, router_id)
+        self.assertIn(router_id, agent.router_update_seq)
+        self.assertEqual(agent.router_locks, {})
+
+        agent.seqs_in_progress.discard(older_seq)
+        agent._forget_removed_routers()
+        self.assertEqual(agent.router_update_seq, {})
+
     def testDestroyNamespace(self):
 
         class FakeDev(object):
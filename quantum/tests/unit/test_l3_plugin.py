@@ -1572,6 +1572,47 @@ class L3NatDBTestCase(L3NatTestCaseBase):
     def test_floatingips_op_agent(self):
         self._test_notify_op_agent(self._test_floatingips_op_agent)
 
+    def _test_floatingips_delta_op_agent(self, notifyApi):
+        with self.floatingip_with_assoc() as fip:
+            fip_id = fip['floatingip']['id']
+        # add gateway, add interface, associate, deletion of floatingip,
+        # delete gateway, delete interface
+        calls = notifyApi.routers_updated.call_args_list
+        self.assertEqual(6, len(calls))
+        for call, operation, updated_ids, removed_ids in (
+                (calls[2], 'create_floatingip', [fip_id], []),
+                (calls[3], 'delete_floatingip', [], [fip_id])):
+            ctx, routers, op = call[0]
+            self.assertEqual(op, operation)
+            self.assertEqual(1, len(routers))
+            self.assertNotIn(l3_constants.FLOATINGIP_KEY, routers[0])
+            self.assertEqual(1, len(routers[0][l3_constants.INTERFACE_KEY]))
+            delta = routers[0][l3_constants.FLOATINGIP_DELTA_KEY]
+            self.assertEqual([f['id'] for f in delta['updated']],
+                             updated_ids)
+            self.assertEqual(delta['removed'], removed_ids)
+            revision = routers[0][l3_constants.REVISION_KEY]
+            self.assertEqual(delta['base_revision'],
+                             revision['revision'] - 1)
+
+    def test_floatingips_delta_op_agent(self):
+        cfg.CONF.set_override('router_floatingip_deltas', True)
+        self._test_notify_op_agent(self._test_floatingips_delta_op_agent)
+
+    def test_l3_agent_routers_query_revision(self):
+        with self.router() as r:
+            plugin = TestL3NatPlugin()
+            ctx = context.get_admin_context()
+            routers = plugin.get_sync_data(ctx, [r['router']['id']])
+            revision = routers[0][l3_constants.REVISION_KEY]
+            self._update('routers', r['router']['id'],
+                         {'router': {'name': 'renamed'}})
+            routers = plugin.get_sync_data(ctx, [r['router']['id']])
+            new_revision = routers[0][l3_constants.REVISION_KEY]
+            self.assertEqual(new_revision['epoch'], revision['epoch'])
+            self.assertEqual(new_revision['revision'],
+                             revision['revision'] + 1)
+
     def test_l3_agent_routers_query_interfaces(self):
         with self.router() as r:
             with self.port(no_delete=True) as p:
@@ -558,6 +558,25 @@ tag:tag1,option:classless-static-route,%s,%s""".lstrip() % (fake_v6,
                                     mock.call(exp_opt_name, exp_opt_data)])
         self.execute.assert_called_once_with(exp_args, 'sudo')
 
+    def test_reload_allocations_unchanged(self):
+        with mock.patch.object(dhcp.Dnsmasq, 'get_conf_file_name') as conf_fn:
+            conf_fn.return_value = '/foo/conf'
+            dm = dhcp.Dnsmasq(self.conf, FakeDualNetwork(),
+                              namespace='qdhcp-ns')
+            with mock.patch.object(dm, '_hosts_file_data') as hosts_data:
+                hosts_data.return_value = 'hosts'
+                with mock.patch.object(dm, '_opts_file_data') as opts_data:
+                    opts_data.return_value = 'opts'
+                    with mock.patch('__builtin__.open') as mock_open:
+                        mock_open.return_value.__enter__ = lambda s: s
+                        mock_open.return_value.__exit__ = mock.Mock()
+                        mock_open.return_value.read.side_effect = ['hosts',
+                                                                   'opts']
+                        dm.reload_allocations()
+
+        self.assertFalse(self.safe.called)
+        self.assertFalse(self.execute.called)
+
     def test_reload_allocations_stale_pid(self):
         exp_host_name = '/dhcp/cccccccc-cccc-cccc-cccc-cccccccccccc/host'
         exp_host_data = """
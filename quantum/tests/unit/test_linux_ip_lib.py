@@ -15,6 +15,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import eventlet
 import mock
 
 from quantum.agent.linux import ip_lib
@@ -150,6 +151,110 @@ class TestSubProcessBase(base.BaseTestCase):
                           [], 'link', ('list',))
 
 
+class TestIpBatch(base.BaseTestCase):
+    def setUp(self):
+        super(TestIpBatch, self).setUp()
+        self.execute_p = mock.patch('quantum.agent.linux.utils.execute')
+        self.execute = self.execute_p.start()
+        self.execute.return_value = ''
+        self.addCleanup(self.execute_p.stop)
+        self.device = ip_lib.IPDevice('eth0', 'sudo', 'ns')
+
+    def _batch_call(self, options, lines):
+        return mock.call(['ip', 'netns', 'exec', 'ns', 'ip'] + options +
+                         ['-batch', '-'],
+                         root_helper='sudo',
+                         process_input='\n'.join(lines + ['']))
+
+    def test_batch_deferred_commands(self):
+        with ip_lib.batch('sudo', 'ns'):
+            self.device.link.set_up()
+            self.device.link.set_mtu(1450)
+            self.device.addr.add(4, '10.0.0.2/24', '10.0.0.255')
+            self.device.addr.add(4, '10.0.1.2/24', '10.0.1.255')
+            self.assertFalse(self.execute.called)
+        self.assertEqual(
+            self.execute.call_args_list,
+            [self._batch_call([], ['link set eth0 up',
+                                   'link set eth0 mtu 1450']),
+             self._batch_call(['-4'],
+                              ['addr add 10.0.0.2/24 brd 10.0.0.255 scope '
+                               'global dev eth0',
+                               'addr add 10.0.1.2/24 brd 10.0.1.255 scope '
+                               'global dev eth0'])])
+
+    def test_batch_flushed_before_read(self):
+        with ip_lib.batch('sudo', 'ns'):
+            self.device.link.set_up()
+            self.device.addr.list()
+            self.assertEqual(
+                self.execute.call_args_list,
+                [self._batch_call([], ['link set eth0 up']),
+                 mock.call(['ip', 'netns', 'exec', 'ns', 'ip', 'addr',
+                            'show', 'eth0'], root_helper='sudo')])
+
+    def test_batch_flushed_before_netns_execute(self):
+        with ip_lib.batch('sudo', 'ns'):
+            self.device.link.set_up()
+            ip_lib.IPWrapper('sudo', 'ns').netns.execute(['arping'])
+            self.assertEqual(
+                self.execute.call_args_list,
+                [self._batch_call([], ['link set eth0 up']),
+                 mock.call(['ip', 'netns', 'exec', 'ns', 'arping'],
+                           root_helper='sudo', check_exit_code=True)])
+
+    def test_batch_set_netns_not_deferred(self):
+        with ip_lib.batch('sudo', 'ns'):
+            self.device.link.set_netns('ns2')
+            self.execute.assert_called_once_with(
+                ['ip', 'netns', 'exec', 'ns', 'ip', 'link', 'set', 'eth0',
+                 'netns', 'ns2'], root_helper='sudo')
+
+    def test_batch_other_namespace_not_deferred(self):
+        with ip_lib.batch('sudo', 'ns2'):
+            self.device.link.set_up()
+            self.execute.assert_called_once_with(
+                ['ip', 'netns', 'exec', 'ns', 'ip', 'link', 'set', 'eth0',
+                 'up'], root_helper='sudo')
+
+    def test_batch_other_greenthread_not_deferred(self):
+        with ip_lib.batch('sudo', 'ns'):
+            self.device.link.set_up()
+            eventlet.spawn(self.device.link.set_mtu, 1450).wait()
+            self.execute.assert_called_once_with(
+                ['ip', 'netns', 'exec', 'ns', 'ip', 'link', 'set', 'eth0',
+                 'mtu', 1450], root_helper='sudo')
+        self.assertEqual(self.execute.call_args_list[1:],
+                         [self._batch_call([], ['link set eth0 up'])])
+
+    def test_batch_discarded_on_error(self):
+        def _fail():
+            with ip_lib.batch('sudo', 'ns'):
+                self.device.link.set_up()
+                raise ValueError()
+
+        self.assertRaises(ValueError, _fail)
+        self.assertFalse(self.execute.called)
+        self.assertEqual(ip_lib._BATCHES, {})
+
+    def test_batch_failure_names_command(self):
+        self.execute.side_effect = RuntimeError('Command failed -:2')
+
+        def _run():
+            with ip_lib.batch('sudo', 'ns'):
+                self.device.link.set_up()
+                self.device.link.set_mtu(1450)
+                self.device.link.set_down()
+                self.device.addr.add(4, '10.0.0.2/24', '10.0.0.255')
+
+        e = self.assertRaises(RuntimeError, _run)
+        self.assertIn("Deferred command 'ip link set eth0 mtu 1450' failed "
+                      "in namespace ns, 2 deferred command(s) were not run",
+                      str(e))
+        self.assertEqual(self.execute.call_count, 1)
+        self.assertEqual(ip_lib._BATCHES, {})
+
+
 class TestIpWrapper(base.BaseTestCase):
     def setUp(self):
         super(TestIpWrapper, self).setUp()
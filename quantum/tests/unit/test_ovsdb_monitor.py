@@ -0,0 +1,116 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from quantum.agent.linux import ovsdb_monitor
+from quantum.openstack.common import jsonutils
+from quantum.tests import base
+
+
+HEADINGS = ['row', 'action', 'name', 'external_ids']
+
+
+def _update(*rows):
+    return jsonutils.dumps({'headings': HEADINGS, 'data': list(rows)})
+
+
+def _vif_ids(vif_id, mac='fa:16:3e:00:00:01'):
+    return ['map', [['attached-mac', mac], ['iface-id', vif_id]]]
+
+
+class TestInterfaceMonitor(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestInterfaceMonitor, self).setUp()
+        self.monitor = ovsdb_monitor.InterfaceMonitor()
+
+    def test_initial_and_inserted_vifs(self):
+        self.monitor.process_update(_update(
+            ['u1', 'initial', 'tap1', _vif_ids('vif1')],
+            ['u2', 'initial', 'patch-tun', ['map', []]]))
+        self.monitor.process_update(_update(
+            ['u3', 'insert', 'tap3', _vif_ids('vif3')]))
+        self.assertTrue(self.monitor.wait(0))
+        self.assertEqual(self.monitor.get_events(),
+                         ({'tap1': 'vif1', 'tap3': 'vif3'}, set(), False))
+        self.assertEqual(self.monitor.get_events(), ({}, set(), False))
+        self.assertFalse(self.monitor.wait(0))
+
+    def test_deleted_vif(self):
+        self.monitor.process_update(_update(
+            ['u1', 'initial', 'tap1', _vif_ids('vif1')]))
+        self.monitor.get_events()
+        self.monitor.process_update(_update(['u1', 'delete', 'tap1',
+                                             _vif_ids('vif1')]))
+        self.assertEqual(self.monitor.get_events(),
+                         ({}, set(['vif1']), False))
+
+    def test_inserted_then_deleted_vif(self):
+        self.monitor.process_update(_update(
+            ['u1', 'insert', 'tap1', _vif_ids('vif1')]))
+        self.monitor.process_update(_update(
+            ['u1', 'delete', 'tap1', _vif_ids('vif1')]))
+        self.assertEqual(self.monitor.get_events(),
+                         ({}, set(['vif1']), False))
+
+    def test_external_ids_set_after_insert(self):
+        self.monitor.process_update(_update(
+            ['u1', 'insert', 'tap1', ['map', []]]))
+        self.assertEqual(self.monitor.get_events(), ({}, set(), False))
+        self.monitor.process_update(_update(
+            ['u1', 'old', None, ['map', []]],
+            ['u1', 'new', 'tap1', _vif_ids('vif1')]))
+        self.assertEqual(self.monitor.get_events(),
+                         ({'tap1': 'vif1'}, set(), False))
+
+    def test_xenserver_vif_needs_resync(self):
+        self.monitor.process_update(_update(
+            ['u1', 'insert', 'tap1',
+             ['map', [['attached-mac', 'fa:16:3e:00:00:01'],
+                      ['xs-vif-uuid', 'xs1']]]]))
+        self.assertEqual(self.monitor.get_events(), ({}, set(), True))
+
+
+class TestInterfaceMonitorStop(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestInterfaceMonitorStop, self).setUp()
+        execute_p = mock.patch.object(ovsdb_monitor.agent_utils, 'execute')
+        self.execute = execute_p.start()
+        self.addCleanup(execute_p.stop)
+        self.process = mock.Mock(pid=100)
+
+    def _stop(self, root_helper):
+        monitor = ovsdb_monitor.InterfaceMonitor(root_helper)
+        monitor._process = self.process
+        monitor.stop()
+        self.assertIsNone(monitor._process)
+        self.process.wait.assert_called_once_with()
+
+    def test_stop_without_root_helper(self):
+        self._stop(None)
+        self.process.kill.assert_called_once_with()
+        self.assertFalse(self.execute.called)
+
+    def test_stop_kills_child_of_root_helper(self):
+        # sudo (100) -> quantum-rootwrap (101) -> ovsdb-client (102)
+        self.execute.side_effect = ['101\n', '102\n', '', '']
+        self._stop('sudo')
+        self.assertFalse(self.process.kill.called)
+        self.assertEqual(self.execute.call_args_list[-1],
+                         mock.call(['kill', '-9', '102'], root_helper='sudo'))
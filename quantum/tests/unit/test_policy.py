@@ -130,6 +130,18 @@ class PolicyTestCase(base.BaseTestCase):
             self.assertRaises(exceptions.PolicyNotAuthorized, policy.enforce,
                               self.context, action, target)
 
+    def test_enforce_falsy_check_throws(self):
+
+        class FalsyCheck(common_policy.Check):
+            def __call__(self, target, cred):
+                return None
+
+        with mock.patch.dict(common_policy._checks, {'falsy': FalsyCheck}):
+            common_policy.set_rules(common_policy.Rules(
+                {'example:falsy': common_policy.parse_rule('falsy:x')}))
+            self.assertRaises(exceptions.PolicyNotAuthorized, policy.enforce,
+                              self.context, 'example:falsy', self.target)
+
     def test_templatized_enforcement(self):
         target_mine = {'tenant_id': 'fake'}
         target_not_mine = {'tenant_id': 'another'}
@@ -324,6 +336,89 @@ class QuantumPolicyTestCase(base.BaseTestCase):
             result = policy.enforce(self.context, action, target, self.plugin)
             self.assertTrue(result)
 
+    def test_check_list_parentresource_owner(self):
+        self.rules['get_port'] = common_policy.parse_rule(
+            "rule:admin_or_network_owner")
+        targets = [{'id': 'port1', 'network_id': 'net1'},
+                   {'id': 'port2', 'network_id': 'net2'},
+                   {'id': 'port3', 'network_id': 'net1'}]
+        networks = [{'id': 'net1', 'tenant_id': 'fake'},
+                    {'id': 'net2', 'tenant_id': 'somebody_else'}]
+        with mock.patch.object(self.plugin, 'get_networks',
+                               return_value=networks) as get_networks:
+            with mock.patch.object(self.plugin, 'get_network') as get_network:
+                result = policy.check_list(self.context, 'get_port', targets,
+                                           self.plugin)
+
+                self.assertEqual([t['id'] for t in result],
+                                 ['port1', 'port3'])
+                get_networks.assert_called_once_with(
+                    self.context, filters={'id': mock.ANY},
+                    fields=['id', 'tenant_id'])
+                self.assertEqual(
+                    sorted(get_networks.call_args[1]['filters']['id']),
+                    ['net1', 'net2'])
+                self.assertFalse(get_network.called)
+
+    def test_check_list_parent_not_listed(self):
+        self.rules['get_port'] = common_policy.parse_rule(
+            "rule:admin_or_network_owner")
+        targets = [{'id': 'port1', 'network_id': 'net1'},
+                   {'id': 'port2', 'network_id': 'net1'}]
+        with mock.patch.object(self.plugin, 'get_networks', return_value=[]):
+            with mock.patch.object(self.plugin, 'get_network') as get_network:
+                get_network.return_value = {'tenant_id': 'fake'}
+                result = policy.check_list(self.context, 'get_port', targets,
+                                           self.plugin)
+
+                self.assertEqual(result, targets)
+                get_network.assert_called_once_with(self.context, 'net1',
+                                                    fields=['tenant_id'])
+
+    def test_check_list_no_parent(self):
+        targets = [{'shared': True, 'tenant_id': 'somebody_else'},
+                   {'shared': False, 'tenant_id': 'somebody_else'},
+                   {'shared': False, 'tenant_id': 'fake'}]
+        with mock.patch.object(self.plugin, 'get_networks') as get_networks:
+            result = policy.check_list(self.context, 'get_network', targets,
+                                       self.plugin)
+            self.assertEqual(result, [targets[0], targets[2]])
+            self.assertFalse(get_networks.called)
+
+    def test_check_list_memoizes_results(self):
+        targets = ([{'id': i, 'tenant_id': 'fake', 'shared': False}
+                    for i in range(5)] +
+                   [{'id': i, 'tenant_id': 'somebody_else', 'shared': False}
+                    for i in range(5, 10)])
+        with mock.patch.object(policy.FieldCheck, '__call__',
+                               return_value=False) as field_check:
+            result = policy.check_list(self.context, 'get_network', targets,
+                                       self.plugin)
+
+            self.assertEqual(result, targets[:5])
+            # The shared and external checks of the networks of somebody
+            # else are evaluated once
+            self.assertEqual(field_check.call_count, 2)
+
+    def test_match_rule_compiled_once(self):
+        target = {'tenant_id': 'fake'}
+        with mock.patch.object(policy, '_build_match_rule',
+                               wraps=policy._build_match_rule) as build:
+            policy.enforce(self.context, 'get_network', target)
+            policy.enforce(self.context, 'get_network', target)
+            self.assertEqual(build.call_count, 1)
+
+            policy.enforce(self.context, 'create_network', target)
+            policy.enforce(self.context, 'create_network',
+                           dict(target, shared=False))
+            self.assertEqual(build.call_count, 2)
+
+    def test_match_rule_recompiled_on_reload(self):
+        target = {'tenant_id': 'somebody_else'}
+        self.assertFalse(policy.check(self.context, 'get_network', target))
+        self.rules['get_network'] = common_policy.parse_rule('@')
+        self.assertTrue(policy.check(self.context, 'get_network', target))
+
     def test_get_roles_context_is_admin_rule_missing(self):
         rules = dict((k, common_policy.parse_rule(v)) for k, v in {
             "some_other_rule": "role:admin",
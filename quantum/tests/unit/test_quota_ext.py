@@ -9,6 +9,8 @@ from quantum.common import config
 from quantum.common import exceptions
 from quantum import context
 from quantum.db import api as db
+from quantum.db import models_v2
+from quantum.db import quota_db
 from quantum import manager
 from quantum.plugins.linuxbridge.db import l2network_db_v2
 from quantum import quota
@@ -78,11 +80,12 @@ class QuotaExtensionTestCase(testlib_api.WebTestCase):
 
 class QuotaExtensionDbTestCase(QuotaExtensionTestCase):
     fmt = 'json'
+    quota_driver = 'quantum.db.quota_db.DbQuotaDriver'
 
     def setUp(self):
         cfg.CONF.set_override(
             'quota_driver',
-            'quantum.db.quota_db.DbQuotaDriver',
+            self.quota_driver,
             group='QUOTAS')
         super(QuotaExtensionDbTestCase, self).setUp()
 
@@ -292,6 +295,109 @@ class QuotaExtensionDbTestCaseXML(QuotaExtensionDbTestCase):
     fmt = 'xml'
 
 
+class QuotaExtensionUsageDbTestCase(QuotaExtensionDbTestCase):
+    quota_driver = 'quantum.db.quota_db.UsageDbQuotaDriver'
+
+    def setUp(self):
+        super(QuotaExtensionUsageDbTestCase, self).setUp()
+        self.tenant_id = 'tenant_id1'
+        self.context = context.Context('', self.tenant_id)
+        self.count_plugin = mock.Mock()
+        self.count_plugin.get_networks_count.return_value = 2
+
+    def _reserve(self, networks):
+        return quota.QUOTAS.make_reservation(
+            self.context, self.tenant_id, {'network': networks},
+            self.count_plugin, 'networks', self.tenant_id)
+
+    def _usage(self):
+        return self.context.session.query(quota_db.QuotaUsage).filter_by(
+            tenant_id=self.tenant_id, resource='network').one()
+
+    def _add_network(self):
+        network = models_v2.Network(id='net-id', tenant_id=self.tenant_id,
+                                    name='net', status='ACTIVE',
+                                    admin_state_up=True, shared=False)
+        with self.context.session.begin():
+            self.context.session.add(network)
+        return network
+
+    def test_make_reservation_counts_once(self):
+        self.assertEqual(1, len(self._reserve(3)))
+        self._reserve(3)
+        self.assertEqual(
+            1, self.count_plugin.get_networks_count.call_count)
+        self.assertEqual(2, self._usage().in_use)
+
+    def test_make_reservation_with_over_quota(self):
+        self._reserve(3)
+        self._reserve(3)
+        with testtools.ExpectedException(exceptions.OverQuota):
+            self._reserve(3)
+
+    def test_make_reservation_with_invalid_quota_value(self):
+        with testtools.ExpectedException(exceptions.InvalidQuotaValue):
+            self._reserve(-1)
+
+    def test_cancel_reservation_releases_resources(self):
+        reservation = self._reserve(8)
+        quota.QUOTAS.cancel_reservation(self.context, reservation)
+        self._reserve(8)
+
+    def test_commit_reservation_releases_resources(self):
+        reservation = self._reserve(8)
+        quota.QUOTAS.commit_reservation(self.context, reservation)
+        self._reserve(8)
+
+    def test_expired_reservation_releases_resources(self):
+        cfg.CONF.set_override('reservation_expire', -1, group='QUOTAS')
+        self._reserve(8)
+        self._reserve(8)
+
+    def test_usage_follows_created_and_deleted_resources(self):
+        self._reserve(1)
+        network = self._add_network()
+        self.assertEqual(3, self._usage().in_use)
+        with self.context.session.begin():
+            self.context.session.delete(network)
+        self.assertEqual(2, self._usage().in_use)
+        self._reserve(1)
+        self.assertEqual(
+            1, self.count_plugin.get_networks_count.call_count)
+
+    def test_created_resource_taken_from_reservation(self):
+        reservation = self._reserve(8)
+        self._add_network()
+        self.assertEqual(3, self._usage().in_use)
+        delta = self.context.session.query(quota_db.Reservation.delta).filter(
+            quota_db.Reservation.id.in_(reservation)).scalar()
+        self.assertEqual(7, delta)
+        with testtools.ExpectedException(exceptions.OverQuota):
+            self._reserve(1)
+        quota.QUOTAS.commit_reservation(self.context, reservation)
+        self._reserve(7)
+
+    def test_bulk_delete_marks_usage_dirty(self):
+        self._reserve(1)
+        self._add_network()
+        with self.context.session.begin():
+            self.context.session.query(models_v2.Network).filter_by(
+                tenant_id=self.tenant_id).delete()
+        self.assertTrue(self._usage().dirty)
+        self._reserve(1)
+        self.assertEqual(
+            2, self.count_plugin.get_networks_count.call_count)
+        self.assertFalse(self._usage().dirty)
+
+    def test_make_reservation_without_usage_tracking(self):
+        cfg.CONF.set_override('quota_network', 5, group='QUOTAS')
+        quota.QUOTAS = quota.QuotaEngine('quantum.quota.ConfDriver')
+        quota.register_resources_from_config()
+        self.assertIsNone(self._reserve(3))
+        with testtools.ExpectedException(exceptions.OverQuota):
+            self._reserve(4)
+
+
 class QuotaExtensionCfgTestCase(QuotaExtensionTestCase):
     fmt = 'json'
 
@@ -14,11 +14,16 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
 import os
+import threading
 
+import fixtures
 import mock
 
+from quantum.agent.linux import utils as agent_utils
 from quantum.common import utils
+from quantum.rootwrap import daemon
 from quantum.rootwrap import filters
 from quantum.rootwrap import wrapper
 from quantum.tests import base
@@ -180,3 +185,144 @@ class RootwrapTestCase(base.BaseTestCase):
         usercmd = ["cat", "/"]
         filtermatch = wrapper.match_filter(self.filters, usercmd)
         self.assertTrue(filtermatch is self.filters[-1])
+
+
+    def test_RegExpFilter_bad_pattern(self):
+        f = filters.RegExpFilter("/bin/ls", "root", 'ls', '[a-z')
+        self.assertFalse(f.match(['ls', 'a']))
+
+    def test_match_filter_indexed(self):
+        filter_list = wrapper.FilterList(self.filters)
+        self.assertEqual(filter_list.candidates(['cat', '/']),
+                         [self.filters[2], self.filters[3], self.filters[4]])
+        self.assertEqual(filter_list.candidates(['foo']), [])
+        self.assertTrue(
+            wrapper.match_filter(filter_list, ['cat', '/']) is
+            self.filters[-1])
+
+    def test_match_filter_any_name(self):
+        dnsmasq = filters.DnsmasqFilter("/usr/sbin/dnsmasq", "root")
+        filter_list = wrapper.FilterList([dnsmasq] + self.filters)
+        usercmd = ['QUANTUM_RELAY_SOCKET_PATH=A', 'QUANTUM_NETWORK_ID=foobar',
+                   'dnsmasq', 'foo']
+        self.assertEqual(filter_list.candidates(usercmd), [dnsmasq])
+        self.assertEqual(filter_list.candidates(['ls', '/root'])[0], dnsmasq)
+
+    def _write_filters(self, filters_dir, content):
+        with open(os.path.join(filters_dir, 'test.filters'), 'w') as f:
+            f.write('[Filters]\n' + content)
+
+    def test_load_filters_cache(self):
+        temp_dir = self.useFixture(fixtures.TempDir()).path
+        filters_dir = os.path.join(temp_dir, 'rootwrap.d')
+        os.mkdir(filters_dir)
+        cache_path = os.path.join(temp_dir, 'rootwrap.json')
+        self._write_filters(filters_dir, 'ls: CommandFilter, /bin/ls, root\n')
+
+        filter_list = wrapper.load_filters([filters_dir], cache_path)
+        self.assertEqual([f.exec_path for f in filter_list], ['/bin/ls'])
+        self.assertTrue(os.path.exists(cache_path))
+
+        with mock.patch.object(wrapper, '_parse_filter_files') as parse:
+            filter_list = wrapper.load_filters([filters_dir], cache_path)
+        self.assertFalse(parse.called)
+        self.assertEqual([f.exec_path for f in filter_list], ['/bin/ls'])
+        self.assertEqual(type(filter_list[0].exec_path), str)
+
+        self._write_filters(filters_dir,
+                            'ls: CommandFilter, /bin/ls, root\n'
+                            'cat: CommandFilter, /bin/cat, root\n')
+        filter_list = wrapper.load_filters([filters_dir], cache_path)
+        self.assertEqual([f.exec_path for f in filter_list],
+                         ['/bin/ls', '/bin/cat'])
+
+    def test_load_filters_untrusted_cache(self):
+        temp_dir = self.useFixture(fixtures.TempDir()).path
+        filters_dir = os.path.join(temp_dir, 'rootwrap.d')
+        os.mkdir(filters_dir)
+        cache_path = os.path.join(temp_dir, 'rootwrap.json')
+        self._write_filters(filters_dir, 'ls: CommandFilter, /bin/ls, root\n')
+        wrapper.load_filters([filters_dir], cache_path)
+        os.chmod(cache_path, 0666)
+        with mock.patch.object(wrapper, '_parse_filter_files') as parse:
+            parse.return_value = []
+            wrapper.load_filters([filters_dir], cache_path)
+        self.assertTrue(parse.called)
+
+
+class RootwrapDaemonTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(RootwrapDaemonTestCase, self).setUp()
+        self.filters = [filters.CommandFilter("/bin/cat", "root")]
+        socket_path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                   'rootwrap.sock')
+        self.server = daemon.RootwrapServer(socket_path, self.filters,
+                                            os.getuid(), os.getgid())
+        self.addCleanup(self.server.server_close)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.shutdown)
+        self.socket_path = socket_path
+
+    def test_socket_permissions(self):
+        self.assertEqual(os.stat(self.socket_path).st_mode & 0777, 0600)
+
+    def test_execute(self):
+        self.assertEqual(daemon.execute(self.socket_path, ['cat'], 'foo\xff'),
+                         (0, 'foo\xff', ''))
+
+    def test_execute_unauthorized(self):
+        returncode, stdout, stderr = daemon.execute(self.socket_path,
+                                                    ['ls', '/'])
+        self.assertEqual(returncode, daemon.RC_UNAUTHORIZED)
+        self.assertEqual(stdout, '')
+        self.assertIn('Unauthorized command: ls /', stderr)
+
+    def test_execute_failure(self):
+        returncode, stdout, stderr = daemon.execute(
+            self.socket_path, ['cat', '/nonexistent/file'])
+        self.assertEqual(returncode, 1)
+        self.assertTrue(stderr)
+
+    def test_agent_execute(self):
+        self.config(rootwrap_daemon_socket=self.socket_path, group='AGENT')
+        with mock.patch.object(agent_utils.utils,
+                               'subprocess_popen') as popen:
+            self.assertEqual(agent_utils.execute(['cat'], 'sudo',
+                                                 process_input='foo'),
+                             'foo')
+            self.assertRaises(RuntimeError, agent_utils.execute,
+                              ['ls', '/'], 'sudo')
+        self.assertFalse(popen.called)
+
+    def test_agent_execute_addl_env(self):
+        self.config(rootwrap_daemon_socket=self.socket_path, group='AGENT')
+        with contextlib.nested(
+            mock.patch.object(daemon, 'execute'),
+            mock.patch.object(agent_utils.utils, 'subprocess_popen')
+        ) as (daemon_execute, popen):
+            popen.return_value.communicate.return_value = ('', '')
+            popen.return_value.returncode = 0
+            agent_utils.execute(['cat'], 'sudo', addl_env={'FOO': 'bar'})
+        self.assertFalse(daemon_execute.called)
+        self.assertEqual(popen.call_args[1]['env']['FOO'], 'bar')
+
+    def test_get_allowed_ids_sudo(self):
+        with mock.patch.dict(os.environ, {'SUDO_UID': '1000',
+                                          'SUDO_GID': '1001'}):
+            self.assertEqual(daemon.get_allowed_ids(), (1000, 1001))
+
+    def test_get_allowed_ids_without_sudo(self):
+        with mock.patch.dict(os.environ):
+            os.environ.pop('SUDO_UID', None)
+            self.assertIsNone(daemon.get_allowed_ids())
+
+    def test_get_allowed_ids_user(self):
+        with mock.patch.object(daemon.pwd, 'getpwnam') as getpwnam:
+            getpwnam.return_value = mock.Mock(pw_uid=1000, pw_gid=1001)
+            with mock.patch.dict(os.environ, {'SUDO_UID': '0'}):
+                self.assertEqual(daemon.get_allowed_ids('quantum'),
+                                 (1000, 1001))
+            getpwnam.assert_called_once_with('quantum')
@@ -16,6 +16,7 @@
 #    under the License.
 
 from contextlib import nested
+import copy
 
 import mock
 from mock import call
@@ -29,6 +30,7 @@ from quantum.agent import securitygroups_rpc as sg_rpc
 from quantum import context
 from quantum.db import securitygroups_rpc_base as sg_db_rpc
 from quantum.extensions import securitygroup as ext_sg
+from quantum.openstack.common.rpc import common as rpc_common
 from quantum.openstack.common.rpc import proxy
 from quantum.tests import base
 from quantum.tests.unit import test_extension_security_group as test_sg
@@ -213,6 +215,68 @@ class SGServerRpcCallBackMixinTestCase(test_sg.SecurityGroupDBTestCase):
                 self._delete('ports', port_id1)
                 self._delete('ports', port_id2)
 
+    def test_security_group_info_for_devices_ipv4_source_group(self):
+
+        with self.network() as n:
+            with nested(self.subnet(n),
+                        self.security_group(),
+                        self.security_group()) as (subnet_v4,
+                                                   sg1,
+                                                   sg2):
+                sg1_id = sg1['security_group']['id']
+                sg2_id = sg2['security_group']['id']
+                rule1 = self._build_security_group_rule(
+                    sg1_id,
+                    'ingress', 'tcp', '24',
+                    '25', remote_group_id=sg2['security_group']['id'])
+                rules = {
+                    'security_group_rules': [rule1['security_group_rule']]}
+                res = self._create_security_group_rule(self.fmt, rules)
+                self.deserialize(self.fmt, res)
+                self.assertEqual(res.status_int, 201)
+
+                res1 = self._create_port(
+                    self.fmt, n['network']['id'],
+                    security_groups=[sg1_id])
+                ports_rest1 = self.deserialize(self.fmt, res1)
+                port_id1 = ports_rest1['port']['id']
+                self.rpc.devices = {port_id1: ports_rest1['port']}
+                devices = [port_id1, 'no_exist_device']
+
+                res2 = self._create_port(
+                    self.fmt, n['network']['id'],
+                    security_groups=[sg2_id])
+                ports_rest2 = self.deserialize(self.fmt, res2)
+                port_id2 = ports_rest2['port']['id']
+                port_ip2 = ports_rest2['port']['fixed_ips'][0]['ip_address']
+                ctx = context.get_admin_context()
+                info = self.rpc.security_group_info_for_devices(
+                    ctx, devices=devices)
+                port_rpc = info['devices'][port_id1]
+                expected = [{'direction': 'egress', 'ethertype': 'IPv4',
+                             'security_group_id': sg1_id},
+                            {'direction': 'egress', 'ethertype': 'IPv6',
+                             'security_group_id': sg1_id},
+                            {'direction': u'ingress',
+                             'protocol': u'tcp', 'ethertype': u'IPv4',
+                             'port_range_max': 25, 'port_range_min': 24,
+                             'remote_group_id': sg2_id,
+                             'security_group_id': sg1_id},
+                            ]
+                self.assertEqual(port_rpc['security_group_rules'],
+                                 expected)
+                self.assertEqual(port_rpc['security_group_source_groups'],
+                                 [sg2_id])
+                self.assertEqual(info['sg_member_ips'],
+                                 {sg2_id: {'IPv4': [port_ip2],
+                                           'IPv6': []}})
+                self.assertEqual(
+                    self.rpc.security_group_members(
+                        ctx, security_groups=[sg2_id]),
+                    info['sg_member_ips'])
+                self._delete('ports', port_id1)
+                self._delete('ports', port_id2)
+
     def test_security_group_rules_for_devices_ipv6_ingress(self):
         fake_prefix = test_fw.FAKE_PREFIX['IPv6']
         with self.network() as n:
@@ -394,6 +458,89 @@ class SGServerRpcCallBackMixinTestCase(test_sg.SecurityGroupDBTestCase):
                 self._delete('ports', port_id2)
 
 
+    def test_security_group_rules_for_devices_cached(self):
+        cfg.CONF.set_override('security_group_rpc_cache', True)
+        self.addCleanup(sg_db_rpc.RPC_CACHE.clear)
+        with self.network() as n:
+            with nested(self.subnet(n),
+                        self.security_group()) as (subnet_v4,
+                                                   sg1):
+                sg1_id = sg1['security_group']['id']
+                res1 = self._create_port(
+                    self.fmt, n['network']['id'],
+                    security_groups=[sg1_id])
+                port1 = self.deserialize(self.fmt, res1)['port']
+                ctx = context.get_admin_context()
+
+                def rules_for_device():
+                    self.rpc.devices = {port1['id']: copy.deepcopy(port1)}
+                    ports_rpc = self.rpc.security_group_rules_for_devices(
+                        ctx, devices=[port1['id']])
+                    return sorted(
+                        ports_rpc[port1['id']]['security_group_rules'])
+
+                with mock.patch.object(
+                    self.rpc, '_select_rules_for_groups',
+                    wraps=self.rpc._select_rules_for_groups) as select:
+                    expected = [{'direction': 'egress', 'ethertype': 'IPv4',
+                                 'security_group_id': sg1_id},
+                                {'direction': 'egress', 'ethertype': 'IPv6',
+                                 'security_group_id': sg1_id}]
+                    self.assertEqual(rules_for_device(), sorted(expected))
+                    self.assertEqual(rules_for_device(), sorted(expected))
+                    self.assertEqual(select.call_count, 1)
+
+                    rule = self._build_security_group_rule(
+                        sg1_id, 'ingress', 'tcp', '22', '22')
+                    res = self._create_security_group_rule(
+                        self.fmt, {'security_group_rules':
+                                   [rule['security_group_rule']]})
+                    self.assertEqual(res.status_int, 201)
+                    sg_db_rpc.RPC_CACHE.invalidate_rules([sg1_id])
+                    expected.append({'direction': 'ingress',
+                                     'protocol': 'tcp', 'ethertype': 'IPv4',
+                                     'port_range_max': 22,
+                                     'port_range_min': 22,
+                                     'security_group_id': sg1_id})
+                    self.assertEqual(rules_for_device(), sorted(expected))
+                    self.assertEqual(select.call_count, 2)
+                self._delete('ports', port1['id'])
+
+
+class SecurityGroupRpcCacheTestCase(base.BaseTestCase):
+    def setUp(self):
+        super(SecurityGroupRpcCacheTestCase, self).setUp()
+        self.cache = sg_db_rpc.SecurityGroupRpcCache()
+
+    def test_lookup_queries_missing_keys_once(self):
+        query = mock.Mock(side_effect=lambda keys: dict(
+            (key, [key]) for key in keys))
+        self.assertEqual(self.cache.lookup(self.cache.rules, ['a', 'b'],
+                                           query),
+                         {'a': ['a'], 'b': ['b']})
+        self.assertEqual(self.cache.lookup(self.cache.rules, ['a', 'c'],
+                                           query),
+                         {'a': ['a'], 'c': ['c']})
+        query.assert_has_calls([call(mock.ANY), call(['c'])])
+        self.assertEqual(sorted(query.call_args_list[0][0][0]), ['a', 'b'])
+
+    def test_lookup_racing_invalidation_not_stored(self):
+        def query(keys):
+            self.cache.invalidate_member_ips(keys)
+            return {'a': ['10.0.0.1']}
+        self.assertEqual(self.cache.lookup(self.cache.member_ips, ['a'],
+                                           query),
+                         {'a': ['10.0.0.1']})
+        self.assertEqual(self.cache.member_ips, {})
+
+    def test_forget_security_groups(self):
+        self.cache.rules.update({'a': [], 'b': []})
+        self.cache.member_ips.update({'a': [], 'b': []})
+        self.cache.forget_security_groups(['a'])
+        self.assertEqual(self.cache.rules, {'b': []})
+        self.assertEqual(self.cache.member_ips, {'b': []})
+
+
 class SGServerRpcCallBackMixinTestCaseXML(SGServerRpcCallBackMixinTestCase):
     fmt = 'xml'
 
@@ -501,6 +648,48 @@ class SecurityGroupAgentRpcTestCase(base.BaseTestCase):
                  call.update_port_filter(self.fake_device)]
         self.firewall.assert_has_calls(calls)
 
+    def test_prepare_devices_filter_with_ipset(self):
+        cfg.CONF.set_override('enable_ipset', True, 'SECURITYGROUP')
+        members = {'IPv4': ['10.0.0.2'], 'IPv6': []}
+        self.agent.plugin_rpc.security_group_info_for_devices.return_value = {
+            'devices': self.firewall.ports,
+            'sg_member_ips': {'fake_sgid2': members}}
+        self.agent.prepare_devices_filter(['fake_device'])
+        self.firewall.assert_has_calls(
+            [call.update_security_group_members('fake_sgid2', members),
+             call.defer_apply(),
+             call.prepare_port_filter(self.fake_device)])
+        self.assertFalse(
+            self.agent.plugin_rpc.security_group_rules_for_devices.called)
+
+    def test_prepare_devices_filter_with_ipset_old_server(self):
+        cfg.CONF.set_override('enable_ipset', True, 'SECURITYGROUP')
+        error = rpc_common.RemoteError('UnsupportedRpcVersion')
+        self.agent.plugin_rpc.security_group_info_for_devices.side_effect = (
+            error)
+        self.assertRaises(rpc_common.RemoteError,
+                          self.agent.prepare_devices_filter, ['fake_device'])
+        self.assertFalse(self.firewall.prepare_port_filter.called)
+
+    def test_security_groups_member_updated_with_ipset(self):
+        cfg.CONF.set_override('enable_ipset', True, 'SECURITYGROUP')
+        self.agent.refresh_firewall = mock.Mock()
+        members = {'IPv4': ['10.0.0.2'], 'IPv6': []}
+        self.agent.plugin_rpc.security_group_members.return_value = {
+            'fake_sgid2': members}
+        self.agent.security_groups_member_updated(['fake_sgid2',
+                                                   'fake_sgid3'])
+        self.agent.plugin_rpc.security_group_members.assert_called_once_with(
+            None, ['fake_sgid2'])
+        self.firewall.update_security_group_members.assert_called_once_with(
+            'fake_sgid2', members)
+        self.assertFalse(self.agent.refresh_firewall.called)
+
+    def test_security_groups_member_not_updated_with_ipset(self):
+        cfg.CONF.set_override('enable_ipset', True, 'SECURITYGROUP')
+        self.agent.security_groups_member_updated(['fake_sgid3'])
+        self.assertFalse(self.agent.plugin_rpc.security_group_members.called)
+
 
 class FakeSGRpcApi(agent_rpc.PluginApi,
                    sg_rpc.SecurityGroupServerRpcApiMixin):
@@ -521,6 +710,28 @@ class SecurityGroupServerRpcApiTestCase(base.BaseTestCase):
                  {'devices': ['fake_device']},
              'method': 'security_group_rules_for_devices',
              'namespace': None},
+             version=sg_rpc.SG_RPC_BASE_VERSION,
+             topic='fake_topic')])
+
+    def test_security_group_info_for_devices(self):
+        self.rpc.security_group_info_for_devices(None, ['fake_device'])
+        self.rpc.call.assert_has_calls(
+            [call(None,
+             {'args':
+                 {'devices': ['fake_device']},
+             'method': 'security_group_info_for_devices',
+             'namespace': None},
+             version=sg_rpc.SG_RPC_VERSION,
+             topic='fake_topic')])
+
+    def test_security_group_members(self):
+        self.rpc.security_group_members(None, ['fake_sgid'])
+        self.rpc.call.assert_has_calls(
+            [call(None,
+             {'args':
+                 {'security_groups': ['fake_sgid']},
+             'method': 'security_group_members',
+             'namespace': None},
              version=sg_rpc.SG_RPC_VERSION,
              topic='fake_topic')])
 
@@ -546,7 +757,7 @@ class SecurityGroupAgentRpcApiTestCase(base.BaseTestCase):
                       {'security_groups': ['fake_sgid']},
                       'method': 'security_groups_rule_updated',
                       'namespace': None},
-                  version=sg_rpc.SG_RPC_VERSION,
+                  version=sg_rpc.SG_RPC_BASE_VERSION,
                   topic='fake-security_group-update')])
 
     def test_security_groups_member_updated(self):
@@ -558,7 +769,7 @@ class SecurityGroupAgentRpcApiTestCase(base.BaseTestCase):
                       {'security_groups': ['fake_sgid']},
                       'method': 'security_groups_member_updated',
                       'namespace': None},
-                  version=sg_rpc.SG_RPC_VERSION,
+                  version=sg_rpc.SG_RPC_BASE_VERSION,
                   topic='fake-security_group-update')])
 
     def test_security_groups_rule_not_updated(self):
@@ -1158,6 +1369,20 @@ class TestSecurityGroupAgentWithIptables(base.BaseTestCase):
 
 
 class SGNotificationTestMixin():
+    def test_deleted_resources_evicted_from_rpc_cache(self):
+        cache = sg_db_rpc.RPC_CACHE
+        self.addCleanup(cache.clear)
+        with self.network() as n:
+            with self.security_group() as sg:
+                security_group_id = sg['security_group']['id']
+                cache.rules[security_group_id] = []
+                cache.member_ips[security_group_id] = []
+            network_id = n['network']['id']
+            cache.dhcp_ips[network_id] = []
+        self.assertNotIn(security_group_id, cache.rules)
+        self.assertNotIn(security_group_id, cache.member_ips)
+        self.assertNotIn(network_id, cache.dhcp_ips)
+
     def test_security_group_rule_updated(self):
         name = 'webservers'
         description = 'my webservers'
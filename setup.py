@@ -143,6 +143,7 @@ else:
 
     ProjectScripts = [
         'bin/quantum-rootwrap',
+        'bin/quantum-rootwrap-daemon',
     ]
 
 